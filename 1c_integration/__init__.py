@@ -1,12 +1,24 @@
-from main import sync_1c_products
-from db import get_product_transactions, get_daily_product_summary
-from config import ORGANIZATIONS, OPERATIONS, METHODS
+# Экспорт пакета загружается при первом обращении (PEP 562): импорт пакета
+# не тянет за собой клиент 1С, uvicorn и настройку логирования из main
+_EXPORTS = {
+    'sync_1c_products': 'main',
+    'get_product_transactions': 'db',
+    'get_daily_product_summary': 'db',
+}
 
 __all__ = [
     'sync_1c_products',
     'get_product_transactions',
     'get_daily_product_summary',
-    'ORGANIZATIONS',
     'OPERATIONS',
     'METHODS'
-] 
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    import importlib
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name]), name)
+    if name in ('OPERATIONS', 'METHODS'):
+        return getattr(importlib.import_module('config').settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
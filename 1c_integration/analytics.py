@@ -0,0 +1,340 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from config import settings
+from db import get_connection, get_history_connection, get_data_generation, DIMENSIONS
+from metrics import track_stage
+
+logger = logging.getLogger(__name__)
+
+# Столбцы снимка товарных операций; отсутствующие справочники хранятся как 0.
+# Типы выбраны под np.bincount, чтобы ядра не копировали массивы при каждом
+# вызове: id — intp, суммы в копейках — float64 (целые до 2^53 представимы точно)
+COLUMNS = {
+    "day": np.int32,  # номер дня от 1970-01-01
+    "organization_id": np.intp,
+    "item_id": np.intp,
+    "contractor_id": np.intp,
+    "manager_id": np.intp,
+    "debit": np.float64,
+    "credit": np.float64,
+    "cost": np.float64,
+    "profit": np.float64,
+}
+
+MONEY_COLUMNS = ("debit", "credit", "cost", "profit")
+
+_FETCH_CHUNK = 100_000
+
+
+class Snapshot:
+    """
+    Столбцы product_transactions в массивах NumPy, упорядоченные по дню,
+    и наименования справочников для одного поколения данных
+    """
+
+    def __init__(self, generation: int, columns: Dict[str, np.ndarray], names: Dict[str, Dict[int, str]]):
+        self.generation = generation
+        self.columns = columns
+        self.names = names
+
+    def __len__(self) -> int:
+        return len(self.columns["day"])
+
+    def day_range(self, start_day: int, end_day: int) -> slice:
+        """Срез строк за дни [start_day, end_day] (строки отсортированы по дню)"""
+        days = self.columns["day"]
+        return slice(
+            int(np.searchsorted(days, start_day, side="left")),
+            int(np.searchsorted(days, end_day, side="right"))
+        )
+
+
+_snapshot: Optional[Snapshot] = None
+_lock = threading.Lock()
+
+
+def _day_numbers(day_keys: np.ndarray) -> np.ndarray:
+    """Перевод ключей дня YYYYMMDD в номера дней от 1970-01-01"""
+    months = (day_keys // 10000 - 1970) * 12 + day_keys // 100 % 100 - 1
+    month_starts = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    return (month_starts + day_keys % 100 - 1).astype(np.int32)
+
+
+def _day_number(value: date) -> int:
+    return (value - date(1970, 1, 1)).days
+
+
+def _snapshot_dir(generation: int) -> str:
+    return os.path.join(settings.ANALYTICS_CACHE_DIR, f"gen-{generation}")
+
+
+def _load_from_db(cur) -> Dict[str, np.ndarray]:
+    """Выгрузка столбцов из SQLite порциями"""
+    cur.execute("""
+        SELECT
+            day_key, organization_id, item_id,
+            COALESCE(contractor_id, 0), COALESCE(manager_id, 0),
+            COALESCE(debit, 0), COALESCE(credit, 0), COALESCE(cost, 0), COALESCE(profit, 0)
+        FROM product_transactions
+        ORDER BY day_key
+    """)
+    chunks = []
+    while True:
+        rows = cur.fetchmany(_FETCH_CHUNK)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int64))
+    data = np.concatenate(chunks) if chunks else np.empty((0, len(COLUMNS)), dtype=np.int64)
+
+    columns = {}
+    for index, (name, dtype) in enumerate(COLUMNS.items()):
+        columns[name] = data[:, index].astype(dtype)
+    columns["day"] = _day_numbers(data[:, 0])
+    return columns
+
+
+def _write_snapshot(generation: int, columns: Dict[str, np.ndarray]) -> None:
+    """Запись столбцов в файлы .npy; каталог поколения появляется атомарно"""
+    target = _snapshot_dir(generation)
+    tmp = f"{target}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), values)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Снимок этого поколения уже записал другой процесс
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # Снимки прежних поколений больше не нужны
+    for entry in os.listdir(settings.ANALYTICS_CACHE_DIR):
+        if entry.startswith("gen-") and entry != os.path.basename(target) and ".tmp-" not in entry:
+            shutil.rmtree(os.path.join(settings.ANALYTICS_CACHE_DIR, entry), ignore_errors=True)
+
+
+def _map_snapshot(generation: int) -> Optional[Dict[str, np.ndarray]]:
+    """Отображение в память ранее записанного снимка поколения"""
+    directory = _snapshot_dir(generation)
+    if not os.path.isdir(directory):
+        return None
+    try:
+        return {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in COLUMNS
+        }
+    except (OSError, ValueError) as e:
+        logger.warning("Снимок аналитики %s поврежден: %s", directory, e)
+        return None
+
+
+def _load_names(cur) -> Dict[str, Dict[int, str]]:
+    names = {}
+    for field, table in DIMENSIONS.items():
+        cur.execute(f"SELECT id, name FROM {table}")
+        names[field] = dict(cur.fetchall())
+    return names
+
+
+def get_snapshot() -> Snapshot:
+    """
+    Снимок текущего поколения данных: из памяти процесса, из файлов
+    снимка (отображение в память) или выгрузкой из базы данных
+    """
+    global _snapshot
+    conn = get_connection()
+    try:
+        generation = get_data_generation(conn)
+        if _snapshot is not None and _snapshot.generation == generation:
+            return _snapshot
+
+        with _lock:
+            if _snapshot is not None and _snapshot.generation == generation:
+                return _snapshot
+
+            started = time.perf_counter()
+            cur = conn.cursor()
+            with track_stage("analytics_load"):
+                columns = _map_snapshot(generation)
+                if columns is None:
+                    os.makedirs(settings.ANALYTICS_CACHE_DIR, exist_ok=True)
+                    # Снимок строится по всей истории, включая закрытые годы
+                    history = get_history_connection()
+                    try:
+                        _write_snapshot(generation, _load_from_db(history.cursor()))
+                    finally:
+                        history.close()
+                    columns = _map_snapshot(generation)
+                names = _load_names(cur)
+
+            _snapshot = Snapshot(generation, columns, names)
+            logger.info(
+                "Загружен снимок аналитики: поколение %d, %d строк за %.3f с",
+                generation, len(_snapshot), time.perf_counter() - started
+            )
+            return _snapshot
+    finally:
+        conn.close()
+
+
+def _selection(snapshot: Snapshot, start: date, end: date, organization: Optional[str]):
+    """Срез по периоду и маска по организации (None — все строки среза)"""
+    rows = snapshot.day_range(_day_number(start), _day_number(end))
+    if organization is None:
+        return rows, None
+    organization_ids = [key for key, name in snapshot.names["organization"].items() if name == organization]
+    organization_id = organization_ids[0] if organization_ids else -1
+    return rows, snapshot.columns["organization_id"][rows] == organization_id
+
+
+def _column(snapshot: Snapshot, name: str, rows: slice, mask: Optional[np.ndarray]) -> np.ndarray:
+    values = snapshot.columns[name][rows]
+    return values if mask is None else values[mask]
+
+
+def _group_sums(snapshot: Snapshot, group_by: str, start: date, end: date,
+                organization: Optional[str]) -> Dict[str, np.ndarray]:
+    """Количество операций и денежные суммы (в копейках) по id справочника"""
+    rows, mask = _selection(snapshot, start, end, organization)
+    keys = _column(snapshot, f"{group_by}_id", rows, mask)
+    size = max(snapshot.names[group_by], default=0) + 1
+    sums = {"operations": np.bincount(keys, minlength=size)}
+    for name in MONEY_COLUMNS:
+        weights = _column(snapshot, name, rows, mask)
+        sums[name] = np.rint(np.bincount(keys, weights=weights, minlength=size)).astype(np.int64)
+    return sums
+
+
+def _margin(profit: int, cost: int) -> Optional[float]:
+    # Доля валовой прибыли в выручке (себестоимость + прибыль)
+    revenue = cost + profit
+    return round(profit / revenue, 4) if revenue > 0 else None
+
+
+def _top(values: np.ndarray, candidates: np.ndarray, limit: int) -> np.ndarray:
+    """Индексы limit наибольших значений среди кандидатов, по убыванию"""
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-values[candidates], limit - 1)[:limit]]
+    return candidates[np.argsort(-values[candidates], kind="stable")]
+
+
+def group_totals(
+    group_by: str,
+    start: date,
+    end: date,
+    organization: Optional[str] = None,
+    sort_by: str = "profit",
+    limit: int = 20
+) -> List[Dict]:
+    """
+    Итоги и маржинальность по организации, номенклатуре, контрагенту или менеджеру
+    
+    Args:
+        group_by: Поле группировки (organization, item, contractor, manager)
+        start: Начало периода (включительно)
+        end: Конец периода (включительно)
+        organization: Организация для фильтрации
+        sort_by: Показатель для отбора лидеров (operations, debit, credit, cost, profit)
+        limit: Количество групп в ответе
+    """
+    snapshot = get_snapshot()
+    sums = _group_sums(snapshot, group_by, start, end, organization)
+    present = np.flatnonzero(sums["operations"])
+    names = snapshot.names[group_by]
+    return [
+        {
+            "id": int(key) if key else None,
+            "name": names.get(int(key)),
+            "operations": int(sums["operations"][key]),
+            "debit": int(sums["debit"][key]) / 100,
+            "credit": int(sums["credit"][key]) / 100,
+            "cost": int(sums["cost"][key]) / 100,
+            "profit": int(sums["profit"][key]) / 100,
+            "margin": _margin(int(sums["profit"][key]), int(sums["cost"][key])),
+        }
+        for key in _top(sums[sort_by], present, limit)
+    ]
+
+
+def rolling_profit(window: int, start: date, end: date, organization: Optional[str] = None) -> List[Dict]:
+    """
+    Валовая прибыль по дням и скользящая сумма за window календарных дней
+    
+    Args:
+        window: Размер окна в днях (например, 7 или 30)
+        start: Начало периода (включительно)
+        end: Конец периода (включительно)
+        organization: Организация для фильтрации
+    """
+    snapshot = get_snapshot()
+    # Окно первого дня периода захватывает дни до его начала
+    first = start - timedelta(days=window - 1)
+    rows, mask = _selection(snapshot, first, end, organization)
+    offsets = _column(snapshot, "day", rows, mask) - _day_number(first)
+    size = (end - first).days + 1
+    daily = np.rint(
+        np.bincount(offsets, weights=_column(snapshot, "profit", rows, mask), minlength=size)
+    ).astype(np.int64)
+    cumulative = np.concatenate(([0], np.cumsum(daily)))
+    rolling = cumulative[window:] - cumulative[:-window]
+    return [
+        {
+            "date": (start + timedelta(days=index)).isoformat(),
+            "profit": int(daily[index + window - 1]) / 100,
+            "rolling_profit": int(rolling[index]) / 100,
+        }
+        for index in range(len(rolling))
+    ]
+
+
+def compare_periods(
+    group_by: str,
+    start: date,
+    end: date,
+    organization: Optional[str] = None,
+    limit: int = 20
+) -> Dict:
+    """
+    Сравнение периода с предыдущим периодом той же длины по группам
+    
+    Args:
+        group_by: Поле группировки (organization, item, contractor, manager)
+        start: Начало периода (включительно)
+        end: Конец периода (включительно)
+        organization: Организация для фильтрации
+        limit: Количество групп с наибольшим изменением прибыли
+    """
+    snapshot = get_snapshot()
+    length = (end - start).days + 1
+    previous_start = start - timedelta(days=length)
+    previous_end = start - timedelta(days=1)
+
+    current = _group_sums(snapshot, group_by, start, end, organization)
+    previous = _group_sums(snapshot, group_by, previous_start, previous_end, organization)
+    change = current["profit"] - previous["profit"]
+    present = np.flatnonzero(current["operations"] + previous["operations"])
+    names = snapshot.names[group_by]
+
+    groups = []
+    for key in _top(np.abs(change), present, limit):
+        before = int(previous["profit"][key])
+        groups.append({
+            "id": int(key) if key else None,
+            "name": names.get(int(key)),
+            "profit": int(current["profit"][key]) / 100,
+            "previous_profit": before / 100,
+            "change": int(change[key]) / 100,
+            "change_pct": round(int(change[key]) / abs(before) * 100, 2) if before else None,
+        })
+    return {
+        "previous_start": previous_start.isoformat(),
+        "previous_end": previous_end.isoformat(),
+        "profit": int(current["profit"].sum()) / 100,
+        "previous_profit": int(previous["profit"].sum()) / 100,
+        "data": groups,
+    }
@@ -1,10 +1,16 @@
+import asyncio
 import logging
+import time
 from datetime import datetime
-from typing import List, Dict, Optional, TypedDict
+from typing import List, Dict, Optional, Tuple, TypedDict
 from odata_client import ODataClient
-from db import save_product_transaction
+from common.http_policy import CircuitOpenError, is_retryable
+from db import get_document_fingerprints
+from common.write_queue import writer
 from config import settings
 from schemas import SyncResponse
+from metrics import track_stage, record_sync_result, SYNC_DOCUMENTS
+from utils import document_fingerprint
 
 logger = logging.getLogger(__name__)
 
@@ -12,33 +18,40 @@ class OneCAPI:
     def __init__(self):
         self.client = ODataClient()
 
-    async def _process_document_items(self, doc: Dict, operation_type: str) -> List[Dict]:
+    async def _process_document_items(self, doc: Dict, operation_type: str) -> Tuple[List[Dict], bool]:
         """
         Обработка товаров из документа
         
         Args:
             doc: Документ из 1С
             operation_type: Тип операции (Поступление/Расход)
+
+        Returns:
+            Строки документа и признак того, что обработаны все строки
         """
         operations = []
+        complete = True
         try:
-            # Получаем организацию
-            org = await self.client.get_catalog_item("Организации", doc["Организация_Key"])
+            # Получаем организацию, контрагента и менеджера параллельно
+            org, contractor, manager = await asyncio.gather(
+                self.client.get_catalog_item("Организации", doc["Организация_Key"]),
+                self.client.get_catalog_item("Контрагенты", doc["Контрагент_Key"]),
+                self.client.get_catalog_item("Сотрудники", doc["Менеджер_Key"])
+            )
 
-            # Получаем контрагента
-            contractor = await self.client.get_catalog_item("Контрагенты", doc["Контрагент_Key"])
-            
-                    # Получаем менеджера
-            manager = await self.client.get_catalog_item("Сотрудники", doc["Менеджер_Key"])
+            # Заранее загружаем номенклатуру всех строк документа параллельно
+            product_keys = list({
+                item["Номенклатура_Key"] for item in doc.get("Товары", []) if "Номенклатура_Key" in item
+            })
+            products = dict(zip(product_keys, await asyncio.gather(*(
+                self.client.get_catalog_item("Номенклатура", key) for key in product_keys
+            ))))
 
             # Обрабатываем каждый товар
-            for item in doc.get("Товары", []):
+            for index, item in enumerate(doc.get("Товары", []), start=1):
                 try:
                     # Получаем информацию о номенклатуре
-                    product = await self.client.get_catalog_item(
-                        "Номенклатура", 
-                        item["Номенклатура_Key"]
-                    )
+                    product = products[item["Номенклатура_Key"]]
                     
                     operation = {
                         # Старые поля
@@ -47,7 +60,8 @@ class OneCAPI:
                         "method": "Закупка" if operation_type == "Поступление" else "Реализация",
                         "item": product["Description"],
                         "date": doc["Date"],
-                        "external_id": int(f"{doc['Ref_Key']}{item.get('LineNumber', 0)}"),
+                        # external_id строится из ID документа и номера строки при сохранении
+                        "line_number": int(item.get("LineNumber") or index),
 
                         # Новые поля
                         "contractor": contractor["Description"],
@@ -59,86 +73,144 @@ class OneCAPI:
                     }
                     operations.append(operation)
                 except Exception as e:
-                    logger.error(f"Error processing item in document {doc['Ref_Key']}: {str(e)}")
+                    logger.error("Error processing item in document %s: %s", doc['Ref_Key'], e)
+                    complete = False
                     continue
                     
         except Exception as e:
-            logger.error(f"Error processing document {doc['Ref_Key']}: {str(e)}")
+            if isinstance(e, CircuitOpenError) or is_retryable(e):
+                # Сбой связи с 1С прерывает синхронизацию, а не теряет документ молча
+                raise
+            # Отказ 1С по одному элементу (например, удаленная номенклатура — 404)
+            # не повторяется: документ пропускается, окно остается незавершенным
+            logger.error("Error processing document %s: %s", doc['Ref_Key'], e)
+            complete = False
             
-        return operations
+        return operations, complete
 
-    async def fetch_product_operations(self, date_from: Optional[datetime] = None) -> List[Dict]:
-        """Получение товарных операций"""
-        all_operations = []
+    async def fetch_changed_documents(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Tuple[List[Dict], int]:
+        """
+        Получение документов за полуинтервал [date_from, date_to), изменившихся
+        с прошлой синхронизации. Неизмененные документы отбрасываются по отпечатку
+        до обращения к справочникам и базе данных.
+        
+        Returns:
+            Список документов с их строками и количество неизмененных документов
+        """
+        documents = []
+        unchanged = 0
         
         try:
-            # Получаем приходные накладные
-            income_docs = await self.client.get_documents(
-                settings.DOCUMENT_TYPES["income"], 
-                date_from
-            )
-            
-            for doc in income_docs:
-                if not doc.get("Posted", False):
-                    logger.debug(f"Skipping unposted document {doc.get('Ref_Key')}")
-                    continue
-                    
-                operations = await self._process_document_items(doc, "Поступление")
-                all_operations.extend(operations)
-            
-            # Получаем расходные накладные
-            expense_docs = await self.client.get_documents(
-                settings.DOCUMENT_TYPES["expense"], 
-                date_from
-            )
-            
-            for doc in expense_docs:
-                if not doc.get("Posted", False):
-                    continue
-                    
-                operations = await self._process_document_items(doc, "Расход")
-                all_operations.extend(operations)
+            for doc_kind, operation_type in (("income", "Поступление"), ("expense", "Расход")):
+                doc_type = settings.DOCUMENT_TYPES[doc_kind]
+                with track_stage("fetch_documents"):
+                    # Непроведенные документы 1С не отдает вместе со строками: нужны только
+                    # ключи и версии, чтобы снять строки документов, проведение которых отменено
+                    docs, unposted = await asyncio.gather(
+                        self.client.get_documents(doc_type, date_from, date_to),
+                        self.client.get_documents(doc_type, date_from, date_to, posted=False)
+                    )
+                    known = await get_document_fingerprints(
+                        [doc["Ref_Key"] for doc in docs] + [doc["Ref_Key"] for doc in unposted]
+                    )
+                
+                for doc in unposted:
+                    ref_key = doc["Ref_Key"]
+                    if ref_key not in known:
+                        continue
+                    fingerprint = document_fingerprint(doc)
+                    if known[ref_key] == fingerprint:
+                        unchanged += 1
+                        SYNC_DOCUMENTS.labels(result="unchanged").inc()
+                        continue
+                    # Проведение отменено — строки документа удаляются
+                    SYNC_DOCUMENTS.labels(result="unposted").inc()
+                    documents.append({
+                        "ref_key": ref_key,
+                        "doc_type": doc_type,
+                        "fingerprint": fingerprint,
+                        "operations": []
+                    })
+                
+                with track_stage("catalog_lookup"):
+                    for doc in docs:
+                        ref_key = doc["Ref_Key"]
+                        fingerprint = document_fingerprint(doc)
+                        if known.get(ref_key) == fingerprint:
+                            unchanged += 1
+                            SYNC_DOCUMENTS.labels(result="unchanged").inc()
+                            continue
+                        
+                        SYNC_DOCUMENTS.labels(result="changed" if ref_key in known else "new").inc()
+                        operations, complete = await self._process_document_items(doc, operation_type)
+                        documents.append({
+                            "ref_key": ref_key,
+                            "doc_type": doc_type,
+                            # Документ с необработанными строками будет загружен повторно
+                            "fingerprint": fingerprint if complete else "",
+                            "operations": operations
+                        })
                 
         except Exception as e:
-            logger.error(f"Error fetching product operations: {str(e)}")
+            logger.error("Error fetching product operations: %s", e)
             raise
             
-        return all_operations
+        return documents, unchanged
 
-    async def sync_data(self, date_from: Optional[datetime] = None) -> Dict:
+    async def sync_data(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Dict:
         """
         Синхронизация данных с 1С
         
         Args:
             date_from: Дата, с которой начинать синхронизацию
+            date_to: Дата, до которой (не включая) выполняется синхронизация
         """
         logger.info("Starting 1C data synchronization")
+        started = time.perf_counter()
         try:
-            operations = await self.fetch_product_operations(date_from)
+            documents, unchanged_count = await self.fetch_changed_documents(date_from, date_to)
             
-            success_count = 0
-            error_count = 0
+            total_count = sum(len(document["operations"]) for document in documents)
             
-            for operation in operations:
-                try:
-                    await save_product_transaction(operation)
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"Error saving operation: {str(e)}")
-                    error_count += 1
+            # Запись выполняет писатель очереди (возможно, в другом процессе)
+            # одной транзакцией вместе с документами других синхронизаций
+            with track_stage("db_write"):
+                result = {"success": 0, "duplicates": 0, "errors": 0}
+                if documents:
+                    result = await asyncio.to_thread(writer.call, "documents", documents, total_count)
+            success_count = result["success"]
+            duplicate_count = result["duplicates"]
+            error_count = result["errors"]
             
-            logger.info(f"Synchronization completed. Success: {success_count}, Errors: {error_count}")
+            elapsed = time.perf_counter() - started
+            record_sync_result(success_count, duplicate_count, error_count, elapsed)
+            logger.info(
+                "Synchronization completed in %.1fs. Documents: %d changed, %d unchanged. "
+                "Lines: %d, Success: %d, Duplicates: %d, Errors: %d",
+                elapsed, len(documents), unchanged_count,
+                total_count, success_count, duplicate_count, error_count
+            )
             
             return SyncResponse(
                 status="success",
-                total=len(operations),
+                total=total_count,
                 success=success_count,
-                errors=error_count
+                duplicates=duplicate_count,
+                errors=error_count,
+                unchanged_documents=unchanged_count
             ).dict()
             
         except Exception as e:
-            logger.error(f"Synchronization failed: {str(e)}")
+            logger.error("Synchronization failed: %s", e)
             return SyncResponse(
                 status="error",
                 message=str(e)
-            ).dict() 
\ No newline at end of file
+            ).dict()
\ No newline at end of file
@@ -1,24 +1,98 @@
-from fastapi import FastAPI, Query, HTTPException
-from datetime import datetime, timedelta
-from typing import Optional
-from db import init_products_db, get_product_transactions, get_daily_product_summary, get_monthly_product_summary
-from api import OneCAPI
+import asyncio
+from fastapi import FastAPI, Query, HTTPException, Request
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, List, Literal, Optional, Tuple
+from db import (
+    init_products_db,
+    get_product_transactions,
+    get_daily_product_summary,
+    get_monthly_product_summary,
+    create_backfill_job,
+    get_backfill_job,
+    get_partitions,
+    get_data_version,
+    EXPORT_TABLES
+)
+import reconciliation
+from dashboard import get_daily_dashboard
+from common.columnar_export import load_arrow, export_snapshots, list_partitions, partition_file, PARQUET_MEDIA_TYPE
+from common.change_feed import changes_response
+from common.compression import CachedPayload, CompressionMiddleware, response_cache
+from common.write_queue import writer, WriteJobError
+from common.maintenance import size_report
+from backfill import run_backfill, resume_unfinished_backfills, start_in_background, is_running
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response
+from metrics import metrics_middleware, metrics_response
+from common.query_profiler import get_query_stats, reset_query_stats
+from config import settings
+from common.logging_config import setup_logging
+from common.warmup import warmup
 from schemas import (
     ProductsResponse,
     DailySummaryResponse,
     SyncResponse,
     HealthCheckResponse,
+    ReadinessResponse,
     ProductOperation,
-    MonthlySummaryResponse
+    MonthlySummaryResponse,
+    QueryStatsResponse,
+    BackfillJobResponse,
+    AnalyticsGroupsResponse,
+    RollingProfitResponse,
+    PeriodComparisonResponse,
+    ExportResponse,
+    ExportManifestResponse,
+    ReconciliationRunResponse,
+    ReconciliationDiscrepanciesResponse,
+    DailyDashboardResponse,
+    WriteQueueStatusResponse,
+    YearPartitionsResponse,
+    PartitionsChangeResponse,
+    MaintenanceResponse,
+    DatabaseSizeResponse
 )
 
+# Разрезы аналитики
+AnalyticsGroupBy = Literal["organization", "item", "contractor", "manager"]
+
+def _warm_modules() -> None:
+    """Импорт модулей, отложенных при старте: numpy, pyarrow, клиент 1С"""
+    import analytics  # noqa: F401
+    import api  # noqa: F401
+    load_arrow()
+
+def _warm_analytics() -> None:
+    """Снимок столбцов аналитики текущего поколения данных"""
+    import analytics
+    analytics.get_snapshot()
+
+def _warmup_steps() -> List[Tuple[str, Callable[[], Any]]]:
+    """Шаги прогрева: модули, снимок аналитики, сводка текущего месяца, сводный отчет за 30 дней"""
+    steps = [
+        ("modules", _warm_modules),
+        ("analytics", _warm_analytics),
+        ("monthly_summary", lambda: asyncio.run(_monthly_summary_payload(datetime.now().strftime("%Y-%m")))),
+    ]
+    if settings.BANK_DATABASE_PATH:
+        today = date.today()
+        steps.append(("dashboard", lambda: asyncio.run(get_daily_dashboard(today - timedelta(days=29), today))))
+    return steps
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Инициализация при старте
+    setup_logging(settings.LOG_FILE)
     init_products_db()
+    # Писателем становится один процесс из нескольких; остальные только ставят задания
+    writer.start()
+    if settings.BACKFILL_RESUME_ON_STARTUP:
+        start_in_background(resume_unfinished_backfills())
+    # Тяжелые модули и кэши загружаются в фоне; /ready ответит 200 после прогрева
+    warmup.start(_warmup_steps(), settings.WARMUP_ENABLED)
     yield
+    writer.stop()
 
 app = FastAPI(
     title="1C Integration API",
@@ -36,6 +110,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие ответов br / gzip по Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Замер латентности запросов по маршрутам
+app.middleware("http")(metrics_middleware)
+
 @app.get("/products", response_model=ProductsResponse)
 async def get_products(
     organization: Optional[str] = Query(None, min_length=1, max_length=100, description="Название организации"),
@@ -65,8 +145,9 @@ async def get_products(
             organization = organization.strip()
             
         transactions = await get_product_transactions(
-            date=end_date,
-            organization=organization
+            organization=organization,
+            start_date=start_date,
+            end_date=end_date
         )
         
         return ProductsResponse(
@@ -106,12 +187,32 @@ async def get_summary(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _monthly_summary_payload(month: str) -> CachedPayload:
+    """
+    Готовый ответ сводки за месяц для текущей версии данных
+    
+    Args:
+        month: Месяц в формате YYYY-MM
+    """
+    version = await asyncio.to_thread(get_data_version)
+    cached = response_cache.lookup("monthly_summary", month, version)
+    if cached is None:
+        summary = await get_monthly_product_summary(month)
+        cached = response_cache.store("monthly_summary", month, version, MonthlySummaryResponse(
+            status="success",
+            month=month,
+            data=summary
+        ))
+    return cached
+
 @app.get("/products/monthly-summary", response_model=MonthlySummaryResponse)
 async def get_monthly_summary(
+    request: Request,
     month: Optional[str] = Query(None, description="Месяц в формате YYYY-MM")
-) -> MonthlySummaryResponse:
+) -> Response:
     """
-    Получение сводки по товарным операциям за месяц
+    Получение сводки по товарным операциям за месяц. Готовый ответ
+    и его сжатые варианты используются до следующего изменения данных.
     """
     try:
         if not month:
@@ -125,18 +226,95 @@ async def get_monthly_summary(
             except ValueError:
                 raise HTTPException(status_code=400, detail="month должен быть в формате YYYY-MM")
             
-        summary = await get_monthly_product_summary(month)
-        
-        return MonthlySummaryResponse(
-            status="success",
-            month=month,
-            data=summary
-        )
+        cached = await _monthly_summary_payload(month)
+        # Сжатие нового ответа — в потоке пула, повторные ответы уже сжаты
+        return await asyncio.to_thread(cached.response, request)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _analytics_period(start_date: Optional[str], end_date: Optional[str]) -> Tuple[date, date]:
+    """Период отчета аналитики; по умолчанию последние 30 дней"""
+    try:
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date.today()
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date не может быть позже end_date")
+    return start, end
+
+@app.get("/products/analytics/groups", response_model=AnalyticsGroupsResponse)
+async def get_analytics_groups(
+    group_by: AnalyticsGroupBy = Query("item", description="Разрез: организация, номенклатура, контрагент, менеджер"),
+    start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Конечная дата в формате YYYY-MM-DD"),
+    organization: Optional[str] = Query(None, min_length=1, max_length=100, description="Название организации"),
+    sort_by: Literal["operations", "debit", "credit", "cost", "profit"] = Query("profit", description="Показатель для отбора"),
+    limit: int = Query(default=20, gt=0, le=1000, description="Количество групп")
+) -> AnalyticsGroupsResponse:
+    """
+    Итоги и маржинальность по разрезу: группы с наибольшим значением показателя
+    """
+    start, end = _analytics_period(start_date, end_date)
+    # numpy загружается с модулем аналитики при первом запросе или прогревом
+    import analytics
+    data = await asyncio.to_thread(
+        analytics.group_totals, group_by, start, end,
+        organization.strip() if organization else None, sort_by, limit
+    )
+    return AnalyticsGroupsResponse(
+        status="success",
+        group_by=group_by,
+        start_date=start.isoformat(),
+        end_date=end.isoformat(),
+        data=data
+    )
+
+@app.get("/products/analytics/rolling", response_model=RollingProfitResponse)
+async def get_analytics_rolling(
+    window: int = Query(7, gt=0, le=366, description="Окно в днях (например, 7 или 30)"),
+    start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Конечная дата в формате YYYY-MM-DD"),
+    organization: Optional[str] = Query(None, min_length=1, max_length=100, description="Название организации")
+) -> RollingProfitResponse:
+    """
+    Валовая прибыль по дням со скользящей суммой за окно
+    """
+    start, end = _analytics_period(start_date, end_date)
+    import analytics
+    data = await asyncio.to_thread(
+        analytics.rolling_profit, window, start, end,
+        organization.strip() if organization else None
+    )
+    return RollingProfitResponse(status="success", window=window, data=data)
+
+@app.get("/products/analytics/compare", response_model=PeriodComparisonResponse)
+async def get_analytics_compare(
+    group_by: AnalyticsGroupBy = Query("item", description="Разрез: организация, номенклатура, контрагент, менеджер"),
+    start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Конечная дата в формате YYYY-MM-DD"),
+    organization: Optional[str] = Query(None, min_length=1, max_length=100, description="Название организации"),
+    limit: int = Query(default=20, gt=0, le=1000, description="Количество групп")
+) -> PeriodComparisonResponse:
+    """
+    Сравнение прибыли с предыдущим периодом той же длины: группы с наибольшим изменением
+    """
+    start, end = _analytics_period(start_date, end_date)
+    import analytics
+    result = await asyncio.to_thread(
+        analytics.compare_periods, group_by, start, end,
+        organization.strip() if organization else None, limit
+    )
+    return PeriodComparisonResponse(
+        status="success",
+        group_by=group_by,
+        start_date=start.isoformat(),
+        end_date=end.isoformat(),
+        **result
+    )
+
 @app.post("/sync", response_model=SyncResponse)
 async def sync_data(
     start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
@@ -146,6 +324,8 @@ async def sync_data(
     Запуск синхронизации данных с 1C
     """
     try:
+        # Клиент 1С (requests) загружается при первой синхронизации или прогревом
+        from api import OneCAPI
         api = OneCAPI()
         
         if not end_date:
@@ -161,8 +341,10 @@ async def sync_data(
         except ValueError:
             raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
         
+        # Конечная дата включается в выборку, фильтр 1С строится по полуинтервалу
         result = await api.sync_data(
-            date_from=datetime.strptime(start_date, "%Y-%m-%d")
+            date_from=datetime.strptime(start_date, "%Y-%m-%d"),
+            date_to=datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
         )
         
         return SyncResponse(**result)
@@ -171,6 +353,215 @@ async def sync_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/backfill", response_model=BackfillJobResponse, status_code=202)
+async def start_backfill(
+    start_date: str = Query(..., description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: str = Query(..., description="Конечная дата в формате YYYY-MM-DD"),
+    window_days: int = Query(default=None, gt=0, le=366, description="Размер окна в днях")
+) -> BackfillJobResponse:
+    """
+    Запуск загрузки истории из 1C: период делится на окна, которые
+    загружаются параллельно с сохранением контрольной точки по каждому окну.
+    Повторный запуск на тот же период продолжает незавершенное задание.
+    """
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date не может быть позже end_date")
+
+    job_id = await create_backfill_job(start_date, end_date, window_days or settings.BACKFILL_WINDOW_DAYS)
+    start_in_background(run_backfill(job_id))
+    return BackfillJobResponse(**await get_backfill_job(job_id))
+
+@app.get("/backfill/{job_id}", response_model=BackfillJobResponse)
+async def get_backfill(job_id: int) -> BackfillJobResponse:
+    """
+    Состояние задания загрузки истории по окнам
+    """
+    job = await get_backfill_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    return BackfillJobResponse(**job)
+
+@app.post("/backfill/{job_id}/resume", response_model=BackfillJobResponse, status_code=202)
+async def resume_backfill(job_id: int) -> BackfillJobResponse:
+    """
+    Продолжение задания загрузки истории: загружаются только окна,
+    которые еще не завершены
+    """
+    job = await get_backfill_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    if not is_running(job_id):
+        start_in_background(run_backfill(job_id))
+    return BackfillJobResponse(**job)
+
+@app.post("/export", response_model=ExportResponse)
+async def export_data() -> ExportResponse:
+    """
+    Выгрузка товарных операций в Parquet по месяцам: перезаписываются
+    только разделы, изменившиеся с прошлой выгрузки
+    """
+    try:
+        tables = await asyncio.to_thread(export_snapshots)
+        return ExportResponse(status="success", tables=tables)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/partitions", response_model=YearPartitionsResponse)
+async def list_year_partitions() -> YearPartitionsResponse:
+    """
+    Закрытые годы товарных операций, вынесенные в отдельные файлы
+    """
+    return YearPartitionsResponse(status="success", partitions=get_partitions())
+
+@app.post("/partitions/close", response_model=PartitionsChangeResponse)
+async def close_year_partitions() -> PartitionsChangeResponse:
+    """
+    Закрытие лет, закончившихся больше PARTITION_CLOSE_AFTER_DAYS дней назад:
+    строки переносятся в файл года, который оптимизируется и становится
+    доступен только для чтения. Выполняется писателем очереди записи.
+    """
+    try:
+        years = await asyncio.to_thread(writer.call, "close_partitions", None)
+    except WriteJobError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return PartitionsChangeResponse(status="success", years=years)
+
+@app.post("/partitions/{year}/reopen", response_model=PartitionsChangeResponse)
+async def reopen_year_partition(year: int) -> PartitionsChangeResponse:
+    """
+    Возврат закрытого года в основную базу для исправлений задним числом;
+    документы закрытого года при синхронизации не сохраняются
+    """
+    try:
+        result = await asyncio.to_thread(writer.call, "reopen_partition", year)
+    except WriteJobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PartitionsChangeResponse(status="success", years=[result])
+
+@app.get("/maintenance/size", response_model=DatabaseSizeResponse)
+async def get_database_size() -> DatabaseSizeResponse:
+    """
+    Размер файлов базы, свободное место внутри файла, размер таблиц
+    и индексов, сроки хранения и время последнего обслуживания
+    """
+    report = await asyncio.to_thread(size_report)
+    return DatabaseSizeResponse(status="success", **report)
+
+@app.post("/maintenance/run", response_model=MaintenanceResponse)
+async def run_database_maintenance() -> MaintenanceResponse:
+    """
+    Внеочередное обслуживание базы: удаление строк по сроку хранения
+    со сверткой в итоги по дням, incremental_vacuum и обновление статистики.
+    Выполняется писателем очереди записи; по расписанию — раз в
+    MAINTENANCE_INTERVAL_HOURS часов.
+    """
+    try:
+        report = await asyncio.to_thread(writer.call, "maintenance", None)
+    except WriteJobError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return MaintenanceResponse(status="success", **report)
+
+@app.get("/export/{table}", response_model=ExportManifestResponse)
+async def get_export_manifest(table: str) -> ExportManifestResponse:
+    """
+    Список выгруженных разделов таблицы
+    """
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Таблица не выгружается")
+    return ExportManifestResponse(**list_partitions(table))
+
+@app.get("/export/{table}/{partition}")
+async def download_export_partition(table: str, partition: str) -> FileResponse:
+    """
+    Файл раздела (месяц YYYY-MM) в формате Parquet, отдается как есть
+    """
+    path = partition_file(table, partition)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Раздел не найден")
+    return FileResponse(path, media_type=PARQUET_MEDIA_TYPE, filename=f"{table}-{partition}.parquet")
+
+@app.get(
+    "/dashboard/daily",
+    response_model=DailyDashboardResponse,
+    response_model_exclude_none=True
+)
+async def get_dashboard_daily(
+    start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Конечная дата в формате YYYY-MM-DD")
+) -> DailyDashboardResponse:
+    """
+    Сводный отчет по дням для ежедневной страницы: деньги по банку и товары по 1С
+    по организациям (по умолчанию с начала текущего месяца)
+    """
+    if not settings.BANK_DATABASE_PATH:
+        raise HTTPException(status_code=503, detail="Не задан BANK_DATABASE_PATH")
+    try:
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date.today()
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else end.replace(day=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date не может быть позже end_date")
+    if (end - start).days >= 366:
+        raise HTTPException(status_code=400, detail="Период отчета не может превышать год")
+    try:
+        return await get_daily_dashboard(start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/reconciliation", response_model=ReconciliationRunResponse)
+async def run_reconciliation(
+    start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Конечная дата в формате YYYY-MM-DD")
+) -> ReconciliationRunResponse:
+    """
+    Сверка платежей банка с документами 1С за период (по умолчанию последние 30 дней):
+    пары ищутся по организации, контрагенту, сумме и дате с допуском
+    """
+    if not settings.BANK_DATABASE_PATH:
+        raise HTTPException(status_code=503, detail="Сверка не настроена: не задан BANK_DATABASE_PATH")
+    start, end = _analytics_period(start_date, end_date)
+    try:
+        result = await asyncio.to_thread(reconciliation.run_reconciliation, start, end)
+        return ReconciliationRunResponse(status="success", **result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/reconciliation/discrepancies", response_model=ReconciliationDiscrepanciesResponse)
+async def get_reconciliation_discrepancies(
+    start_date: Optional[str] = Query(None, description="Начальная дата в формате YYYY-MM-DD"),
+    end_date: Optional[str] = Query(None, description="Конечная дата в формате YYYY-MM-DD"),
+    source: Optional[Literal["bank", "1c"]] = Query(None, description="Сторона сверки"),
+    organization: Optional[str] = Query(None, min_length=1, max_length=100, description="Название организации"),
+    limit: int = Query(default=100, gt=0, le=10000, description="Количество записей")
+) -> ReconciliationDiscrepanciesResponse:
+    """
+    Платежи банка и документы 1С, для которых при последней сверке не нашлось пары
+    """
+    start, end = _analytics_period(start_date, end_date)
+    data = await asyncio.to_thread(
+        reconciliation.get_discrepancies, start, end, source,
+        organization.strip() if organization else None, limit
+    )
+    return ReconciliationDiscrepanciesResponse(status="success", count=len(data), data=data)
+
+@app.get("/changes")
+async def get_changes(
+    request: Request,
+    last_event_id: Optional[int] = Query(None, description="Номер последнего полученного события (вместо заголовка Last-Event-ID)")
+):
+    """
+    Лента изменений (Server-Sent Events): после каждой записи документа —
+    новые id операций, затронутые даты и организации и номер поколения данных.
+    При отставании подписчика приходит событие reset: данные нужно перечитать целиком.
+    """
+    return changes_response(request, last_event_id)
+
 @app.get("/health", response_model=HealthCheckResponse)
 async def health_check() -> HealthCheckResponse:
     """
@@ -179,4 +570,50 @@ async def health_check() -> HealthCheckResponse:
     return HealthCheckResponse(
         status="healthy",
         timestamp=datetime.now()
-    )
\ No newline at end of file
+    )
+
+@app.get("/ready", response_model=ReadinessResponse)
+async def readiness_check(response: Response) -> ReadinessResponse:
+    """
+    Готовность к приему трафика: 503, пока идет прогрев после старта.
+    /health отвечает сразу после запуска и говорит только, что процесс жив.
+    """
+    if not warmup.ready:
+        response.status_code = 503
+    return ReadinessResponse(**warmup.status())
+
+@app.get("/ingest/status", response_model=WriteQueueStatusResponse)
+async def get_ingest_status() -> WriteQueueStatusResponse:
+    """
+    Состояние очереди записи: сколько строк ждет писателя
+    и с какой задержкой они записываются
+    """
+    return WriteQueueStatusResponse(**writer.status())
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Метрики сервиса в формате Prometheus
+    """
+    return metrics_response()
+
+
+@app.get("/debug/queries", response_model=QueryStatsResponse)
+async def query_stats(
+    limit: int = Query(default=50, gt=0, le=1000, description="Максимальное количество запросов")
+) -> QueryStatsResponse:
+    """
+    Статистика выполнения запросов SQLite, отсортированная по суммарному времени
+    """
+    return QueryStatsResponse(
+        slow_query_ms=settings.SLOW_QUERY_MS,
+        data=get_query_stats(limit)
+    )
+
+@app.delete("/debug/queries")
+async def clear_query_stats():
+    """
+    Сброс статистики выполнения запросов
+    """
+    reset_query_stats()
+    return {"status": "success"}
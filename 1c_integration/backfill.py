@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Set
+from config import settings
+from db import (
+    claim_backfill_windows,
+    update_backfill_window,
+    finish_backfill_job,
+    get_unfinished_backfill_jobs
+)
+
+if TYPE_CHECKING:
+    from api import OneCAPI
+
+logger = logging.getLogger(__name__)
+
+# Задания, которые уже выполняются в этом процессе
+_running_jobs: Set[int] = set()
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def _sync_window(api: "OneCAPI", window: Dict, semaphore: asyncio.Semaphore) -> bool:
+    """
+    Загрузка одного окна с сохранением контрольной точки
+
+    Args:
+        api: Клиент 1С, общий для окон задания (с общим кэшем справочников)
+        window: Окно загрузки
+        semaphore: Ограничение количества одновременно загружаемых окон
+    """
+    async with semaphore:
+        await update_backfill_window(window["id"], "running")
+        try:
+            result = await api.sync_data(
+                date_from=datetime.strptime(window["window_start"], "%Y-%m-%d"),
+                date_to=datetime.strptime(window["window_end"], "%Y-%m-%d")
+            )
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+
+        status = "done" if result.get("status") == "success" else "failed"
+        await update_backfill_window(window["id"], status, result)
+        logger.info(
+            "Backfill window %s..%s: %s",
+            window["window_start"], window["window_end"], status
+        )
+        return status == "done"
+
+
+async def run_backfill(job_id: int) -> None:
+    """
+    Выполнение задания загрузки истории: незагруженные окна обрабатываются
+    параллельно, общий лимит запросов к 1С соблюдается клиентом OData
+
+    Args:
+        job_id: ID задания
+    """
+    if job_id in _running_jobs:
+        logger.info("Backfill job %d is already running", job_id)
+        return
+    _running_jobs.add(job_id)
+
+    try:
+        windows = await claim_backfill_windows(job_id)
+        logger.info("Backfill job %d started, %d windows pending", job_id, len(windows))
+
+        # Клиент 1С (requests) загружается при первой загрузке, а не при старте сервиса
+        from api import OneCAPI
+        api = OneCAPI()
+        semaphore = asyncio.Semaphore(settings.BACKFILL_CONCURRENCY)
+        await asyncio.gather(*(_sync_window(api, window, semaphore) for window in windows))
+
+        status = await finish_backfill_job(job_id)
+        logger.info("Backfill job %d finished: %s", job_id, status)
+    except Exception as e:
+        logger.error("Backfill job %d failed: %s", job_id, e)
+    finally:
+        _running_jobs.discard(job_id)
+
+
+def is_running(job_id: int) -> bool:
+    return job_id in _running_jobs
+
+
+def start_in_background(coro) -> asyncio.Task:
+    """Запуск корутины загрузки в фоне текущего цикла событий"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def resume_unfinished_backfills() -> None:
+    """
+    Продолжение заданий, прерванных остановкой сервиса
+    """
+    for job_id in await get_unfinished_backfill_jobs():
+        await run_backfill(job_id)
@@ -9,6 +9,83 @@ class Settings(BaseSettings):
     ODATA_BASE_URL: str | None = None
     ODATA_VERSION: str = "4.0"
     ODATA_PASSWORD: str | None = None  # Basic auth key
+    ODATA_RATE_LIMIT: float = 10.0  # Максимум запросов к 1С в секунду на процесс (0 — без ограничения)
+    ODATA_ORGANIZATIONS: List[str] = []  # Ref_Key организаций для загрузки; пусто — все. Уже загруженные документы других организаций не удаляются
+
+    # Политика запросов к 1С
+    ODATA_CONNECT_TIMEOUT: float = 5.0  # Таймаут соединения, с
+    ODATA_READ_TIMEOUT: float = 60.0  # Таймаут чтения ответа, с
+    ODATA_MAX_RETRIES: int = 4  # Повторов при временных ошибках
+    ODATA_BACKOFF_BASE: float = 0.5  # Базовая задержка перед повтором, с
+    ODATA_BACKOFF_MAX: float = 30.0  # Максимальная задержка перед повтором, с
+    ODATA_CIRCUIT_FAILURES: int = 5  # Ошибок подряд до размыкания выключателя
+    ODATA_CIRCUIT_RESET: float = 30.0  # Время до пробного запроса после размыкания, с
+    ODATA_MAX_CONCURRENCY: int = 8  # Верхняя граница адаптивного лимита параллельных запросов
+    ODATA_LATENCY_TARGET: float = 2.0  # Латентность, выше которой лимит снижается, с
+
+    # Загрузка истории (backfill)
+    BACKFILL_WINDOW_DAYS: int = 7  # Размер окна, на которые делится период
+    BACKFILL_CONCURRENCY: int = 4  # Количество окон, загружаемых одновременно
+    BACKFILL_RESUME_ON_STARTUP: bool = True  # Продолжать прерванные загрузки при старте
+
+    # Прогрев после старта: модули, снимок аналитики и кэши; до его окончания /ready отвечает 503
+    WARMUP_ENABLED: bool = True
+
+    # Логирование
+    LOG_FILE: str = "1c_products.log"
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000  # Размер очереди записей для фонового потока
+    LOG_DEBUG_SAMPLE_EVERY: int = 100  # В лог попадает каждая N-я DEBUG-запись одного шаблона
+
+    # Профилирование запросов SQLite
+    QUERY_PROFILING: bool = True
+    SLOW_QUERY_MS: float = 100.0  # Порог медленного запроса, мс
+    
+    # Аналитика: каталог снимков столбцов для отображения в память
+    ANALYTICS_CACHE_DIR: str = "analytics_cache"
+    
+    # Выгрузка снимков в Parquet
+    EXPORT_DIR: str = "exports"
+    EXPORT_COMPRESSION: str = "zstd"
+    
+    # Сверка с банком: база сервиса банка открывается только на чтение
+    BANK_DATABASE_PATH: str | None = None
+    RECONCILIATION_DATE_TOLERANCE_DAYS: int = 3  # Допустимое расхождение дат документа и платежа, дни
+    
+    # Сводный отчет по дням: сколько дней хранить в кэше
+    DASHBOARD_CACHE_DAYS: int = 1000
+    
+    # Лента изменений (Server-Sent Events)
+    CHANGE_FEED_HISTORY: int = 1000  # Событий в истории для продолжения подписки
+    CHANGE_FEED_BUFFER: int = 256  # Очередь одного подписчика; при переполнении — reset
+    CHANGE_FEED_HEARTBEAT: float = 15.0  # Интервал пустых сообщений, с
+    CHANGE_FEED_RETRY_MS: int = 5000  # Пауза переподключения клиента, мс
+    
+    # Очередь записи: в несколько процессов пишет только один (блокировка файла очереди)
+    WRITE_QUEUE_PATH: str | None = None  # База-очередь; по умолчанию <DATABASE_PATH>.queue
+    WRITER_ENABLED: bool = True  # Процесс может стать писателем; false — только чтение и постановка заданий
+    WRITE_BATCH_ROWS: int = 500  # Строк в одной групповой записи
+    WRITE_FLUSH_MS: int = 200  # Ожидание накопления неполной пачки, мс
+    WRITE_WAIT_TIMEOUT: float = 300.0  # Ожидание результата задания запросом API, с
+    WRITE_RESULT_TTL: float = 3600.0  # Хранение выполненных заданий, с
+    WRITE_MAX_ATTEMPTS: int = 5  # Попыток записи задания, которое база не принимает, до отметки об ошибке
+    WRITE_RETRY_MAX_SECONDS: float = 30.0  # Наибольшая задержка между попытками, с
+    
+    # Закрытые годы хранятся в отдельных файлах <база>.<год> только для чтения
+    PARTITION_CLOSE_AFTER_DAYS: int = 90  # Год закрывается через столько дней после окончания
+    
+    # Обслуживание базы: сроки хранения, освобождение места, статистика планировщика
+    RETENTION_DAYS: Dict[str, int] = {}  # Таблица (RETENTION_TABLES в db.py) -> дней хранения строк; пусто — все
+    RETENTION_ARCHIVE: bool = True  # Перед удалением строки выгружаются в Parquet (EXPORT_DIR)
+    MAINTENANCE_INTERVAL_HOURS: float = 24.0  # Период обслуживания писателем очереди; 0 — только по запросу
+    MAINTENANCE_VACUUM_PAGES: int = 0  # Страниц, освобождаемых за одно обслуживание; 0 — все свободные
+    
+    # Сжатие ответов: br (при установленном brotli) или gzip по Accept-Encoding
+    COMPRESSION_MIN_SIZE: int = 1024  # Ответы меньше этого размера не сжимаются, байт
+    COMPRESSION_STREAM_SIZE: int = 262144  # Ответ больше этого размера сжимается и отдается частями, байт
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    RESPONSE_CACHE_MAX_BYTES: int = 67108864  # Кэш готовых ответов со сжатыми вариантами на процесс, байт
     
     # Справочники 1С
     DOCUMENT_TYPES: Dict[str, str] = {
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from db import get_connection, get_history_connection, get_bank_connection, get_data_generation
+from utils import from_kopecks
+
+logger = logging.getLogger(__name__)
+
+# Столбцы отчета: (источник, операция) -> столбец
+COLUMNS = {
+    ("bank", "Поступление"): "money_in",
+    ("bank", "Списание"): "money_out",
+    ("1c", "Поступление"): "goods_in",
+    ("1c", "Расход"): "goods_out",
+}
+
+# Отчет за день по версии данных обеих баз; при изменении версии кэш сбрасывается
+_cache: "OrderedDict[int, Dict]" = OrderedDict()
+_cache_version: Optional[Tuple[int, int]] = None
+_lock = threading.Lock()
+
+
+def _day_key(value: date) -> int:
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def _bank_figures(first_key: int, last_key: int, with_rows: bool) -> Dict:
+    """
+    Версия данных банка, остатки на начало и конец периода и, при необходимости,
+    суммы платежей по дням, организациям, операциям и способам оплаты
+    """
+    conn = get_bank_connection(first_key, last_key) if with_rows else get_bank_connection()
+    try:
+        cur = conn.cursor()
+        # Платежи только добавляются, поэтому последний id — версия данных
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM finance_transactions")
+        version = cur.fetchone()[0]
+
+        # Остаток организации — на последний день с движением до границы периода
+        balances = []
+        for condition, day_key in (("<", first_key), ("<=", last_key)):
+            cur.execute(f"""
+                SELECT TOTAL(b.balance)
+                FROM monthly_balance b
+                WHERE b.day_key = (
+                    SELECT MAX(day_key) FROM monthly_balance
+                    WHERE organization_id = b.organization_id AND day_key {condition} ?
+                )
+            """, (day_key,))
+            balances.append(int(cur.fetchone()[0]))
+
+        rows = []
+        if with_rows:
+            # Дни старше срока хранения банка есть только в итогах по дням
+            cur.execute("""
+                SELECT t.day_key, o.name, t.operation, t.method, SUM(t.amount)
+                FROM (
+                    SELECT day_key, organization_id, operation, method, ABS(amount) AS amount
+                    FROM finance_transactions
+                    WHERE day_key BETWEEN ? AND ?
+                    UNION ALL
+                    SELECT day_key, organization_id, operation, method, amount
+                    FROM finance_daily_totals
+                    WHERE day_key BETWEEN ? AND ?
+                ) t
+                LEFT JOIN organizations o ON o.id = t.organization_id
+                GROUP BY t.day_key, t.organization_id, t.operation, t.method
+            """, (first_key, last_key, first_key, last_key))
+            rows = cur.fetchall()
+        return {"version": version, "start_balance": balances[0], "end_balance": balances[1], "rows": rows}
+    finally:
+        conn.close()
+
+
+def _goods_figures(first_key: int, last_key: int, with_rows: bool) -> Dict:
+    """
+    Поколение данных 1С и, при необходимости, суммы документов по дням,
+    организациям, операциям и способам; сумма документа берется из шапки один раз
+    """
+    conn = get_history_connection(first_key, last_key) if with_rows else get_connection()
+    try:
+        version = get_data_generation(conn)
+        rows = []
+        if with_rows:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT d.day_key, o.name, d.operation, d.method, SUM(d.amount)
+                FROM (
+                    SELECT
+                        MIN(day_key) AS day_key, organization_id, operation, method,
+                        MAX(CASE WHEN operation = 'Расход' THEN debit ELSE credit END) AS amount
+                    FROM product_transactions
+                    WHERE day_key BETWEEN ? AND ?
+                    GROUP BY COALESCE(document_id, -id)
+                    UNION ALL
+                    -- Дни старше срока хранения есть только в итогах по дням
+                    SELECT day_key, organization_id, operation, method, document_amount
+                    FROM product_daily_totals
+                    WHERE day_key BETWEEN ? AND ?
+                ) d
+                JOIN organizations o ON o.id = d.organization_id
+                GROUP BY d.day_key, d.organization_id, d.operation, d.method
+            """, (first_key, last_key, first_key, last_key))
+            rows = cur.fetchall()
+        return {"version": version, "rows": rows}
+    finally:
+        conn.close()
+
+
+def _merge_days(bank_rows: List, goods_rows: List) -> Dict[int, Dict]:
+    """Суммы в копейках по дням и организациям в разрезе столбцов отчета"""
+    days: Dict[int, Dict] = {}
+    for source, rows in (("bank", bank_rows), ("1c", goods_rows)):
+        for day_key, organization, operation, method, amount in rows:
+            column = COLUMNS.get((source, operation))
+            if column is None or not amount:
+                continue
+            organizations = days.setdefault(day_key, {})
+            cell = organizations.setdefault(organization, {}).setdefault(column, {"total": 0, "details": {}})
+            cell["total"] += amount
+            details = cell["details"]
+            method = method or "Прочее"
+            details[method] = details.get(method, 0) + amount
+    return days
+
+
+def _day_payload(day_key: int, organizations: Dict) -> Dict:
+    """Отчет за день: только ненулевые столбцы, суммы в рублях"""
+    return {
+        "date": f"{day_key // 10000:04d}-{day_key // 100 % 100:02d}-{day_key % 100:02d}",
+        "organizations": [
+            {
+                "name": name,
+                **{
+                    column: {
+                        "total": from_kopecks(cell["total"]),
+                        "details": {method: from_kopecks(value) for method, value in cell["details"].items()},
+                    }
+                    for column, cell in columns.items()
+                },
+            }
+            for name, columns in sorted(organizations.items(), key=lambda item: item[0] or "")
+        ],
+    }
+
+
+def _cached_days(day_keys: List[int], version: Tuple[int, int]) -> Optional[List[Dict]]:
+    global _cache_version
+    with _lock:
+        if _cache_version != version:
+            _cache.clear()
+            _cache_version = version
+            return None
+        if not all(key in _cache for key in day_keys):
+            return None
+        for key in day_keys:
+            _cache.move_to_end(key)
+        return [_cache[key] for key in day_keys]
+
+
+def _store_days(days: Dict[int, Dict], version: Tuple[int, int]) -> None:
+    with _lock:
+        if _cache_version != version:
+            return
+        _cache.update(days)
+        while len(_cache) > settings.DASHBOARD_CACHE_DAYS:
+            _cache.popitem(last=False)
+
+
+async def get_daily_dashboard(start: date, end: date) -> Dict:
+    """
+    Сводный отчет по дням: движение денег по банку и товаров по 1С
+    по организациям, остатки на начало и конец периода.
+    Обе базы читаются параллельно; отчет за день кэшируется,
+    пока не изменились данные ни в одной из баз.
+
+    Args:
+        start: Начальная дата
+        end: Конечная дата
+    """
+    first_key, last_key = _day_key(start), _day_key(end)
+    day_keys = [_day_key(start + timedelta(days=offset)) for offset in range((end - start).days + 1)]
+
+    bank, goods = await asyncio.gather(
+        asyncio.to_thread(_bank_figures, first_key, last_key, False),
+        asyncio.to_thread(_goods_figures, first_key, last_key, False),
+    )
+    version = (bank["version"], goods["version"])
+    days = _cached_days(day_keys, version)
+
+    if days is None:
+        bank, goods = await asyncio.gather(
+            asyncio.to_thread(_bank_figures, first_key, last_key, True),
+            asyncio.to_thread(_goods_figures, first_key, last_key, True),
+        )
+        version = (bank["version"], goods["version"])
+        merged = _merge_days(bank["rows"], goods["rows"])
+        computed = {key: _day_payload(key, merged[key]) if key in merged else None for key in day_keys}
+        _store_days(computed, version)
+        days = [computed[key] for key in day_keys]
+        logger.debug("Сводный отчет %s..%s рассчитан заново", start, end)
+
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "start_balance": from_kopecks(bank["start_balance"]),
+        "end_balance": from_kopecks(bank["end_balance"]),
+        "days": [day for day in days if day is not None],
+    }
@@ -1,55 +1,612 @@
 import sqlite3
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from config import settings
+from common.change_feed import feed
+from metrics import DB_COMMIT_LATENCY, SYNC_ROW_ERRORS, track_stage
+from common.query_profiler import connect
+from common.write_queue import writer
+from common.partitions import (
+    REGISTRY_SQL, attach_partitions, closed_years, closable_years, close_year, reopen_year, describe_partitions
+)
+from utils import make_line_key, date_keys, to_kopecks, from_kopecks, MAX_LINE_NUMBER
+
+# Денежные поля товарных операций, хранятся в копейках
+MONEY_FIELDS = ('debit', 'credit', 'cost', 'profit')
+
+# Справочники (измерения): поле операции -> таблица с наименованиями
+DIMENSIONS = {
+    'organization': 'organizations',
+    'contractor': 'contractors',
+    'manager': 'managers',
+    'item': 'items',
+}
+
+# Таблицы для выгрузки в Parquet по месяцам (columnar_export.py):
+# сигнатура раздела считается по индексу по месяцу, строки выгружаются с наименованиями
+EXPORT_TABLES = {
+    'product_transactions': {
+        'partitions': """
+            SELECT month_key, COUNT(*), MAX(id), TOTAL(id)
+            FROM product_transactions
+            GROUP BY month_key
+        """,
+        'rows': """
+            SELECT
+                t.id, t.date, t.created_at, t.operation, t.method,
+                o.name, i.name, c.name, m.name,
+                t.debit, t.credit, t.cost, t.profit,
+                d.ref_key, t.line_number, t.external_id
+            FROM product_transactions t
+            JOIN organizations o ON o.id = t.organization_id
+            JOIN items i ON i.id = t.item_id
+            LEFT JOIN contractors c ON c.id = t.contractor_id
+            LEFT JOIN managers m ON m.id = t.manager_id
+            LEFT JOIN product_documents d ON d.id = t.document_id
+            WHERE t.month_key = ?
+            ORDER BY t.day_key, t.id
+        """,
+        'columns': [
+            ('id', 'int64'), ('date', 'date'), ('created_at', 'timestamp'),
+            ('operation', 'string'), ('method', 'string'),
+            ('organization', 'string'), ('item', 'string'), ('contractor', 'string'), ('manager', 'string'),
+            ('debit_kopecks', 'int64'), ('credit_kopecks', 'int64'),
+            ('cost_kopecks', 'int64'), ('profit_kopecks', 'int64'),
+            ('document_ref_key', 'string'), ('line_number', 'int64'), ('external_id', 'int64'),
+        ],
+    },
+}
+
+# Сроки хранения строк (maintenance.py, RETENTION_DAYS): строки старше срока
+# сворачиваются в итоги по дням запросом rollup (параметр — первый хранимый день,
+# {source} — схема основной базы или файла закрытого года) и удаляются запросами delete.
+# Для таблиц с закрытыми годами (partitioned) файлы истекших лет удаляются целиком.
+RETENTION_TABLES = {
+    'product_transactions': {
+        'partitioned': True,
+        # Сумма документа берется из шапки один раз, как в сводном отчете
+        'rollup': """
+            INSERT INTO main.product_daily_totals (
+                day_key, month_key, date, organization_id, operation, method,
+                operations, debit, credit, cost, profit, document_amount
+            )
+            SELECT
+                day_key, day_key / 100, MIN(date), organization_id, operation, method,
+                SUM(lines), SUM(debit), SUM(credit), SUM(cost), SUM(profit), SUM(amount)
+            FROM (
+                SELECT
+                    MIN(day_key) AS day_key, MIN(date) AS date, organization_id, operation, method,
+                    COUNT(*) AS lines,
+                    SUM(COALESCE(debit, 0)) AS debit, SUM(COALESCE(credit, 0)) AS credit,
+                    SUM(COALESCE(cost, 0)) AS cost, SUM(COALESCE(profit, 0)) AS profit,
+                    MAX(CASE WHEN operation = 'Расход' THEN debit ELSE credit END) AS amount
+                FROM {source}.product_transactions
+                WHERE day_key < ?
+                GROUP BY COALESCE(document_id, -id)
+            )
+            GROUP BY day_key, organization_id, operation, method
+        """,
+        'delete': ["DELETE FROM main.product_transactions WHERE day_key < ?"],
+    },
+    'backfill_jobs': {
+        # Завершенные задания загрузки истории вместе с их окнами
+        'delete': [
+            """
+                DELETE FROM backfill_windows WHERE job_id IN (
+                    SELECT id FROM backfill_jobs
+                    WHERE status IN ('done', 'failed') AND CAST(strftime('%Y%m%d', created_at) AS INTEGER) < ?
+                )
+            """,
+            """
+                DELETE FROM backfill_jobs
+                WHERE status IN ('done', 'failed') AND CAST(strftime('%Y%m%d', created_at) AS INTEGER) < ?
+            """,
+        ],
+    },
+}
+
+# Ключ meta с первым хранимым днем таблицы: более ранние строки свернуты в итоги
+RETAINED_FROM_KEY = "retained_from:{}"
+
+# Кэш наименование -> id по таблицам справочников, заполняется при загрузке
+_dimension_cache: Dict[str, Dict[str, int]] = {table: {} for table in DIMENSIONS.values()}
 
 logger = logging.getLogger(__name__)
 
-def init_products_db():
+def get_connection() -> sqlite3.Connection:
     """
-    Инициализация базы данных для товарных операций
+    Открытие соединения с базой данных товарных операций: открытые годы,
+    в нее же идет вся запись
     """
-    conn = sqlite3.connect(settings.DATABASE_PATH)
-    cur = conn.cursor()
+    return connect(settings.DATABASE_PATH)
+
+def get_history_connection(first_day_key: Optional[int] = None, last_day_key: Optional[int] = None) -> sqlite3.Connection:
+    """
+    Соединение для чтения операций, которые могут относиться к закрытым годам:
+    подключаются только годы, пересекающиеся с периодом, поэтому запросы
+    за последние месяцы идут только в основную базу
     
+    Args:
+        first_day_key: Первый день периода (YYYYMMDD), None — без ограничения
+        last_day_key: Последний день периода (YYYYMMDD), None — без ограничения
+    """
+    conn = connect(settings.DATABASE_PATH, uri=True)
+    attach_partitions(conn, settings.DATABASE_PATH, "product_transactions", first_day_key, last_day_key)
+    return conn
+
+def get_bank_connection(first_day_key: Optional[int] = None, last_day_key: Optional[int] = None) -> sqlite3.Connection:
+    """
+    Открытие базы сервиса банка только на чтение (сверка, сводный отчет)
+    вместе с закрытыми годами банка, пересекающимися с периодом
+    """
+    if not settings.BANK_DATABASE_PATH:
+        raise RuntimeError("Не задан BANK_DATABASE_PATH")
+    conn = connect(f"file:{settings.BANK_DATABASE_PATH}?mode=ro", uri=True)
+    attach_partitions(conn, settings.BANK_DATABASE_PATH, "finance_transactions", first_day_key, last_day_key)
+    return conn
+
+def _migrate_base_schema(cur: sqlite3.Cursor) -> None:
+    """Исходная схема: товарные операции и задания загрузки истории"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization TEXT NOT NULL,
+            operation TEXT CHECK(operation IN ('Поступление', 'Расход')) NOT NULL,
+            method TEXT CHECK(method IN ('Закупка', 'Перемещение', 'Реализация', 'Списание')) NOT NULL,
+            item TEXT NOT NULL,
+            date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            external_id INTEGER UNIQUE,
+                
+            -- Новые поля
+            contractor TEXT,
+            manager TEXT,
+            debit REAL,
+            credit REAL,
+            cost REAL,
+            profit REAL
+        )
+    """)
+    
+    # Создаем индексы для оптимизации запросов
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_transactions_date 
+        ON product_transactions(date)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_product_transactions_organization 
+        ON product_transactions(organization)
+    """)
+
+    # Задания загрузки истории и их окна (контрольные точки)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            window_days INTEGER NOT NULL,
+            status TEXT CHECK(status IN ('pending', 'running', 'done', 'failed')) NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_windows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL REFERENCES backfill_jobs(id),
+            window_start DATE NOT NULL,
+            window_end DATE NOT NULL,
+            status TEXT CHECK(status IN ('pending', 'running', 'done', 'failed')) NOT NULL DEFAULT 'pending',
+            total INTEGER,
+            success INTEGER,
+            duplicates INTEGER,
+            errors INTEGER,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(job_id, window_start)
+        )
+    """)
+
+def _migrate_document_fingerprints(cur: sqlite3.Cursor) -> None:
+    """Документы 1С с отпечатками содержимого и привязка строк к документу"""
+    cur.execute("""
+        CREATE TABLE product_documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ref_key TEXT NOT NULL UNIQUE,
+            doc_type TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        ALTER TABLE product_transactions
+        ADD COLUMN document_id INTEGER REFERENCES product_documents(id)
+    """)
+    cur.execute("""
+        CREATE INDEX idx_product_transactions_document
+        ON product_transactions(document_id)
+    """)
+
+def _legacy_external_id(ref_key: str, line_number: int) -> Optional[int]:
+    """Прежний ключ строки int(Ref_Key + LineNumber), если он представим в SQLite"""
     try:
-        # Создаем таблицу, если она не существует
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS product_transactions (
+        key = int(f"{ref_key}{line_number}")
+    except ValueError:
+        return None
+    return key if key < 2 ** 63 else None
+
+def _legacy_line_number(ref_key: str, external_id: int) -> Optional[int]:
+    """Номер строки из прежнего ключа int(Ref_Key + LineNumber)"""
+    digits = str(external_id)
+    if len(digits) <= len(ref_key) or not digits.startswith(ref_key):
+        return None
+    line_number = int(digits[len(ref_key):])
+    return line_number if line_number <= MAX_LINE_NUMBER else None
+
+def _migrate_line_keys(cur: sqlite3.Cursor) -> None:
+    """Компактные ключи строк external_id = (document_id << 20) | LineNumber"""
+    cur.execute("ALTER TABLE product_transactions ADD COLUMN line_number INTEGER")
+    cur.execute("""
+        SELECT t.id, t.external_id, d.id, d.ref_key
+        FROM product_transactions t
+        JOIN product_documents d ON d.id = t.document_id
+    """)
+    updates = []
+    stale_documents = set()
+    for row_id, external_id, document_id, ref_key in cur.fetchall():
+        line_number = _legacy_line_number(ref_key, external_id) if external_id is not None else None
+        if line_number is None:
+            stale_documents.add(document_id)
+            continue
+        updates.append((make_line_key(document_id, line_number), line_number, row_id))
+    
+    # Сначала временные отрицательные ключи, чтобы новые значения
+    # не столкнулись в UNIQUE-индексе со старыми значениями других строк
+    cur.executemany(
+        "UPDATE product_transactions SET external_id = -id WHERE id = ?",
+        [(row_id,) for _, _, row_id in updates]
+    )
+    cur.executemany(
+        "UPDATE product_transactions SET external_id = ?, line_number = ? WHERE id = ?",
+        updates
+    )
+    # Строки, номер которых восстановить нельзя, будут перезаписаны при следующей синхронизации
+    cur.executemany(
+        "UPDATE product_documents SET fingerprint = '' WHERE id = ?",
+        [(document_id,) for document_id in stale_documents]
+    )
+    logger.info(
+        "Ключи строк пересчитаны: %d строк, документов к повторной загрузке: %d",
+        len(updates), len(stale_documents)
+    )
+
+def _migrate_date_keys(cur: sqlite3.Cursor) -> None:
+    """Нормализованная дата и целочисленные ключи дня (YYYYMMDD) и месяца (YYYYMM)"""
+    cur.execute("ALTER TABLE product_transactions ADD COLUMN day_key INTEGER")
+    cur.execute("ALTER TABLE product_transactions ADD COLUMN month_key INTEGER")
+    # Дата приходила из 1С как дата-время ISO, оставляем только дату
+    cur.execute("""
+        UPDATE product_transactions
+        SET date = substr(date, 1, 10),
+            day_key = CAST(replace(substr(date, 1, 10), '-', '') AS INTEGER),
+            month_key = CAST(replace(substr(date, 1, 7), '-', '') AS INTEGER)
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_product_transactions_date")
+    cur.execute("CREATE INDEX idx_product_transactions_day ON product_transactions(day_key)")
+    cur.execute("CREATE INDEX idx_product_transactions_month ON product_transactions(month_key)")
+
+def _migrate_money_to_kopecks(cur: sqlite3.Cursor) -> None:
+    """Денежные поля в целых копейках вместо REAL"""
+    # Тип столбца в SQLite изменить нельзя, поэтому таблица пересоздается
+    cur.execute("""
+        CREATE TABLE product_transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization TEXT NOT NULL,
+            operation TEXT CHECK(operation IN ('Поступление', 'Расход')) NOT NULL,
+            method TEXT CHECK(method IN ('Закупка', 'Перемещение', 'Реализация', 'Списание')) NOT NULL,
+            item TEXT NOT NULL,
+            date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            external_id INTEGER UNIQUE,
+            contractor TEXT,
+            manager TEXT,
+            -- Суммы в копейках
+            debit INTEGER,
+            credit INTEGER,
+            cost INTEGER,
+            profit INTEGER,
+            document_id INTEGER REFERENCES product_documents(id),
+            line_number INTEGER,
+            day_key INTEGER,
+            month_key INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO product_transactions_new (
+            id, organization, operation, method, item, date, created_at, external_id,
+            contractor, manager, debit, credit, cost, profit,
+            document_id, line_number, day_key, month_key
+        )
+        SELECT
+            id, organization, operation, method, item, date, created_at, external_id,
+            contractor, manager,
+            CAST(ROUND(debit * 100) AS INTEGER),
+            CAST(ROUND(credit * 100) AS INTEGER),
+            CAST(ROUND(cost * 100) AS INTEGER),
+            CAST(ROUND(profit * 100) AS INTEGER),
+            document_id, line_number, day_key, month_key
+        FROM product_transactions
+    """)
+    cur.execute("DROP TABLE product_transactions")
+    cur.execute("ALTER TABLE product_transactions_new RENAME TO product_transactions")
+    cur.execute("CREATE INDEX idx_product_transactions_organization ON product_transactions(organization)")
+    cur.execute("CREATE INDEX idx_product_transactions_document ON product_transactions(document_id)")
+    cur.execute("CREATE INDEX idx_product_transactions_day ON product_transactions(day_key)")
+    cur.execute("CREATE INDEX idx_product_transactions_month ON product_transactions(month_key)")
+
+def _migrate_dimensions(cur: sqlite3.Cursor) -> None:
+    """Справочники организаций, контрагентов, менеджеров и номенклатуры; в операциях только id"""
+    for field, table in DIMENSIONS.items():
+        cur.execute(f"""
+            CREATE TABLE {table} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                organization TEXT NOT NULL,
-                operation TEXT CHECK(operation IN ('Поступление', 'Расход')) NOT NULL,
-                method TEXT CHECK(method IN ('Закупка', 'Перемещение', 'Реализация', 'Списание')) NOT NULL,
-                item TEXT NOT NULL,
-                date DATE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                external_id INTEGER UNIQUE,
-                    
-                -- Новые поля
-                contractor TEXT,
-                manager TEXT,
-                debit REAL,
-                credit REAL,
-                cost REAL,
-                profit REAL
+                name TEXT NOT NULL UNIQUE
             )
         """)
-        
-        # Создаем индексы для оптимизации запросов
-        cur.execute("""
-            CREATE INDEX IF NOT EXISTS idx_product_transactions_date 
-            ON product_transactions(date)
-        """)
-        cur.execute("""
-            CREATE INDEX IF NOT EXISTS idx_product_transactions_organization 
-            ON product_transactions(organization)
+        cur.execute(f"""
+            INSERT INTO {table} (name)
+            SELECT DISTINCT {field} FROM product_transactions WHERE {field} IS NOT NULL
         """)
+    
+    cur.execute("""
+        CREATE TABLE product_transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization_id INTEGER NOT NULL REFERENCES organizations(id),
+            operation TEXT CHECK(operation IN ('Поступление', 'Расход')) NOT NULL,
+            method TEXT CHECK(method IN ('Закупка', 'Перемещение', 'Реализация', 'Списание')) NOT NULL,
+            item_id INTEGER NOT NULL REFERENCES items(id),
+            date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            external_id INTEGER UNIQUE,
+            contractor_id INTEGER REFERENCES contractors(id),
+            manager_id INTEGER REFERENCES managers(id),
+            -- Суммы в копейках
+            debit INTEGER,
+            credit INTEGER,
+            cost INTEGER,
+            profit INTEGER,
+            document_id INTEGER REFERENCES product_documents(id),
+            line_number INTEGER,
+            day_key INTEGER,
+            month_key INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO product_transactions_new (
+            id, organization_id, operation, method, item_id, date, created_at, external_id,
+            contractor_id, manager_id, debit, credit, cost, profit,
+            document_id, line_number, day_key, month_key
+        )
+        SELECT
+            t.id, o.id, t.operation, t.method, i.id, t.date, t.created_at, t.external_id,
+            c.id, m.id, t.debit, t.credit, t.cost, t.profit,
+            t.document_id, t.line_number, t.day_key, t.month_key
+        FROM product_transactions t
+        JOIN organizations o ON o.name = t.organization
+        JOIN items i ON i.name = t.item
+        LEFT JOIN contractors c ON c.name = t.contractor
+        LEFT JOIN managers m ON m.name = t.manager
+    """)
+    cur.execute("DROP TABLE product_transactions")
+    cur.execute("ALTER TABLE product_transactions_new RENAME TO product_transactions")
+    cur.execute("CREATE INDEX idx_product_transactions_organization ON product_transactions(organization_id)")
+    cur.execute("CREATE INDEX idx_product_transactions_document ON product_transactions(document_id)")
+    cur.execute("CREATE INDEX idx_product_transactions_day ON product_transactions(day_key)")
+    cur.execute("CREATE INDEX idx_product_transactions_month ON product_transactions(month_key)")
+
+def _migrate_data_generation(cur: sqlite3.Cursor) -> None:
+    """Счетчик поколения данных: увеличивается при каждом изменении операций"""
+    cur.execute("""
+        CREATE TABLE meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    cur.execute("INSERT INTO meta (key, value) VALUES ('data_generation', 1)")
+
+def _migrate_reconciliation(cur: sqlite3.Cursor) -> None:
+    """Сверка с банковской выпиской: запуски, сопоставленные пары и расхождения"""
+    cur.execute("""
+        CREATE TABLE reconciliation_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            period_start TEXT NOT NULL,
+            period_end TEXT NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            matched INTEGER NOT NULL DEFAULT 0,
+            unmatched_bank INTEGER NOT NULL DEFAULT 0,
+            unmatched_documents INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Пара хранится, пока не изменился отпечаток документа 1С
+    cur.execute("""
+        CREATE TABLE reconciliation_matches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bank_transaction_id INTEGER NOT NULL UNIQUE,
+            document_id INTEGER NOT NULL UNIQUE REFERENCES product_documents(id),
+            document_fingerprint TEXT,
+            match_type TEXT CHECK(match_type IN ('exact', 'amount_date')) NOT NULL,
+            amount INTEGER NOT NULL,  -- в копейках
+            day_diff INTEGER NOT NULL,
+            run_id INTEGER REFERENCES reconciliation_runs(id)
+        )
+    """)
+    # Несопоставленные записи хранятся с наименованиями: банковская база отдельная
+    cur.execute("""
+        CREATE TABLE reconciliation_discrepancies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT CHECK(source IN ('bank', '1c')) NOT NULL,
+            record_id INTEGER NOT NULL,
+            organization TEXT,
+            counterparty TEXT,
+            operation TEXT,
+            amount INTEGER NOT NULL,  -- в копейках
+            date TEXT NOT NULL,
+            day_key INTEGER NOT NULL,
+            run_id INTEGER REFERENCES reconciliation_runs(id),
+            UNIQUE(source, record_id)
+        )
+    """)
+    cur.execute("CREATE INDEX idx_reconciliation_discrepancies_day ON reconciliation_discrepancies(day_key)")
+
+def _migrate_partitions(cur: sqlite3.Cursor) -> None:
+    """Реестр закрытых лет, вынесенных в отдельные файлы"""
+    cur.execute(REGISTRY_SQL)
+
+def _migrate_daily_totals(cur: sqlite3.Cursor) -> None:
+    """Итоги по дням для операций, удаленных по сроку хранения"""
+    cur.execute("""
+        CREATE TABLE product_daily_totals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day_key INTEGER NOT NULL,
+            month_key INTEGER NOT NULL,
+            date DATE NOT NULL,
+            organization_id INTEGER NOT NULL REFERENCES organizations(id),
+            operation TEXT NOT NULL,
+            method TEXT NOT NULL,
+            operations INTEGER NOT NULL,
+            -- Суммы в копейках
+            debit INTEGER NOT NULL,
+            credit INTEGER NOT NULL,
+            cost INTEGER NOT NULL,
+            profit INTEGER NOT NULL,
+            document_amount INTEGER
+        )
+    """)
+    cur.execute("CREATE INDEX idx_product_daily_totals_day ON product_daily_totals(day_key)")
+    cur.execute("CREATE INDEX idx_product_daily_totals_month ON product_daily_totals(month_key)")
+
+# Миграции схемы по порядку; номер примененной миграции хранится в PRAGMA user_version
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_document_fingerprints,
+    _migrate_line_keys,
+    _migrate_date_keys,
+    _migrate_money_to_kopecks,
+    _migrate_dimensions,
+    _migrate_data_generation,
+    _migrate_reconciliation,
+    _migrate_partitions,
+    _migrate_daily_totals,
+]
+
+def _dimension_id(cur: sqlite3.Cursor, table: str, name: Optional[str]) -> Optional[int]:
+    """
+    ID значения справочника по наименованию; новое значение добавляется в справочник
+    
+    Args:
+        cur: Курсор текущей транзакции
+        table: Таблица справочника
+        name: Наименование
+    """
+    if name is None:
+        return None
+    cache = _dimension_cache[table]
+    dimension_id = cache.get(name)
+    if dimension_id is None:
+        cur.execute(f"INSERT INTO {table} (name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,))
+        cur.execute(f"SELECT id FROM {table} WHERE name = ?", (name,))
+        dimension_id = cur.fetchone()[0]
+        cache[name] = dimension_id
+    return dimension_id
+
+def _clear_dimension_cache() -> None:
+    """Сброс кэша справочников: id из отмененной транзакции недействительны"""
+    for cache in _dimension_cache.values():
+        cache.clear()
+
+def _bump_data_generation(cur: sqlite3.Cursor) -> None:
+    """Отметка об изменении данных в текущей транзакции (сбрасывает кэши аналитики)"""
+    cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_generation'")
+
+def get_data_generation(conn: sqlite3.Connection) -> int:
+    """
+    Текущее поколение данных товарных операций
+    
+    Args:
+        conn: Открытое соединение с базой данных
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM meta WHERE key = 'data_generation'")
+    return cur.fetchone()[0]
+
+def get_data_version() -> int:
+    """Версия данных для кэша ответов: поколение данных товарных операций"""
+    conn = get_connection()
+    try:
+        return get_data_generation(conn)
+    finally:
+        conn.close()
+
+def get_retained_from(conn: sqlite3.Connection, table: str) -> int:
+    """
+    Первый хранимый день таблицы (YYYYMMDD), 0 — строки не удалялись
+    
+    Args:
+        conn: Открытое соединение с базой данных
+        table: Таблица из RETENTION_TABLES
+    """
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (RETAINED_FROM_KEY.format(table),)).fetchone()
+    return row[0] if row else 0
+
+# База, схема которой проверена в этом процессе (init_products_db)
+_schema_ready_path: Optional[str] = None
+
+def init_products_db():
+    """
+    Инициализация базы данных для товарных операций: применение
+    недостающих миграций схемы, каждой в отдельной транзакции.
+    Для базы с актуальной схемой — только чтение PRAGMA user_version,
+    без блокировки записи; повторный вызов в процессе ничего не делает.
+    """
+    global _schema_ready_path
+    if _schema_ready_path == settings.DATABASE_PATH:
+        return
+    _clear_dimension_cache()
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        if cur.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS):
+            feed.set_generation(get_data_generation(conn))
+            _schema_ready_path = settings.DATABASE_PATH
+            logger.info("Схема базы данных продуктов актуальна")
+            return
+        # Новая база создается с постраничным освобождением места (incremental_vacuum);
+        # существующая переводится на него при первом обслуживании (maintenance.py)
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # Версия перечитывается под блокировкой записи: процессы, стартующие
+        # одновременно, не применяют одну миграцию дважды
+        while True:
+            cur.execute("BEGIN IMMEDIATE")
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                break
+            migration = MIGRATIONS[version]
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+            logger.info("Применена миграция схемы %d: %s", version + 1, migration.__doc__)
         
-        conn.commit()
+        feed.set_generation(get_data_generation(conn))
+        _schema_ready_path = settings.DATABASE_PATH
         logger.info("База данных продуктов успешно инициализирована")
     except Exception as e:
-        logger.error(f"Ошибка при инициализации базы данных: {str(e)}")
+        conn.rollback()
+        logger.error("Ошибка при инициализации базы данных: %s", e)
         raise
     finally:
         conn.close()
@@ -65,7 +622,7 @@ def validate_transaction(tx: Dict) -> None:
         ValueError: Если данные не валидны
     """
     # Проверка обязательных полей
-    required_fields = ['organization', 'operation', 'method', 'item', 'date', 'external_id']
+    required_fields = ['organization', 'operation', 'method', 'item', 'date', 'line_number']
     missing_fields = [field for field in required_fields if field not in tx]
     if missing_fields:
         raise ValueError(f"Отсутствуют обязательные поля: {', '.join(missing_fields)}")
@@ -76,98 +633,336 @@ def validate_transaction(tx: Dict) -> None:
     if tx['method'] not in settings.METHODS:
         raise ValueError(f"Недопустимое значение method: {tx['method']}")
     
-    # Проверка формата даты
+    # Проверка номера строки документа
+    if not isinstance(tx['line_number'], int) or not 0 <= tx['line_number'] <= MAX_LINE_NUMBER:
+        raise ValueError(f"Недопустимый номер строки: {tx['line_number']}")
+    
+    # Проверка и нормализация даты, ключи дня и месяца для запросов по периодам
     try:
-        if isinstance(tx['date'], str):
-            datetime.strptime(tx['date'], '%Y-%m-%d')
-    except ValueError:
+        tx['date'], tx['day_key'], tx['month_key'] = date_keys(tx['date'])
+    except (ValueError, TypeError, AttributeError):
         raise ValueError(f"Неверный формат даты: {tx['date']}")
     
-    # Проверка числовых полей
-    numeric_fields = ['debit', 'credit', 'cost', 'profit']
-    for field in numeric_fields:
+    # Проверка денежных полей и перевод в копейки
+    for field in MONEY_FIELDS:
         if field in tx and tx[field] is not None:
             try:
-                float(tx[field])
+                tx[field] = to_kopecks(tx[field])
             except (ValueError, TypeError):
                 raise ValueError(f"Поле {field} должно быть числом")
 
-async def save_product_transaction(tx: Dict) -> None:
+async def get_document_fingerprints(ref_keys: List[str]) -> Dict[str, str]:
     """
-    Сохранение товарной операции в базу данных
+    Получение сохраненных отпечатков документов 1С
     
     Args:
-        tx: Данные транзакции
+        ref_keys: Ключи документов (Ref_Key)
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        fingerprints = {}
+        # Ограничение SQLite на количество параметров в запросе
+        for i in range(0, len(ref_keys), 500):
+            chunk = ref_keys[i:i + 500]
+            cur.execute(f"""
+                SELECT ref_key, fingerprint FROM product_documents
+                WHERE ref_key IN ({", ".join("?" * len(chunk))})
+            """, chunk)
+            fingerprints.update(cur.fetchall())
+        return fingerprints
+    finally:
+        conn.close()
+
+def _save_document(
+    cur: sqlite3.Cursor,
+    ref_key: str,
+    doc_type: str,
+    fingerprint: str,
+    operations: List[Dict],
+    changes: Dict[str, list]
+) -> Dict[str, int]:
     """
+    Сохранение строк документа 1С в открытой транзакции: прежние строки
+    документа заменяются новыми, отпечаток документа обновляется
+    
+    Args:
+        cur: Курсор транзакции
+        ref_key: Ключ документа (Ref_Key)
+        doc_type: Тип документа
+        fingerprint: Отпечаток содержимого документа; пустая строка,
+            если документ обработан не полностью и должен быть загружен повторно
+        operations: Строки документа
+        changes: Новые id, даты и организации для ленты изменений (дополняются)
+    
+    Returns:
+        Количество сохраненных строк, дубликатов и строк с ошибками
+    """
+    valid = []
+    errors = 0
+    first_error = None
+    with track_stage("validation"):
+        for tx in operations:
+            try:
+                validate_transaction(tx)
+                valid.append(tx)
+            except ValueError as e:
+                errors += 1
+                first_error = first_error or e
+                logger.debug("Ошибка валидации данных: %s", e)
+    if errors:
+        fingerprint = ""
+        # Одно предупреждение на документ: все строки подробно — в DEBUG с выборкой
+        SYNC_ROW_ERRORS.labels(doc_type=doc_type).inc(errors)
+        logger.warning(
+            "Документ %s: не сохранено строк %d из %d, первая ошибка: %s",
+            ref_key, errors, len(operations), first_error
+        )
+    
+    cur.execute("""
+        INSERT INTO product_documents (ref_key, doc_type, fingerprint)
+        VALUES (?, ?, ?)
+        ON CONFLICT(ref_key) DO UPDATE SET
+            doc_type = excluded.doc_type,
+            fingerprint = excluded.fingerprint,
+            synced_at = CURRENT_TIMESTAMP
+    """, (ref_key, doc_type, fingerprint))
+    cur.execute("SELECT id FROM product_documents WHERE ref_key = ?", (ref_key,))
+    document_id = cur.fetchone()[0]
+    
+    # Даты и организации прежних строк тоже затронуты изменением
+    cur.execute("""
+        SELECT DISTINCT t.date, o.name
+        FROM product_transactions t
+        JOIN organizations o ON o.id = t.organization_id
+        WHERE t.document_id = ?
+    """, (document_id,))
+    affected = cur.fetchall()
+    
+    # Документ изменен или перепроведен в 1С — строки записываются заново
+    cur.execute("DELETE FROM product_transactions WHERE document_id = ?", (document_id,))
+    
+    # Строки, загруженные до появления привязки к документу, хранятся
+    # под прежними ключами int(Ref_Key + LineNumber) и заменяются новыми
+    legacy_ids = [
+        key for key in (_legacy_external_id(ref_key, tx["line_number"]) for tx in valid)
+        if key is not None
+    ]
+    if legacy_ids:
+        cur.execute(f"""
+            DELETE FROM product_transactions
+            WHERE document_id IS NULL AND external_id IN ({", ".join("?" * len(legacy_ids))})
+        """, legacy_ids)
+    
+    saved = 0
+    duplicates = 0
+    new_ids = []
+    for tx in valid:
+        external_id = make_line_key(document_id, tx["line_number"])
+        cur.execute("""
+            INSERT INTO product_transactions (
+                organization_id, operation, method, item_id, date, day_key, month_key,
+                external_id, line_number,
+                contractor_id, manager_id, debit, credit, cost, profit, document_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(external_id) DO NOTHING
+        """, (
+            _dimension_id(cur, "organizations", tx["organization"]),
+            tx["operation"],
+            tx["method"],
+            _dimension_id(cur, "items", tx["item"]),
+            tx["date"],
+            tx["day_key"],
+            tx["month_key"],
+            external_id,
+            tx["line_number"],
+            _dimension_id(cur, "contractors", tx.get("contractor")),
+            _dimension_id(cur, "managers", tx.get("manager")),
+            tx.get("debit"),
+            tx.get("credit"),
+            tx.get("cost"),
+            tx.get("profit"),
+            document_id
+        ))
+        if cur.rowcount:
+            saved += 1
+            new_ids.append(cur.lastrowid)
+        else:
+            duplicates += 1
+            logger.debug("Пропущен дубликат строки %s документа %s", tx['line_number'], ref_key)
+    
+    changes["ids"].extend(new_ids)
+    changes["dates"].extend([tx["date"] for tx in valid] + [row[0] for row in affected])
+    changes["organizations"].extend([tx["organization"] for tx in valid] + [row[1] for row in affected])
+    return {"success": saved, "duplicates": duplicates, "errors": errors}
+
+def _document_day_keys(document: Dict) -> set:
+    day_keys = set()
+    for tx in document["operations"]:
+        try:
+            day_keys.add(date_keys(tx.get("date"))[1])
+        except (TypeError, ValueError):
+            pass
+    return day_keys
+
+def save_documents(batches: List[List[Dict]]) -> List[Dict[str, int]]:
+    """
+    Обработчик очереди записи: документы 1С из нескольких синхронизаций
+    записываются одной транзакцией с одной фиксацией; документ с ошибкой
+    откатывается до своей точки сохранения, не затрагивая остальные.
+    Поколение данных увеличивается и лента изменений публикуется один раз.
+    Повтор после сбоя безопасен: строки документа заменяются целиком.
+    
+    Args:
+        batches: Списки документов (ref_key, doc_type, fingerprint, operations)
+    
+    Returns:
+        Количество сохраненных строк, дубликатов и строк с ошибками по каждому списку
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    changes: Dict[str, list] = {"ids": [], "dates": [], "organizations": []}
+    results = []
+    
     try:
-        # Валидация данных
-        validate_transaction(tx)
+        closed = closed_years(conn)
+        retained_from = get_retained_from(conn, "product_transactions")
+        cur.execute("BEGIN")
+        for documents in batches:
+            totals = {"success": 0, "duplicates": 0, "errors": 0}
+            for document in documents:
+                day_keys = _document_day_keys(document) if closed or retained_from else set()
+                if closed and {day_key // 10000 for day_key in day_keys} & closed:
+                    # Закрытый год не меняется; для исправлений год открывается заново
+                    logger.warning("Документ %s относится к закрытому году и не сохранен", document["ref_key"])
+                    totals["errors"] += len(document["operations"])
+                    continue
+                if day_keys and min(day_keys) < retained_from:
+                    # Строки за этот день уже свернуты в итоги и не могут быть заменены
+                    logger.warning("Документ %s старше срока хранения и не сохранен", document["ref_key"])
+                    totals["errors"] += len(document["operations"])
+                    continue
+                cur.execute("SAVEPOINT document")
+                try:
+                    result = _save_document(
+                        cur,
+                        document["ref_key"],
+                        document["doc_type"],
+                        document["fingerprint"],
+                        document["operations"],
+                        changes
+                    )
+                    cur.execute("RELEASE document")
+                except sqlite3.OperationalError:
+                    raise
+                except Exception as e:
+                    cur.execute("ROLLBACK TO document")
+                    cur.execute("RELEASE document")
+                    # Наименования, добавленные в откаченной части, не должны остаться в кэше
+                    _clear_dimension_cache()
+                    logger.error("Ошибка при сохранении документа %s: %s", document["ref_key"], e)
+                    result = {"success": 0, "duplicates": 0, "errors": len(document["operations"])}
+                for key in totals:
+                    totals[key] += result[key]
+            results.append(totals)
         
-        conn = sqlite3.connect(settings.DATABASE_PATH)
-        cur = conn.cursor()
+        _bump_data_generation(cur)
+        generation = get_data_generation(conn)
         
-        try:
-            cur.execute("""
-                INSERT INTO product_transactions (
-                    organization, operation, method, item, date, external_id,
-                    contractor, manager, debit, credit, cost, profit
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                tx["organization"],
-                tx["operation"],
-                tx["method"],
-                tx["item"],
-                tx["date"],
-                tx["external_id"],
-                tx.get("contractor"),
-                tx.get("manager"),
-                tx.get("debit"),
-                tx.get("credit"),
-                tx.get("cost"),
-                tx.get("profit")
-            ))
-            conn.commit()
-            logger.info(f"Сохранена товарная операция: {tx['external_id']}")
-            
-        except sqlite3.IntegrityError:
-            logger.debug(f"Пропущен дубликат операции: {tx['external_id']}")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении операции {tx['external_id']}: {str(e)}")
-            raise
-        finally:
-            conn.close()
-            
-    except ValueError as e:
-        logger.error(f"Ошибка валидации данных: {str(e)}")
-        raise
-    except Exception as e:
-        logger.error(f"Неожиданная ошибка при сохранении операции: {str(e)}")
+        started = time.perf_counter()
+        conn.commit()
+        DB_COMMIT_LATENCY.labels(operation="save_documents").observe(time.perf_counter() - started)
+    except Exception:
+        conn.rollback()
+        _clear_dimension_cache()
         raise
+    finally:
+        conn.close()
+    
+    feed.publish(generation, changes["ids"], changes["dates"], changes["organizations"])
+    return results
 
-async def get_product_transactions(date=None, organization=None):
+def close_partitions(payloads: List) -> List[List[Dict]]:
+    """
+    Обработчик очереди записи: годы, закончившиеся больше PARTITION_CLOSE_AFTER_DAYS
+    дней назад, переносятся из основной базы в отдельные файлы только для чтения
+    """
+    conn = get_connection()
+    try:
+        closed = [
+            close_year(conn, settings.DATABASE_PATH, "product_transactions", year)
+            for year in closable_years(conn, "product_transactions", settings.PARTITION_CLOSE_AFTER_DAYS)
+        ]
+    finally:
+        conn.close()
+    return [closed] + [[] for _ in payloads[1:]]
+
+def reopen_partitions(years: List[int]) -> List[Dict]:
+    """Обработчик очереди записи: возврат закрытых лет в основную базу"""
+    conn = get_connection()
+    try:
+        return [reopen_year(conn, settings.DATABASE_PATH, "product_transactions", year) for year in years]
+    finally:
+        conn.close()
+
+def get_partitions() -> List[Dict]:
+    """Закрытые годы товарных операций"""
+    conn = get_connection()
+    try:
+        return describe_partitions(conn, settings.DATABASE_PATH)
+    finally:
+        conn.close()
+
+writer.register("documents", save_documents)
+writer.register("close_partitions", close_partitions)
+writer.register("reopen_partition", reopen_partitions)
+
+async def get_product_transactions(date=None, organization=None, start_date=None, end_date=None):
     """
     Получение товарных операций с возможностью фильтрации по дате и организации
     
     Args:
         date: Дата для фильтрации
         organization: Организация для фильтрации
+        start_date: Начальная дата периода в формате YYYY-MM-DD
+        end_date: Конечная дата периода (включительно) в формате YYYY-MM-DD
     """
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    # Закрытые годы подключаются, только если попадают в период
+    first_key = date_keys(date or start_date)[1] if date or start_date else None
+    last_key = date_keys(date or end_date)[1] if date or end_date else None
+    conn = get_history_connection(first_key, last_key)
     cur = conn.cursor()
     
     try:
-        query = "SELECT * FROM product_transactions WHERE 1=1"
+        query = """
+            SELECT
+                t.id, o.name, t.operation, t.method, i.name, t.date, t.created_at, t.external_id,
+                c.name, m.name, t.debit, t.credit, t.cost, t.profit
+            FROM product_transactions t
+            JOIN organizations o ON o.id = t.organization_id
+            JOIN items i ON i.id = t.item_id
+            LEFT JOIN contractors c ON c.id = t.contractor_id
+            LEFT JOIN managers m ON m.id = t.manager_id
+            WHERE 1=1
+        """
         params = []
         
         if date:
-            query += " AND date = ?"
-            params.append(date)
+            query += " AND t.day_key = ?"
+            params.append(date_keys(date)[1])
+        if start_date:
+            query += " AND t.day_key >= ?"
+            params.append(date_keys(start_date)[1])
+        if end_date:
+            query += " AND t.day_key <= ?"
+            params.append(date_keys(end_date)[1])
         
         if organization:
-            query += " AND organization = ?"
+            query += " AND o.name = ?"
             params.append(organization)
         
-        query += " ORDER BY date DESC, created_at DESC"
+        query += " ORDER BY t.day_key DESC, t.created_at DESC"
         
         cur.execute(query, params)
         rows = cur.fetchall()
@@ -176,10 +971,14 @@ async def get_product_transactions(date=None, organization=None):
             'id', 'organization', 'operation', 'method', 'item', 'date', 'created_at', 'external_id',
             'contractor', 'manager', 'debit', 'credit', 'cost', 'profit'
         ]
-        return [dict(zip(columns, row)) for row in rows]
+        transactions = [dict(zip(columns, row)) for row in rows]
+        for tx in transactions:
+            for field in MONEY_FIELDS:
+                tx[field] = from_kopecks(tx[field])
+        return transactions
         
     except Exception as e:
-        logger.error(f"Ошибка при получении транзакций: {str(e)}")
+        logger.error("Ошибка при получении транзакций: %s", e)
         raise
     finally:
         conn.close()
@@ -191,24 +990,32 @@ async def get_daily_product_summary(date: str):
     Args:
         date: Дата для формирования сводки
     """
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    day_key = date_keys(date)[1]
+    conn = get_history_connection(day_key, day_key)
     cur = conn.cursor()
     
     try:
+        # Дни старше срока хранения есть только в итогах по дням
         cur.execute("""
             SELECT 
-                organization,
-                SUM(CASE WHEN operation = 'Поступление' THEN 1 ELSE 0 END) as income_count,
-                SUM(CASE WHEN operation = 'Расход' THEN 1 ELSE 0 END) as expense_count,
-                COUNT(*) as total_operations,
-                SUM(COALESCE(debit, 0)) as total_debit,
-                SUM(COALESCE(credit, 0)) as total_credit,
-                SUM(COALESCE(cost, 0)) as total_cost,
-                SUM(COALESCE(profit, 0)) as total_profit
-            FROM product_transactions 
-            WHERE date = ?
-            GROUP BY organization
-        """, (date,))
+                o.name,
+                SUM(CASE WHEN t.operation = 'Поступление' THEN t.operations ELSE 0 END) as income_count,
+                SUM(CASE WHEN t.operation = 'Расход' THEN t.operations ELSE 0 END) as expense_count,
+                SUM(t.operations) as total_operations,
+                SUM(COALESCE(t.debit, 0)) as total_debit,
+                SUM(COALESCE(t.credit, 0)) as total_credit,
+                SUM(COALESCE(t.cost, 0)) as total_cost,
+                SUM(COALESCE(t.profit, 0)) as total_profit
+            FROM (
+                SELECT organization_id, operation, 1 AS operations, debit, credit, cost, profit
+                FROM product_transactions WHERE day_key = ?
+                UNION ALL
+                SELECT organization_id, operation, operations, debit, credit, cost, profit
+                FROM product_daily_totals WHERE day_key = ?
+            ) t
+            JOIN organizations o ON o.id = t.organization_id
+            GROUP BY t.organization_id
+        """, (day_key, day_key))
         
         rows = cur.fetchall()
         return [
@@ -218,15 +1025,15 @@ async def get_daily_product_summary(date: str):
                 'expense_count': row[2],
                 'total_operations': row[3],
                 'date': date,
-                'total_debit': float(row[4]),
-                'total_credit': float(row[5]),
-                'total_cost': float(row[6]),
-                'total_profit': float(row[7])
+                'total_debit': from_kopecks(row[4]),
+                'total_credit': from_kopecks(row[5]),
+                'total_cost': from_kopecks(row[6]),
+                'total_profit': from_kopecks(row[7])
             }
             for row in rows
         ]
     except Exception as e:
-        logger.error(f"Ошибка при получении сводки за {date}: {str(e)}")
+        logger.error("Ошибка при получении сводки за %s: %s", date, e)
         raise
     finally:
         conn.close()
@@ -238,26 +1045,34 @@ async def get_monthly_product_summary(year_month: str):
     Args:
         year_month: Месяц в формате YYYY-MM
     """
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    month_key = int(year_month.replace("-", ""))
+    conn = get_history_connection(month_key * 100 + 1, month_key * 100 + 31)
     cur = conn.cursor()
     
     try:
+        # Дни старше срока хранения есть только в итогах по дням
         cur.execute("""
             SELECT 
-                organization,
-                date,
-                SUM(CASE WHEN operation = 'Поступление' THEN 1 ELSE 0 END) as income_count,
-                SUM(CASE WHEN operation = 'Расход' THEN 1 ELSE 0 END) as expense_count,
-                COUNT(*) as total_operations,
-                SUM(COALESCE(debit, 0)) as total_debit,
-                SUM(COALESCE(credit, 0)) as total_credit,
-                SUM(COALESCE(cost, 0)) as total_cost,
-                SUM(COALESCE(profit, 0)) as total_profit
-            FROM product_transactions 
-            WHERE date LIKE ?
-            GROUP BY organization, date
-            ORDER BY date ASC
-        """, (f"{year_month}%",))
+                o.name,
+                MIN(t.date),
+                SUM(CASE WHEN t.operation = 'Поступление' THEN t.operations ELSE 0 END) as income_count,
+                SUM(CASE WHEN t.operation = 'Расход' THEN t.operations ELSE 0 END) as expense_count,
+                SUM(t.operations) as total_operations,
+                SUM(COALESCE(t.debit, 0)) as total_debit,
+                SUM(COALESCE(t.credit, 0)) as total_credit,
+                SUM(COALESCE(t.cost, 0)) as total_cost,
+                SUM(COALESCE(t.profit, 0)) as total_profit
+            FROM (
+                SELECT organization_id, day_key, date, operation, 1 AS operations, debit, credit, cost, profit
+                FROM product_transactions WHERE month_key = ?
+                UNION ALL
+                SELECT organization_id, day_key, date, operation, operations, debit, credit, cost, profit
+                FROM product_daily_totals WHERE month_key = ?
+            ) t
+            JOIN organizations o ON o.id = t.organization_id
+            GROUP BY t.organization_id, t.day_key
+            ORDER BY t.day_key ASC
+        """, (month_key, month_key))
         
         rows = cur.fetchall()
         return [
@@ -267,15 +1082,15 @@ async def get_monthly_product_summary(year_month: str):
                 'income_count': row[2],
                 'expense_count': row[3],
                 'total_operations': row[4],
-                'total_debit': float(row[5]),
-                'total_credit': float(row[6]),
-                'total_cost': float(row[7]),
-                'total_profit': float(row[8])
+                'total_debit': from_kopecks(row[5]),
+                'total_credit': from_kopecks(row[6]),
+                'total_cost': from_kopecks(row[7]),
+                'total_profit': from_kopecks(row[8])
             }
             for row in rows
         ]
     except Exception as e:
-        logger.error(f"Ошибка при получении сводки за {year_month}: {str(e)}")
+        logger.error("Ошибка при получении сводки за %s: %s", year_month, e)
         raise
     finally:
         conn.close()
@@ -293,28 +1108,31 @@ async def get_product_transactions_by_date_range(
         end_date: Конечная дата в формате YYYY-MM-DD
         organization: Организация для фильтрации
     """
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    first_key, last_key = date_keys(start_date)[1], date_keys(end_date)[1]
+    conn = get_history_connection(first_key, last_key)
     cur = conn.cursor()
     
     try:
         query = """
             SELECT 
-                organization,
-                operation,
-                method,
-                item,
-                date,
-                external_id
-            FROM product_transactions
-            WHERE date BETWEEN ? AND ?
+                o.name,
+                t.operation,
+                t.method,
+                i.name,
+                t.date,
+                t.external_id
+            FROM product_transactions t
+            JOIN organizations o ON o.id = t.organization_id
+            JOIN items i ON i.id = t.item_id
+            WHERE t.day_key BETWEEN ? AND ?
         """
-        params = [start_date, end_date]
+        params = [first_key, last_key]
         
         if organization:
-            query += " AND organization = ?"
+            query += " AND o.name = ?"
             params.append(organization)
             
-        query += " ORDER BY date DESC, created_at DESC"
+        query += " ORDER BY t.day_key DESC, t.created_at DESC"
         
         cur.execute(query, params)
         rows = cur.fetchall()
@@ -332,7 +1150,189 @@ async def get_product_transactions_by_date_range(
         ]
         
     except Exception as e:
-        logging.error(f"Ошибка при получении транзакций за период: {str(e)}")
+        logger.error("Ошибка при получении транзакций за период: %s", e)
+        raise
+    finally:
+        conn.close()
+
+async def create_backfill_job(start_date: str, end_date: str, window_days: int) -> int:
+    """
+    Создание задания загрузки истории с разбиением периода на окна.
+    Если незавершенное задание на тот же период уже есть, возвращается оно.
+    
+    Args:
+        start_date: Начальная дата в формате YYYY-MM-DD
+        end_date: Конечная дата (включительно) в формате YYYY-MM-DD
+        window_days: Размер окна в днях
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            SELECT id FROM backfill_jobs
+            WHERE start_date = ? AND end_date = ? AND window_days = ? AND status != 'done'
+            ORDER BY id DESC LIMIT 1
+        """, (start_date, end_date, window_days))
+        row = cur.fetchone()
+        if row:
+            return row[0]
+
+        cur.execute("""
+            INSERT INTO backfill_jobs (start_date, end_date, window_days)
+            VALUES (?, ?, ?)
+        """, (start_date, end_date, window_days))
+        job_id = cur.lastrowid
+
+        # Окна — полуинтервалы [window_start, window_end)
+        window_start = datetime.strptime(start_date, "%Y-%m-%d")
+        last_day = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+        windows = []
+        while window_start < last_day:
+            window_end = min(window_start + timedelta(days=window_days), last_day)
+            windows.append((job_id, window_start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d")))
+            window_start = window_end
+        cur.executemany("""
+            INSERT INTO backfill_windows (job_id, window_start, window_end)
+            VALUES (?, ?, ?)
+        """, windows)
+
+        conn.commit()
+        return job_id
+    except Exception as e:
+        logger.error("Ошибка при создании задания загрузки истории: %s", e)
         raise
     finally:
-        conn.close() 
\ No newline at end of file
+        conn.close()
+
+async def get_backfill_job(job_id: int) -> Optional[Dict]:
+    """
+    Получение задания загрузки истории вместе с окнами
+    
+    Args:
+        job_id: ID задания
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            SELECT id, start_date, end_date, window_days, status, created_at, finished_at
+            FROM backfill_jobs WHERE id = ?
+        """, (job_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        job = dict(zip(
+            ['id', 'start_date', 'end_date', 'window_days', 'status', 'created_at', 'finished_at'],
+            row
+        ))
+
+        cur.execute("""
+            SELECT window_start, window_end, status, total, success, duplicates, errors, error, updated_at
+            FROM backfill_windows WHERE job_id = ?
+            ORDER BY window_start
+        """, (job_id,))
+        columns = [
+            'window_start', 'window_end', 'status', 'total', 'success',
+            'duplicates', 'errors', 'error', 'updated_at'
+        ]
+        job['windows'] = [dict(zip(columns, row)) for row in cur.fetchall()]
+        return job
+    finally:
+        conn.close()
+
+async def get_unfinished_backfill_jobs() -> List[int]:
+    """
+    Получение ID незавершенных заданий загрузки истории
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("SELECT id FROM backfill_jobs WHERE status IN ('pending', 'running') ORDER BY id")
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+async def claim_backfill_windows(job_id: int) -> List[Dict]:
+    """
+    Перевод задания в работу и получение окон, которые еще не загружены.
+    Окна, прерванные в статусе running или завершившиеся ошибкой, загружаются заново.
+    
+    Args:
+        job_id: ID задания
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("UPDATE backfill_jobs SET status = 'running', finished_at = NULL WHERE id = ?", (job_id,))
+        cur.execute("""
+            SELECT id, window_start, window_end FROM backfill_windows
+            WHERE job_id = ? AND status != 'done'
+            ORDER BY window_start
+        """, (job_id,))
+        windows = [
+            {"id": row[0], "window_start": row[1], "window_end": row[2]}
+            for row in cur.fetchall()
+        ]
+        conn.commit()
+        return windows
+    finally:
+        conn.close()
+
+async def update_backfill_window(window_id: int, status: str, result: Optional[Dict] = None) -> None:
+    """
+    Сохранение контрольной точки окна загрузки истории
+    
+    Args:
+        window_id: ID окна
+        status: Новый статус окна
+        result: Результат синхронизации окна
+    """
+    result = result or {}
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            UPDATE backfill_windows
+            SET status = ?, total = ?, success = ?, duplicates = ?, errors = ?, error = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (
+            status,
+            result.get("total"),
+            result.get("success"),
+            result.get("duplicates"),
+            result.get("errors"),
+            result.get("message"),
+            window_id
+        ))
+        conn.commit()
+    finally:
+        conn.close()
+
+async def finish_backfill_job(job_id: int) -> str:
+    """
+    Завершение задания: done, если загружены все окна, иначе failed
+    
+    Args:
+        job_id: ID задания
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("""
+            SELECT COUNT(*) FROM backfill_windows WHERE job_id = ? AND status != 'done'
+        """, (job_id,))
+        status = "failed" if cur.fetchone()[0] else "done"
+        cur.execute("""
+            UPDATE backfill_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?
+        """, (status, job_id))
+        conn.commit()
+        return status
+    finally:
+        conn.close()
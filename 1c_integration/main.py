@@ -1,15 +1,11 @@
-import uvicorn
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from db import init_products_db
-from api import OneCAPI
+from config import settings
+from common.logging_config import setup_logging
 
 # Настройка логирования
-logging.basicConfig(
-    filename='1c_products.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+setup_logging(settings.LOG_FILE)
 
 async def sync_1c_products(start_date=None, end_date=None):
     """
@@ -22,12 +18,14 @@ async def sync_1c_products(start_date=None, end_date=None):
     logging.info("Запуск синхронизации товарных операций с 1C")
     
     try:
+        from api import OneCAPI
         api = OneCAPI()
         result = await api.sync_data(
-            date_from=datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+            date_from=datetime.strptime(start_date, "%Y-%m-%d") if start_date else None,
+            date_to=datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1) if end_date else None
         )
         
-        logging.info(f"Синхронизация завершена: {result}")
+        logging.info("Синхронизация завершена: %s", result)
         return result
         
     except Exception as e:
@@ -39,6 +37,8 @@ async def sync_1c_products(start_date=None, end_date=None):
         }
 
 if __name__ == "__main__":
+    import uvicorn
+    
     # Инициализация БД при запуске
     init_products_db()
     
@@ -1,8 +1,41 @@
+import asyncio
 import requests
+import time
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
+from uuid import UUID
 import logging
 from config import settings
+from metrics import ODATA_REQUEST_LATENCY, CATALOG_CACHE_REQUESTS
+from common.rate_limit import RateLimiter
+from common.http_policy import OutboundPolicy, CircuitOpenError
+from utils import build_odata_query, odata_condition, odata_in, odata_literal
+
+# Общий для всех клиентов процесса лимит запросов к 1С
+rate_limiter = RateLimiter(settings.ODATA_RATE_LIMIT)
+
+# Общая политика повторов, выключатель и адаптивный лимит параллельности
+odata_policy = OutboundPolicy(
+    "odata",
+    connect_timeout=settings.ODATA_CONNECT_TIMEOUT,
+    read_timeout=settings.ODATA_READ_TIMEOUT,
+    max_retries=settings.ODATA_MAX_RETRIES,
+    backoff_base=settings.ODATA_BACKOFF_BASE,
+    backoff_max=settings.ODATA_BACKOFF_MAX,
+    circuit_failures=settings.ODATA_CIRCUIT_FAILURES,
+    circuit_reset=settings.ODATA_CIRCUIT_RESET,
+    max_concurrency=settings.ODATA_MAX_CONCURRENCY,
+    latency_target=settings.ODATA_LATENCY_TARGET
+)
+
+# Запрашиваемые поля: только то, что используется при загрузке и в отпечатке документа
+DOCUMENT_FIELDS = (
+    "Ref_Key", "DataVersion", "Date", "Организация_Key", "Контрагент_Key", "Менеджер_Key",
+    "СуммаДебет", "СуммаКредит", "Себестоимость", "ВаловаяПрибыль"
+)
+DOCUMENT_LINE_FIELDS = ("LineNumber", "Номенклатура_Key")
+UNPOSTED_DOCUMENT_FIELDS = ("Ref_Key", "DataVersion")
+CATALOG_FIELDS = ("Description",)
 
 class ODataClient:
     def __init__(self):
@@ -14,46 +47,96 @@ class ODataClient:
             "Authorization": f"Basic {settings.ODATA_PASSWORD}"
         }
         self.logger = logging.getLogger(__name__)
+        # Кэш элементов справочников на время жизни клиента (одна синхронизация)
+        self._catalog_cache: Dict[Tuple[str, str], Dict] = {}
 
-    def _build_filter(self, date_from: Optional[datetime] = None) -> str:
-        """Построение фильтра OData"""
-        if date_from:
-            return f"Date ge {date_from.strftime('%Y-%m-%dT%H:%M:%S')}"
-        return ""
+    def _build_filters(
+        self,
+        posted: bool,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> List[Optional[str]]:
+        """
+        Условия отбора документов на стороне 1С: проведение, полуинтервал
+        дат [date_from, date_to) и организации из ODATA_ORGANIZATIONS
+        """
+        return [
+            odata_condition("Posted", "eq", posted),
+            odata_condition("Date", "ge", date_from) if date_from else None,
+            odata_condition("Date", "lt", date_to) if date_to else None,
+            odata_in("Организация_Key", [UUID(key) for key in settings.ODATA_ORGANIZATIONS])
+            if settings.ODATA_ORGANIZATIONS else None
+        ]
 
-    def _make_request(self, url: str, params: Optional[Dict] = None) -> Dict:
+    def _make_request(self, url: str, params: Optional[Dict] = None, endpoint: str = "other") -> Dict:
         """Выполнение запроса с обработкой ошибок"""
+        started = time.perf_counter()
+        status = "error"
         try:
-            response = requests.get(
+            response = odata_policy.request(
+                "GET",
                 url,
                 params=params,
+                rate_limiter=rate_limiter,
                 headers=self.headers,
                 verify=True  # SSL verification
             )
-            response.raise_for_status()
+            status = str(response.status_code)
             return response.json()
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"OData request failed: {str(e)}")
+            if e.response is not None:
+                status = str(e.response.status_code)
+            self.logger.error("OData request failed: %s", e)
+            raise
+        except CircuitOpenError as e:
+            status = "circuit_open"
+            self.logger.error("OData request rejected: %s", e)
             raise
+        finally:
+            ODATA_REQUEST_LATENCY.labels(endpoint=endpoint, status=status).observe(
+                time.perf_counter() - started
+            )
 
-    async def get_documents(self, doc_type: str, date_from: Optional[datetime] = None) -> List[Dict]:
+    async def _request(self, url: str, params: Optional[Dict] = None, endpoint: str = "other") -> Dict:
+        """
+        Выполнение запроса в отдельном потоке, чтобы блокирующий HTTP-вызов
+        не останавливал цикл событий. Общий лимит частоты соблюдается в потоке
+        для каждой попытки политики, включая повторы
+        """
+        return await asyncio.to_thread(self._make_request, url, params, endpoint)
+
+    async def get_documents(
+        self,
+        doc_type: str,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        posted: bool = True
+    ) -> List[Dict]:
         """
         Получение документов из 1С
         
         Args:
             doc_type: Тип документа (ПриходнаяНакладная, РасходнаяНакладная)
             date_from: Дата, с которой начинать выборку
+            date_to: Дата, до которой (не включая) выполняется выборка
+            posted: True — проведенные документы со строками; False — только
+                ключи и версии непроведенных, чтобы снять отмененные проведения
         """
         url = f"{self.base_url}/Document_{doc_type}"
-        params = {
-            "$filter": self._build_filter(date_from),
-            "$select": "Ref_Key,Number,Date,Posted,Организация_Key,Контрагент_Key,Менеджер_Key,СуммаДебет,СуммаКредит,Себестоимость,ВаловаяПрибыль",
-            "$expand": "Товары($select=Количество,Цена,Сумма,Себестоимость,ВаловаяПрибыль,Номенклатура_Key)",
-            "$orderby": "Date desc"
-        }
+        if posted:
+            params = build_odata_query(
+                self._build_filters(True, date_from, date_to),
+                select=DOCUMENT_FIELDS,
+                expand={"Товары": DOCUMENT_LINE_FIELDS}
+            )
+        else:
+            params = build_odata_query(
+                self._build_filters(False, date_from, date_to),
+                select=UNPOSTED_DOCUMENT_FIELDS
+            )
 
-        self.logger.info(f"Fetching documents of type {doc_type}")
-        result = self._make_request(url, params)
+        self.logger.info("Fetching %s documents of type %s", "posted" if posted else "unposted", doc_type)
+        result = await self._request(url, params, endpoint=f"Document_{doc_type}")
         return result.get("value", [])
 
     async def get_catalog_item(self, catalog: str, ref_key: str) -> Dict:
@@ -64,8 +147,16 @@ class ODataClient:
             catalog: Имя справочника (Номенклатура, Контрагенты)
             ref_key: Ключ ссылки на элемент справочника
         """
-        url = f"{self.base_url}/Catalog_{catalog}(guid'{ref_key}')"
+        cache_key = (catalog, ref_key)
+        cached = self._catalog_cache.get(cache_key)
+        if cached is not None:
+            CATALOG_CACHE_REQUESTS.labels(catalog=catalog, result="hit").inc()
+            return cached
+        CATALOG_CACHE_REQUESTS.labels(catalog=catalog, result="miss").inc()
+
+        url = f"{self.base_url}/Catalog_{catalog}({odata_literal(UUID(ref_key))})"
         
-        self.logger.debug(f"Fetching catalog item {catalog} with key {ref_key}")
-        result = self._make_request(url)
+        self.logger.debug("Fetching catalog item %s with key %s", catalog, ref_key)
+        result = await self._request(url, build_odata_query(select=CATALOG_FIELDS), endpoint=f"Catalog_{catalog}")
+        self._catalog_cache[cache_key] = result
         return result 
\ No newline at end of file
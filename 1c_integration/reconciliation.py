@@ -0,0 +1,323 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from config import settings
+from db import get_connection, get_history_connection, get_bank_connection
+from metrics import track_stage
+from utils import from_kopecks
+
+logger = logging.getLogger(__name__)
+
+# Операция документа 1С -> операция платежа в банке:
+# по расходной накладной деньги поступают, по приходной — списываются
+BANK_OPERATIONS = {
+    "Расход": "Поступление",
+    "Поступление": "Списание",
+}
+
+# Символы, которые по-разному пишутся в 1С и в выписке банка
+_NAME_STRIP = str.maketrans({'"': " ", "'": " ", "«": " ", "»": " ", "ё": "е"})
+
+# Сверки не должны идти параллельно: они пересчитывают одни и те же расхождения
+_lock = threading.Lock()
+
+
+class Record:
+    """Запись одной из сторон сверки: платеж банка или документ 1С"""
+
+    __slots__ = ("id", "organization", "counterparty", "operation", "amount", "day", "date", "fingerprint")
+
+    def __init__(self, id: int, organization: Optional[str], counterparty: Optional[str],
+                 operation: str, amount: int, day: int, date: str, fingerprint: Optional[str] = None):
+        self.id = id
+        self.organization = organization
+        self.counterparty = counterparty
+        self.operation = operation
+        self.amount = amount
+        self.day = day
+        self.date = date
+        self.fingerprint = fingerprint
+
+
+# Наименования и дни повторяются в тысячах записей: преобразуются один раз
+@lru_cache(maxsize=65536)
+def _normalize_name(name: Optional[str]) -> Optional[str]:
+    """Наименование для сравнения: без регистра, кавычек и лишних пробелов"""
+    if not name:
+        return None
+    return " ".join(name.casefold().translate(_NAME_STRIP).split())
+
+
+@lru_cache(maxsize=4096)
+def _day_number(day_key: int) -> int:
+    return date(day_key // 10000, day_key // 100 % 100, day_key % 100).toordinal()
+
+
+def _day_key(value: date) -> int:
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def _load_documents(cur: sqlite3.Cursor, first_key: int, last_key: int) -> List[Record]:
+    """Документы 1С за период без действующей пары; сумма документа — из шапки"""
+    cur.execute("""
+        SELECT
+            d.id, o.name, c.name, t.operation,
+            MAX(CASE WHEN t.operation = 'Расход' THEN t.debit ELSE t.credit END),
+            MIN(t.day_key), MIN(t.date), d.fingerprint
+        FROM product_transactions t
+        JOIN product_documents d ON d.id = t.document_id
+        JOIN organizations o ON o.id = t.organization_id
+        LEFT JOIN contractors c ON c.id = t.contractor_id
+        WHERE t.day_key BETWEEN ? AND ?
+            AND NOT EXISTS (SELECT 1 FROM reconciliation_matches m WHERE m.document_id = d.id)
+        GROUP BY d.id
+    """, (first_key, last_key))
+    return [
+        Record(doc_id, organization, contractor, BANK_OPERATIONS[operation], amount, _day_number(day_key), doc_date, fingerprint)
+        for doc_id, organization, contractor, operation, amount, day_key, doc_date, fingerprint in cur.fetchall()
+        if amount
+    ]
+
+
+def _load_payments(bank_cur: sqlite3.Cursor, first_key: int, last_key: int, matched: set) -> List[Record]:
+    """Платежи банка за период без действующей пары"""
+    bank_cur.execute("""
+        SELECT t.id, o.name, c.name, t.operation, t.amount, t.day_key, t.date
+        FROM finance_transactions t
+        LEFT JOIN organizations o ON o.id = t.organization_id
+        LEFT JOIN counterparties c ON c.id = t.counterparty_id
+        WHERE t.day_key BETWEEN ? AND ?
+    """, (first_key, last_key))
+    return [
+        Record(payment_id, organization, counterparty, operation, abs(amount), _day_number(day_key), payment_date[:10])
+        for payment_id, organization, counterparty, operation, amount, day_key, payment_date in bank_cur.fetchall()
+        if payment_id not in matched and amount
+    ]
+
+
+def _match(
+    payments: List[Record],
+    documents: List[Record],
+    key: Callable[[Record], Tuple],
+    tolerance: int
+) -> List[Tuple[Record, Record]]:
+    """
+    Сопоставление платежей и документов: хэш-соединение по ключу,
+    внутри группы — проход двумя указателями по отсортированным датам.
+    Каждому платежу достается самый ранний свободный документ в окне
+    [день платежа - tolerance, день платежа + tolerance].
+    Обе стороны должны быть отсортированы по (day, id).
+    """
+    buckets: Dict[Tuple, List[Record]] = defaultdict(list)
+    for document in documents:
+        buckets[key(document)].append(document)
+
+    # Указатель на первый свободный документ группы
+    positions = dict.fromkeys(buckets, 0)
+    pairs = []
+    for payment in payments:
+        payment_key = key(payment)
+        bucket = buckets.get(payment_key)
+        if bucket is None:
+            continue
+        j = positions[payment_key]
+        while j < len(bucket) and bucket[j].day < payment.day - tolerance:
+            j += 1
+        if j < len(bucket) and bucket[j].day <= payment.day + tolerance:
+            pairs.append((payment, bucket[j]))
+            j += 1
+        positions[payment_key] = j
+    return pairs
+
+
+def _exact_key(record: Record) -> Tuple:
+    return (
+        _normalize_name(record.organization), _normalize_name(record.counterparty),
+        record.operation, record.amount
+    )
+
+
+def _amount_date_key(record: Record) -> Tuple:
+    return (_normalize_name(record.organization), record.operation, record.amount)
+
+
+def run_reconciliation(start: date, end: date) -> Dict:
+    """
+    Сверка платежей банка с документами 1С за период.
+    Сопоставленные пары сохраняются и не пересчитываются, пока не изменился
+    документ 1С; расхождения за период пересчитываются заново.
+
+    Args:
+        start: Начальная дата
+        end: Конечная дата
+    """
+    tolerance = settings.RECONCILIATION_DATE_TOLERANCE_DAYS
+    # Пара может выйти за границы периода на допустимое расхождение дат
+    first_key = _day_key(start - timedelta(days=tolerance))
+    last_key = _day_key(end + timedelta(days=tolerance))
+    start_day, end_day = start.toordinal(), end.toordinal()
+
+    with _lock:
+        started = time.perf_counter()
+        bank_conn = get_bank_connection(first_key, last_key)
+        conn = get_history_connection(first_key, last_key)
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN")
+            cur.execute(
+                "INSERT INTO reconciliation_runs (period_start, period_end) VALUES (?, ?)",
+                (start.isoformat(), end.isoformat())
+            )
+            run_id = cur.lastrowid
+
+            # Пары по измененным или удаленным документам больше не действительны
+            cur.execute("""
+                DELETE FROM reconciliation_matches
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM product_documents d
+                    WHERE d.id = reconciliation_matches.document_id
+                        AND d.fingerprint IS reconciliation_matches.document_fingerprint
+                )
+            """)
+
+            with track_stage("reconciliation_load"):
+                documents = _load_documents(cur, first_key, last_key)
+                cur.execute("SELECT bank_transaction_id FROM reconciliation_matches")
+                matched = {row[0] for row in cur.fetchall()}
+                payments = _load_payments(bank_conn.cursor(), first_key, last_key, matched)
+                documents.sort(key=lambda r: (r.day, r.id))
+                payments.sort(key=lambda r: (r.day, r.id))
+
+            with track_stage("reconciliation_match"):
+                pairs = []
+                for match_type, key in (("exact", _exact_key), ("amount_date", _amount_date_key)):
+                    found = _match(payments, documents, key, tolerance)
+                    paired_payments = {payment.id for payment, _ in found}
+                    paired_documents = {document.id for _, document in found}
+                    payments = [p for p in payments if p.id not in paired_payments]
+                    documents = [d for d in documents if d.id not in paired_documents]
+                    pairs.extend((match_type, payment, document) for payment, document in found)
+
+            cur.executemany("""
+                INSERT INTO reconciliation_matches (
+                    bank_transaction_id, document_id, document_fingerprint,
+                    match_type, amount, day_diff, run_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (payment.id, document.id, document.fingerprint,
+                 match_type, payment.amount, document.day - payment.day, run_id)
+                for match_type, payment, document in pairs
+            ])
+
+            # Расхождения: записи периода без пары; записи за границей периода,
+            # нашедшие пару, удаляются отдельно
+            cur.execute(
+                "DELETE FROM reconciliation_discrepancies WHERE day_key BETWEEN ? AND ?",
+                (_day_key(start), _day_key(end))
+            )
+            cur.executemany(
+                "DELETE FROM reconciliation_discrepancies WHERE source = ? AND record_id = ?",
+                [(source, record.id) for _, payment, document in pairs
+                 for source, record in (("bank", payment), ("1c", document))
+                 if not start_day <= record.day <= end_day]
+            )
+            discrepancies = [
+                (source, record.id, record.organization, record.counterparty, record.operation,
+                 record.amount, record.date, _day_key(date.fromordinal(record.day)), run_id)
+                for source, records in (("bank", payments), ("1c", documents))
+                for record in records
+                if start_day <= record.day <= end_day
+            ]
+            cur.executemany("""
+                INSERT OR REPLACE INTO reconciliation_discrepancies (
+                    source, record_id, organization, counterparty, operation,
+                    amount, date, day_key, run_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, discrepancies)
+
+            unmatched_bank = sum(1 for row in discrepancies if row[0] == "bank")
+            result = {
+                "run_id": run_id,
+                "period_start": start.isoformat(),
+                "period_end": end.isoformat(),
+                "matched": len(pairs),
+                "unmatched_bank": unmatched_bank,
+                "unmatched_documents": len(discrepancies) - unmatched_bank,
+            }
+            cur.execute("""
+                UPDATE reconciliation_runs
+                SET finished_at = CURRENT_TIMESTAMP, matched = ?, unmatched_bank = ?, unmatched_documents = ?
+                WHERE id = ?
+            """, (result["matched"], result["unmatched_bank"], result["unmatched_documents"], run_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            bank_conn.close()
+            conn.close()
+
+    logger.info(
+        "Сверка %s..%s: новых пар %d, без пары платежей %d, документов %d за %.2f с",
+        result["period_start"], result["period_end"], result["matched"],
+        result["unmatched_bank"], result["unmatched_documents"], time.perf_counter() - started
+    )
+    return result
+
+
+def get_discrepancies(
+    start: date,
+    end: date,
+    source: Optional[str] = None,
+    organization: Optional[str] = None,
+    limit: int = 100
+) -> List[Dict]:
+    """
+    Записи без пары по результатам последней сверки
+
+    Args:
+        start: Начальная дата
+        end: Конечная дата
+        source: Сторона сверки (bank / 1c)
+        organization: Название организации
+        limit: Максимальное количество записей
+    """
+    query = """
+        SELECT source, record_id, organization, counterparty, operation, amount, date, run_id
+        FROM reconciliation_discrepancies
+        WHERE day_key BETWEEN ? AND ?
+    """
+    params: list = [_day_key(start), _day_key(end)]
+    if source:
+        query += " AND source = ?"
+        params.append(source)
+    if organization:
+        query += " AND organization = ?"
+        params.append(organization)
+    query += " ORDER BY day_key, source, record_id LIMIT ?"
+    params.append(limit)
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        return [
+            {
+                "source": row[0],
+                "record_id": row[1],
+                "organization": row[2],
+                "counterparty": row[3],
+                "operation": row[4],
+                "amount": from_kopecks(row[5]),
+                "date": row[6],
+                "run_id": row[7],
+            }
+            for row in cur.fetchall()
+        ]
+    finally:
+        conn.close()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -126,9 +126,239 @@ class SyncResponse(BaseModel):
     status: Literal["success", "error"]
     total: Optional[int] = None
     success: Optional[int] = None
+    duplicates: Optional[int] = None
     errors: Optional[int] = None
+    unchanged_documents: Optional[int] = None
     message: Optional[str] = None
 
+class BackfillWindow(BaseModel):
+    window_start: str = Field(..., description="Начало окна (включительно) в формате YYYY-MM-DD")
+    window_end: str = Field(..., description="Конец окна (не включительно) в формате YYYY-MM-DD")
+    status: Literal["pending", "running", "done", "failed"]
+    total: Optional[int] = None
+    success: Optional[int] = None
+    duplicates: Optional[int] = None
+    errors: Optional[int] = None
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+class BackfillJobResponse(BaseModel):
+    id: int
+    start_date: str
+    end_date: str
+    window_days: int
+    status: Literal["pending", "running", "done", "failed"]
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    windows: List[BackfillWindow]
+
+class WriteQueueStatusResponse(BaseModel):
+    writer: bool = Field(..., description="Этот процесс — писатель очереди")
+    pid: int
+    pending_jobs: int = Field(..., description="Заданий в ожидании записи", ge=0)
+    pending_rows: int = Field(..., description="Строк в ожидании записи", ge=0)
+    lag_seconds: float = Field(..., description="Возраст самого старого задания в очереди, с")
+    average_lag_seconds: Optional[float] = Field(None, description="Средняя задержка записи за 5 минут, с")
+    failed_jobs: int = Field(..., description="Заданий с ошибкой за 5 минут", ge=0)
+    last_applied_seconds_ago: Optional[float] = Field(None, description="Время с последней записи, с")
+
 class HealthCheckResponse(BaseModel):
     status: Literal["healthy", "unhealthy"]
-    timestamp: datetime 
\ No newline at end of file
+    timestamp: datetime
+
+class WarmUpStep(BaseModel):
+    name: str = Field(..., description="Шаг прогрева")
+    status: Literal["pending", "running", "done", "failed"]
+    duration_seconds: Optional[float] = Field(None, description="Длительность шага, с")
+    error: Optional[str] = None
+
+class ReadinessResponse(BaseModel):
+    status: Literal["ready", "warming_up"]
+    uptime_seconds: float = Field(..., description="Время с запуска прогрева, с")
+    warmup_seconds: Optional[float] = Field(None, description="Длительность прогрева, с")
+    steps: List[WarmUpStep] = Field(default_factory=list)
+
+class QueryStat(BaseModel):
+    statement: str = Field(..., description="Текст запроса")
+    calls: int = Field(..., description="Количество выполнений", ge=0)
+    total_ms: float = Field(..., description="Суммарное время, мс")
+    avg_ms: float = Field(..., description="Среднее время, мс")
+    max_ms: float = Field(..., description="Максимальное время, мс")
+    rows: int = Field(..., description="Количество возвращенных/измененных строк", ge=0)
+
+class QueryStatsResponse(BaseModel):
+    slow_query_ms: float
+    data: List[QueryStat]
+
+class AnalyticsGroup(BaseModel):
+    id: Optional[int] = Field(None, description="ID в справочнике (None — значение не указано)")
+    name: Optional[str] = Field(None, description="Наименование")
+    operations: int = Field(..., description="Количество операций", ge=0)
+    debit: float = Field(..., description="Сумма дебета (расхода)")
+    credit: float = Field(..., description="Сумма кредита (прихода)")
+    cost: float = Field(..., description="Себестоимость")
+    profit: float = Field(..., description="Валовая прибыль")
+    margin: Optional[float] = Field(None, description="Доля прибыли в выручке (себестоимость + прибыль)")
+
+class AnalyticsGroupsResponse(BaseModel):
+    status: Literal["success", "error"]
+    group_by: str
+    start_date: str
+    end_date: str
+    data: List[AnalyticsGroup]
+
+class RollingProfitPoint(BaseModel):
+    date: str = Field(..., description="Дата в формате YYYY-MM-DD")
+    profit: float = Field(..., description="Валовая прибыль за день")
+    rolling_profit: float = Field(..., description="Валовая прибыль за окно, заканчивающееся этим днем")
+
+class RollingProfitResponse(BaseModel):
+    status: Literal["success", "error"]
+    window: int
+    data: List[RollingProfitPoint]
+
+class PeriodComparisonGroup(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    profit: float = Field(..., description="Валовая прибыль за период")
+    previous_profit: float = Field(..., description="Валовая прибыль за предыдущий период")
+    change: float = Field(..., description="Изменение прибыли")
+    change_pct: Optional[float] = Field(None, description="Изменение прибыли, %")
+
+class PeriodComparisonResponse(BaseModel):
+    status: Literal["success", "error"]
+    group_by: str
+    start_date: str
+    end_date: str
+    previous_start: str
+    previous_end: str
+    profit: float
+    previous_profit: float
+    data: List[PeriodComparisonGroup]
+
+class ExportTableResult(BaseModel):
+    written: int = Field(..., description="Записано разделов", ge=0)
+    unchanged: int = Field(..., description="Разделов без изменений", ge=0)
+    removed: int = Field(..., description="Удалено опустевших разделов", ge=0)
+
+class ExportResponse(BaseModel):
+    status: Literal["success", "error"]
+    tables: Dict[str, ExportTableResult]
+
+class ExportPartition(BaseModel):
+    partition: str = Field(..., description="Месяц в формате YYYY-MM")
+    rows: int = Field(..., description="Количество строк", ge=0)
+    bytes: int = Field(..., description="Размер файла", ge=0)
+    exported_at: str = Field(..., description="Время выгрузки")
+    archived: bool = Field(False, description="Строки раздела удалены из базы по сроку хранения")
+
+class ExportManifestResponse(BaseModel):
+    table: str
+    partitions: List[ExportPartition]
+
+class YearPartition(BaseModel):
+    year: int
+    file: str = Field(..., description="Файл года рядом с основной базой")
+    rows: int = Field(..., description="Количество строк", ge=0)
+    size_bytes: Optional[int] = Field(None, description="Размер файла")
+    closed_at: Optional[str] = None
+
+class YearPartitionsResponse(BaseModel):
+    status: Literal["success", "error"]
+    partitions: List[YearPartition]
+
+class ClosedYear(BaseModel):
+    year: int
+    rows: int = Field(..., description="Перенесено строк", ge=0)
+
+class PartitionsChangeResponse(BaseModel):
+    status: Literal["success", "error"]
+    years: List[ClosedYear]
+
+class RetentionResult(BaseModel):
+    retained_from: int = Field(..., description="Первый хранимый день (YYYYMMDD)")
+    rolled_up: int = Field(..., description="Добавлено строк итогов по дням", ge=0)
+    deleted: int = Field(..., description="Удалено подробных строк", ge=0)
+    dropped_years: List[int] = Field(..., description="Удаленные файлы закрытых лет")
+    archived_partitions: Optional[int] = Field(None, description="Архивных разделов Parquet")
+
+class MaintenanceResponse(BaseModel):
+    status: Literal["success", "error"]
+    retention: Dict[str, RetentionResult]
+    converted: bool = Field(..., description="База переведена на auto_vacuum=INCREMENTAL полным VACUUM")
+    vacuumed_pages: int = Field(..., description="Освобождено страниц", ge=0)
+    freed_bytes: int = Field(..., description="Возвращено файлу байт", ge=0)
+    statistics: Literal["analyze", "optimize"] = Field(..., description="Обновление статистики планировщика")
+    duration_seconds: float
+
+class DatabaseFile(BaseModel):
+    file: str
+    bytes: int = Field(..., ge=0)
+
+class DatabaseObject(BaseModel):
+    name: str = Field(..., description="Таблица или индекс")
+    type: str
+    bytes: int = Field(..., ge=0)
+
+class TableRetention(BaseModel):
+    days: int = Field(..., description="Срок хранения строк, дни")
+    retained_from: int = Field(..., description="Первый хранимый день (YYYYMMDD), 0 — строки не удалялись")
+
+class DatabaseSizeResponse(BaseModel):
+    status: Literal["success", "error"]
+    total_bytes: int = Field(..., description="Размер всех файлов базы", ge=0)
+    files: List[DatabaseFile] = Field(..., description="Основная база, журнал, очередь записи и файлы закрытых лет")
+    page_size: int
+    page_count: int
+    freelist_count: int = Field(..., description="Свободных страниц внутри файла", ge=0)
+    free_bytes: int = Field(..., ge=0)
+    auto_vacuum: str
+    objects: List[DatabaseObject] = Field(..., description="Размер таблиц и индексов основной базы")
+    retention: Dict[str, TableRetention]
+    maintained_at: Optional[str] = Field(None, description="Время последнего обслуживания")
+
+class ReconciliationRunResponse(BaseModel):
+    status: Literal["success", "error"]
+    run_id: int
+    period_start: str
+    period_end: str
+    matched: int = Field(..., description="Новых сопоставленных пар", ge=0)
+    unmatched_bank: int = Field(..., description="Платежей банка без документа", ge=0)
+    unmatched_documents: int = Field(..., description="Документов 1С без платежа", ge=0)
+
+class ReconciliationDiscrepancy(BaseModel):
+    source: Literal["bank", "1c"] = Field(..., description="Сторона сверки: платеж банка или документ 1С")
+    record_id: int = Field(..., description="ID платежа в базе банка или документа в базе 1С")
+    organization: Optional[str] = None
+    counterparty: Optional[str] = None
+    operation: Optional[str] = Field(None, description="Операция по банку (Поступление / Списание)")
+    amount: float
+    date: str
+    run_id: Optional[int] = Field(None, description="Запуск сверки, выявивший расхождение")
+
+class ReconciliationDiscrepanciesResponse(BaseModel):
+    status: Literal["success", "error"]
+    count: int
+    data: List[ReconciliationDiscrepancy]
+
+class DashboardColumn(BaseModel):
+    total: float
+    details: Dict[str, float] = Field(..., description="Суммы по способам оплаты / операциям")
+
+class DashboardOrganization(BaseModel):
+    name: Optional[str] = None
+    money_in: Optional[DashboardColumn] = Field(None, description="Поступление денег (банк)")
+    money_out: Optional[DashboardColumn] = Field(None, description="Расход денег (банк)")
+    goods_in: Optional[DashboardColumn] = Field(None, description="Поступление товара (1С)")
+    goods_out: Optional[DashboardColumn] = Field(None, description="Расход товара (1С)")
+
+class DashboardDay(BaseModel):
+    date: str
+    organizations: List[DashboardOrganization]
+
+class DailyDashboardResponse(BaseModel):
+    start_date: str
+    end_date: str
+    start_balance: float = Field(..., description="Остаток на счетах на начало периода")
+    end_balance: float = Field(..., description="Остаток на счетах на конец периода")
+    days: List[DashboardDay] = Field(..., description="Дни с движением; пустые столбцы не передаются")
@@ -1,6 +1,9 @@
-from datetime import datetime
-from decimal import Decimal
-from typing import Any, Dict
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, Optional, Sequence, Tuple
+from uuid import UUID
 
 def parse_1c_date(date_str: str) -> datetime:
     """
@@ -28,6 +31,24 @@ def parse_1c_date(date_str: str) -> datetime:
             
     raise ValueError(f"Неподдерживаемый формат даты: {date_str}")
 
+def date_keys(value: Any) -> Tuple[str, int, int]:
+    """
+    Нормализованная дата и целочисленные ключи дня и месяца
+    
+    Args:
+        value: Дата из 1С (строка в одном из форматов 1С, date или datetime)
+    
+    Returns:
+        Дата в формате YYYY-MM-DD, ключ дня YYYYMMDD и ключ месяца YYYYMM
+    """
+    if isinstance(value, str):
+        value = parse_1c_date(value)
+    return (
+        f"{value.year:04d}-{value.month:02d}-{value.day:02d}",
+        value.year * 10000 + value.month * 100 + value.day,
+        value.year * 100 + value.month
+    )
+
 def format_1c_guid(guid: str) -> str:
     """
     Форматирование GUID для запросов к 1С
@@ -56,48 +77,151 @@ def parse_1c_number(number_str: str) -> Decimal:
     except:
         raise ValueError(f"Неверный формат числа: {number_str}")
 
-def build_odata_query(entity: str, filters: Dict[str, Any] = None, select: list = None, 
-                     expand: list = None, orderby: list = None, top: int = None) -> str:
+def to_kopecks(value: Any) -> int:
     """
-    Построение OData запроса
+    Перевод суммы в рублях в целое число копеек с округлением до копейки
     
     Args:
-        entity: Имя сущности
-        filters: Словарь с фильтрами
-        select: Список полей для выборки
-        expand: Список связанных сущностей для развертывания
-        orderby: Список полей для сортировки
-        top: Ограничение количества записей
+        value: Сумма (число или строка в формате 1С)
     """
-    query_parts = []
-    
-    # Фильтры
-    if filters:
-        filter_parts = []
-        for key, value in filters.items():
-            if isinstance(value, str):
-                filter_parts.append(f"{key} eq '{value}'")
-            elif isinstance(value, (int, float)):
-                filter_parts.append(f"{key} eq {value}")
-            elif isinstance(value, datetime):
-                filter_parts.append(f"{key} eq {value.strftime('%Y-%m-%dT%H:%M:%S')}")
-        if filter_parts:
-            query_parts.append(f"$filter={' and '.join(filter_parts)}")
-    
-    # Выборка полей
-    if select:
-        query_parts.append(f"$select={','.join(select)}")
+    try:
+        if isinstance(value, str):
+            amount = parse_1c_number(value)
+        else:
+            # Через строку, чтобы не переносить в Decimal двоичную погрешность float
+            amount = Decimal(str(value))
+        return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Неверная сумма: {value}")
+
+def from_kopecks(value: Optional[int]) -> Optional[float]:
+    """
+    Перевод суммы в копейках в рубли для ответов API
     
-    # Развертывание связанных сущностей
-    if expand:
-        query_parts.append(f"$expand={','.join(expand)}")
+    Args:
+        value: Сумма в копейках
+    """
+    return None if value is None else value / 100
+
+def document_fingerprint(doc: Dict) -> str:
+    """
+    Отпечаток содержимого документа 1С для обнаружения изменений
     
-    # Сортировка
-    if orderby:
-        query_parts.append(f"$orderby={','.join(orderby)}")
+    Args:
+        doc: Документ из 1С вместе с табличной частью Товары
+    """
+    # DataVersion меняется в 1С при каждой записи документа
+    if doc.get("DataVersion"):
+        return f"v:{doc['DataVersion']}"
+    payload = json.dumps(doc, sort_keys=True, ensure_ascii=False, default=str)
+    return "h:" + hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# Разрядов ключа строки под номер строки документа (до ~1 млн строк в документе)
+LINE_NUMBER_BITS = 20
+MAX_LINE_NUMBER = (1 << LINE_NUMBER_BITS) - 1
+
+def make_line_key(document_id: int, line_number: int) -> int:
+    """
+    Компактный 64-битный ключ строки документа 1С.
+    
+    GUID документа (Ref_Key) хранится один раз в product_documents, его
+    суррогатный id однозначно соответствует Ref_Key, поэтому ключ
+    (document_id << 20) | LineNumber детерминирован и не имеет коллизий.
+    
+    Args:
+        document_id: ID документа в product_documents
+        line_number: Номер строки (LineNumber) в табличной части
+    """
+    if not 0 <= line_number <= MAX_LINE_NUMBER:
+        raise ValueError(f"Номер строки вне допустимого диапазона: {line_number}")
+    return (document_id << LINE_NUMBER_BITS) | line_number
+
+# Операторы сравнения OData
+ODATA_OPERATORS = ("eq", "ne", "gt", "ge", "lt", "le")
+
+def odata_literal(value: Any) -> str:
+    """
+    Литерал OData для значения Python
     
-    # Ограничение количества
-    if top:
-        query_parts.append(f"$top={top}")
+    Args:
+        value: None, bool, число, строка, date/datetime или UUID (ссылка 1С)
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, str):
+        # Кавычка внутри строки удваивается
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%S')
+    if isinstance(value, date):
+        return f"{value.isoformat()}T00:00:00"
+    if isinstance(value, UUID):
+        return f"guid'{value}'"
+    raise TypeError(f"Тип {type(value).__name__} не поддерживается в запросе OData")
+
+def odata_condition(field: str, operator: str, value: Any) -> str:
+    """
+    Условие сравнения поля со значением
+    
+    Args:
+        field: Имя поля
+        operator: Оператор из ODATA_OPERATORS
+        value: Значение (см. odata_literal)
+    """
+    if operator not in ODATA_OPERATORS:
+        raise ValueError(f"Неизвестный оператор OData: {operator}")
+    return f"{field} {operator} {odata_literal(value)}"
+
+def odata_in(field: str, values: Sequence[Any]) -> str:
+    """
+    Условие «поле равно одному из значений»
     
-    return f"{entity}{'?' if query_parts else ''}&".join(query_parts) 
\ No newline at end of file
+    Args:
+        field: Имя поля
+        values: Непустой список значений
+    """
+    if not values:
+        raise ValueError(f"Пустой список значений для поля {field}")
+    conditions = [odata_condition(field, "eq", value) for value in values]
+    return conditions[0] if len(conditions) == 1 else f"({' or '.join(conditions)})"
+
+def build_odata_query(
+    filters: Sequence[Optional[str]] = (),
+    select: Optional[Sequence[str]] = None,
+    expand: Optional[Dict[str, Sequence[str]]] = None,
+    orderby: Optional[Sequence[str]] = None,
+    top: Optional[int] = None
+) -> Dict[str, str]:
+    """
+    Параметры запроса OData; пустые части в запрос не попадают
+    
+    Args:
+        filters: Условия (odata_condition, odata_in), объединяются через and; None пропускаются
+        select: Поля для выборки
+        expand: Табличная часть -> поля ее строк
+        orderby: Поля для сортировки (только если порядок нужен)
+        top: Ограничение количества записей
+    
+    Returns:
+        Параметры для requests (значения кодируются при отправке)
+    """
+    params = {}
+    conditions = [condition for condition in filters if condition]
+    if conditions:
+        params["$filter"] = " and ".join(conditions)
+    if select:
+        params["$select"] = ",".join(select)
+    if expand:
+        params["$expand"] = ",".join(
+            f"{name}($select={','.join(fields)})" if fields else name
+            for name, fields in expand.items()
+        )
+    if orderby:
+        params["$orderby"] = ",".join(orderby)
+    if top is not None:
+        params["$top"] = str(top)
+    return params
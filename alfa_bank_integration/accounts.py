@@ -0,0 +1,113 @@
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import RequestException
+from api import fetch_account_statement
+from config import settings
+from db import get_bank_accounts, get_inn_organizations
+from common.http_policy import CircuitOpenError
+from main import TransactionValidator
+from ingest import merge_rejections
+from metrics import ACCOUNT_SYNC_LATENCY
+from common.write_queue import writer, WriteJobError, WriteTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Ожидаемые сбои загрузки счета: связь с банком, справочник, очередь записи
+EXPECTED_ERRORS = (RequestException, CircuitOpenError, ValueError, WriteJobError, WriteTimeoutError)
+
+
+def _sync_account(account, inn, organizations, cursor):
+    # Загрузка выписки одного счета и запись через очередь записи; сбой счета
+    # не затрагивает остальные: его курсор не сдвигается, итог сохраняется в bank_accounts
+    started = time.perf_counter()
+    organization = organizations.get(inn)
+    result = {
+        "account": account,
+        "organization": organization,
+        "status": "error",
+        "fetched": 0,
+        "validated": 0,
+        "saved": 0,
+        "duplicates": 0,
+        "rejected": 0,
+        "rejected_reasons": {},
+        "error": None
+    }
+    items = []
+    transactions = []
+    state = {"account": account, "organization": organization, "cursor": None, "fetched_rows": 0}
+    try:
+        if organization is None:
+            raise ValueError(f"ИНН {inn} нет в справочнике organizations")
+        items, next_cursor, pages = fetch_account_statement(account, cursor)
+        validator = TransactionValidator(organizations, organization=organization)
+        transactions = validator.validate(items)
+        report = validator.report()
+        written = writer.call(
+            "statements",
+            dict(state, cursor=next_cursor, status="success", error=None, fetched_rows=len(items), transactions=transactions),
+            rows=max(len(transactions), 1)
+        )
+        report = merge_rejections(report, written)
+        result.update(
+            status="success",
+            fetched=len(items),
+            validated=len(transactions),
+            saved=written["saved"],
+            duplicates=written["duplicates"],
+            rejected=report["rejected"],
+            rejected_reasons=report["reasons"]
+        )
+        logger.info(
+            "Счет %s (%s): страниц %d, получено %d, сохранено %d, дубликатов %d, пропущено %d",
+            account, organization, pages, len(items), written["saved"], written["duplicates"], report["rejected"]
+        )
+    except Exception as e:
+        # Любой сбой счета остается в его итоге; трассировка — только для непредвиденных
+        # (например, неожиданный формат ответа банка)
+        result["error"] = str(e) or type(e).__name__
+        logger.error(
+            "Ошибка загрузки выписки счета %s: %s", account, result["error"],
+            exc_info=not isinstance(e, EXPECTED_ERRORS)
+        )
+        if not isinstance(e, (WriteJobError, WriteTimeoutError)):
+            try:
+                writer.call("statements", dict(state, status="error", error=result["error"], transactions=[]))
+            except (WriteJobError, WriteTimeoutError) as write_error:
+                logger.error("Не сохранен итог загрузки счета %s: %s", account, write_error)
+    ACCOUNT_SYNC_LATENCY.labels(account=account, status=result["status"]).observe(time.perf_counter() - started)
+    return result, items, transactions
+
+
+def sync_accounts():
+    # Выписки всех счетов ACCOUNTS параллельно (не больше ACCOUNT_FETCH_CONCURRENCY),
+    # каждая со своего курсора; частота запросов ограничена общим HTTP_RATE_LIMIT.
+    # Каждый счет записывается сразу по готовности, не дожидаясь медленных.
+    # Возвращает итоги по счетам, все полученные и все валидные платежи и сводку
+    # отказов проверки. Организации, добавленные в справочник, подхватываются
+    # при каждой синхронизации
+    organizations = get_inn_organizations(refresh=True)
+    cursors = {state["account"]: state["cursor"] for state in get_bank_accounts()}
+    accounts = list(settings.ACCOUNTS.items())
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.ACCOUNT_FETCH_CONCURRENCY, len(accounts)))) as pool:
+        outcomes = list(pool.map(
+            lambda account: _sync_account(account[0], account[1], organizations, cursors.get(account[0])),
+            accounts
+        ))
+
+    results = [result for result, _, _ in outcomes]
+    raw_items = [item for _, items, _ in outcomes for item in items]
+    transactions = [tx for _, _, account_transactions in outcomes for tx in account_transactions]
+    reasons = Counter()
+    for result in results:
+        reasons.update(result["rejected_reasons"])
+    if reasons:
+        logger.warning(
+            "Пропущено %d транзакций: %s",
+            sum(reasons.values()),
+            "; ".join(f"{reason} — {count}" for reason, count in reasons.most_common())
+        )
+    report = {"total": len(raw_items), "rejected": sum(reasons.values()), "reasons": dict(reasons.most_common())}
+    return results, raw_items, transactions, report
@@ -1,8 +1,37 @@
+import time
 import requests
 from config import settings
-from auth import get_access_token
+from auth import get_access_token, bank_policy
+from common.http_policy import OutboundPolicy
+from metrics import BANK_REQUEST_LATENCY
+from common.rate_limit import RateLimiter
 
-def fetch_bank_transactions():
+# Общий для всех счетов и потоков процесса лимит запросов выписок
+rate_limiter = RateLimiter(settings.HTTP_RATE_LIMIT)
+
+# Политики запросов выписок по счетам: свой выключатель у каждого счета,
+# лимит параллельности общий с bank_policy
+_account_policies = {}
+
+def account_policy(account):
+    policy = _account_policies.get(account)
+    if policy is None:
+        policy = _account_policies.setdefault(account, OutboundPolicy(
+            f"alfa_bank:{account}",
+            connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+            read_timeout=settings.HTTP_READ_TIMEOUT,
+            max_retries=settings.HTTP_MAX_RETRIES,
+            backoff_base=settings.HTTP_BACKOFF_BASE,
+            backoff_max=settings.HTTP_BACKOFF_MAX,
+            circuit_failures=settings.HTTP_CIRCUIT_FAILURES,
+            circuit_reset=settings.HTTP_CIRCUIT_RESET,
+            max_concurrency=settings.HTTP_MAX_CONCURRENCY,
+            latency_target=settings.HTTP_LATENCY_TARGET,
+            limiter=bank_policy.limiter
+        ))
+    return policy
+
+def _get_transactions(policy, params=None):
     token = get_access_token()
     url = f"{settings.API_BASE_URL}/transactions"  # используем settings.API_BASE_URL
 
@@ -11,6 +40,41 @@ def fetch_bank_transactions():
         "Accept": "application/json"
     }
 
-    response = requests.get(url, headers=headers, cert=(settings.CERT_PATH, settings.KEY_PATH))  # используем settings
-    response.raise_for_status()
-    return response.json()
\ No newline at end of file
+    started = time.perf_counter()
+    status = "error"
+    try:
+        # Лимит частоты соблюдается для каждой попытки, включая повторы политики
+        response = policy.request("GET", url, rate_limiter=rate_limiter, params=params, headers=headers, cert=(settings.CERT_PATH, settings.KEY_PATH))  # используем settings
+        status = str(response.status_code)
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        if e.response is not None:
+            status = str(e.response.status_code)
+        raise
+    finally:
+        BANK_REQUEST_LATENCY.labels(endpoint="transactions", status=status).observe(time.perf_counter() - started)
+
+def fetch_bank_transactions():
+    # Общая выписка по всем счетам (без ACCOUNTS)
+    return _get_transactions(bank_policy)
+
+def fetch_account_statement(account, cursor=None):
+    # Выписка счета с курсора прошлой синхронизации: страницы запрашиваются,
+    # пока банк возвращает следующий курсор. Возвращает платежи, курсор
+    # для следующей синхронизации (None — не изменился) и число страниц
+    items = []
+    next_cursor = None
+    pages = 0
+    policy = account_policy(account)
+    while pages < settings.ACCOUNT_MAX_PAGES:
+        params = {"accountNumber": account}
+        if cursor:
+            params["cursor"] = cursor
+        data = _get_transactions(policy, params)
+        pages += 1
+        page = data.get("transactions", [])
+        items.extend(page)
+        if not page or not data.get("nextCursor") or data["nextCursor"] == cursor:
+            break
+        cursor = next_cursor = data["nextCursor"]
+    return items, next_cursor, pages
@@ -1,28 +1,89 @@
+import asyncio
 import os
 import json
-import sqlite3
-from fastapi import FastAPI, Query
-from db import init_db, save_transaction, update_monthly_balance
-from api import fetch_bank_transactions
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from datetime import datetime
+from fastapi import FastAPI, Query, Request
+from db import (
+    init_db,
+    get_connection,
+    get_history_connection,
+    get_partitions,
+    get_bank_accounts,
+    get_inn_organizations,
+    get_data_version,
+    date_keys,
+    from_kopecks,
+    search_match_expression,
+    closed_years,
+    EXPORT_TABLES
+)
 from contextlib import asynccontextmanager
-from typing import Optional
-from main import parse_transactions, validate_transaction, detect_organization, normalize_method
-from fastapi.responses import JSONResponse
+from typing import Literal, Optional
+from main import parse_transactions, TransactionValidator, detect_organization, normalize_method
+from common.write_queue import writer, WriteJobError
+import ingest  # регистрация обработчика записи платежей
+from common.maintenance import size_report
+from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from config import settings
+from metrics import metrics_middleware, metrics_response, track_stage, record_sync_result, INGEST_REJECTED
+from common.query_profiler import get_query_stats, reset_query_stats
+from common.logging_config import setup_logging
+from common.warmup import warmup
+from common.change_feed import changes_response
+from common.compression import CompressionMiddleware, response_cache
+from common.columnar_export import load_arrow, export_snapshots, list_partitions, partition_file, PARQUET_MEDIA_TYPE
 from schemas import (
     TransactionsResponse,
     TransactionSummaryResponse,
     DailyReportResponse,
     MonthlyBalanceResponse,
     SyncResponse,
-    MethodType
+    MethodType,
+    QueryStatsResponse,
+    ExportResponse,
+    ExportManifestResponse,
+    TransactionSearchResponse,
+    WebhookResponse,
+    WriteQueueStatusResponse,
+    YearPartitionsResponse,
+    PartitionsChangeResponse,
+    MaintenanceResponse,
+    DatabaseSizeResponse,
+    BankAccountsResponse,
+    HealthCheckResponse,
+    ReadinessResponse
 )
 
+def _warm_modules():
+    # Модули, отложенные при старте: клиент банка (requests) и pyarrow
+    import accounts  # noqa: F401
+    load_arrow()
+
+def _warmup_steps():
+    # Шаги прогрева: модули, справочник ИНН, готовые ответы последних платежей и остатков
+    return [
+        ("modules", _warm_modules),
+        ("organizations", lambda: get_inn_organizations(refresh=True)),
+        ("transactions", lambda: _transactions_payload(None, 100)),
+        ("monthly_balance", lambda: _monthly_balance_payload(None)),
+    ]
+
 @asynccontextmanager
 async def lifespan(app):
+    setup_logging(settings.LOG_FILE)
     init_db()
+    # Писателем становится один процесс из нескольких; остальные только ставят задания
+    writer.start()
+    # Тяжелые модули и кэши загружаются в фоне; /ready ответит 200 после прогрева
+    warmup.start(_warmup_steps(), settings.WARMUP_ENABLED)
     yield
+    writer.stop()
 
 app = FastAPI(title="Alfa Bank API", lifespan=lifespan)
 
@@ -35,27 +96,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.get("/transactions", response_model=TransactionsResponse)
-def get_transactions(
-    organization: Optional[str] = Query(None, min_length=1, max_length=100),
-    limit: int = Query(100, gt=0)
-):
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+# Сжатие ответов br / gzip по Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Замер латентности запросов по маршрутам
+app.middleware("http")(metrics_middleware)
+
+def _transactions_payload(organization, limit):
+    # Готовый ответ (и его сжатые варианты) используется до следующей записи
+    key = (organization, limit)
+    version = get_data_version()
+    cached = response_cache.lookup("transactions", key, version)
+    if cached is not None:
+        return cached
+
+    # Последние платежи — из открытых лет в основной базе
+    conn = get_connection()
     cur = conn.cursor()
 
-    if organization:
+    if organization is not None:
         cur.execute("""
-            SELECT organization, operation, method, amount, date, external_id, created_at, counterparty, purpose
-            FROM finance_transactions
-            WHERE organization = ?
-            ORDER BY date DESC
+            SELECT o.name, t.operation, t.method, t.amount, t.date, t.external_id, t.created_at, c.name, t.purpose
+            FROM finance_transactions t
+            JOIN organizations o ON o.id = t.organization_id
+            LEFT JOIN counterparties c ON c.id = t.counterparty_id
+            WHERE o.name = ?
+            ORDER BY t.day_key DESC
             LIMIT ?
-        """, (organization.strip(), limit))
+        """, (organization, limit))
     else:
         cur.execute("""
-            SELECT organization, operation, method, amount, date, external_id, created_at, counterparty, purpose
-            FROM finance_transactions
-            ORDER BY date DESC
+            SELECT o.name, t.operation, t.method, t.amount, t.date, t.external_id, t.created_at, c.name, t.purpose
+            FROM finance_transactions t
+            LEFT JOIN organizations o ON o.id = t.organization_id
+            LEFT JOIN counterparties c ON c.id = t.counterparty_id
+            ORDER BY t.day_key DESC
             LIMIT ?
         """, (limit,))
 
@@ -67,7 +142,7 @@ def get_transactions(
             "organization": row[0],
             "operation": row[1],
             "method": row[2],
-            "amount": row[3],
+            "amount": from_kopecks(row[3]),
             "date": row[4],
             "external_id": row[5],
             "created_at": row[6],
@@ -76,7 +151,15 @@ def get_transactions(
         }
         for row in rows
     ]
-    return {"data": result}
+    return response_cache.store("transactions", key, version, TransactionsResponse(data=result))
+
+@app.get("/transactions", response_model=TransactionsResponse)
+def get_transactions(
+    request: Request,
+    organization: Optional[str] = Query(None, min_length=1, max_length=100),
+    limit: int = Query(100, gt=0)
+):
+    return _transactions_payload(organization.strip() if organization else None, limit).response(request)
 
 @app.get("/transactions/summary", response_model=TransactionSummaryResponse)
 def get_transaction_summary(
@@ -85,30 +168,39 @@ def get_transaction_summary(
     end_date: Optional[str] = None,
     limit: int = Query(100, gt=0)
 ):
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    # Фильтры по периоду работают по ключу дня
+    try:
+        start_key = date_keys(start_date)[1] if start_date else None
+        end_key = date_keys(end_date)[1] if end_date else None
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Дата должна быть в формате YYYY-MM-DD"})
+
+    conn = get_history_connection(start_key, end_key)
     cur = conn.cursor()
 
     base_query = """
-        SELECT date, operation, method, amount, organization, counterparty, purpose, created_at
-        FROM finance_transactions
+        SELECT t.date, t.operation, t.method, t.amount, o.name, c.name, t.purpose, t.created_at
+        FROM finance_transactions t
+        LEFT JOIN organizations o ON o.id = t.organization_id
+        LEFT JOIN counterparties c ON c.id = t.counterparty_id
     """
     filters = []
     params = []
 
     if organization:
-        filters.append("organization = ?")
+        filters.append("o.name = ?")
         params.append(organization.strip())
-    if start_date:
-        filters.append("date >= ?")
-        params.append(start_date)
-    if end_date:
-        filters.append("date <= ?")
-        params.append(end_date)
+    if start_key:
+        filters.append("t.day_key >= ?")
+        params.append(start_key)
+    if end_key:
+        filters.append("t.day_key <= ?")
+        params.append(end_key)
 
     if filters:
         base_query += " WHERE " + " AND ".join(filters)
 
-    base_query += " ORDER BY date DESC LIMIT ?"
+    base_query += " ORDER BY t.day_key DESC LIMIT ?"
     params.append(limit)
 
     cur.execute(base_query, tuple(params))
@@ -120,7 +212,7 @@ def get_transaction_summary(
             "date": row[0],
             "operation": row[1],
             "method": row[2],
-            "amount": row[3],
+            "amount": from_kopecks(row[3]),
             "organization": row[4],
             "counterparty": row[5],
             "purpose": row[6],
@@ -130,18 +222,140 @@ def get_transaction_summary(
     ]
     return {"data": result}
 
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def _decode_cursor(cursor):
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(cursor)
+    return values
+
+@app.get("/transactions/search", response_model=TransactionSearchResponse)
+def search_transactions(
+    q: str = Query(..., min_length=1, max_length=200),
+    organization: Optional[str] = Query(None, min_length=1, max_length=100),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    sort: Literal["relevance", "recent"] = "relevance",
+    cursor: Optional[str] = None,
+    limit: int = Query(50, gt=0, le=500)
+):
+    # Поиск по словам назначения платежа и контрагента через индекс FTS5.
+    # relevance — по рангу BM25, recent — сначала последние загруженные
+    # (порядок самого индекса, не зависит от числа совпадений);
+    # следующая страница — по курсору из предыдущего ответа.
+    # Индекс ведется по основной базе: платежи закрытых лет не ищутся, такие годы
+    # периода перечисляются в unsearched_years (для поиска год открывается заново).
+    # Отдельные индексы в файлах лет не объединяются: ранги BM25 разных индексов
+    # несравнимы, и порядок по релевантности был бы случайным
+    match = search_match_expression(q)
+    if not match:
+        return JSONResponse(status_code=400, content={"error": "Запрос не содержит слов"})
+    try:
+        start_key = date_keys(start_date)[1] if start_date else None
+        end_key = date_keys(end_date)[1] if end_date else None
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Дата должна быть в формате YYYY-MM-DD"})
+    try:
+        after = _decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return JSONResponse(status_code=400, content={"error": "Некорректный курсор"})
+
+    query = """
+        SELECT
+            t.id, t.date, o.name, t.operation, t.method, t.amount, c.name, t.purpose,
+            t.external_id, bm25(finance_transactions_search),
+            snippet(finance_transactions_search, 0, '[', ']', '…', 16)
+        FROM finance_transactions_search
+        JOIN finance_transactions t ON t.id = finance_transactions_search.rowid
+        LEFT JOIN organizations o ON o.id = t.organization_id
+        LEFT JOIN counterparties c ON c.id = t.counterparty_id
+        WHERE finance_transactions_search MATCH ?
+    """
+    params = [match]
+
+    if organization:
+        query += " AND t.organization_id = (SELECT id FROM organizations WHERE name = ?)"
+        params.append(organization.strip())
+    if start_key:
+        query += " AND t.day_key >= ?"
+        params.append(start_key)
+    if end_key:
+        query += " AND t.day_key <= ?"
+        params.append(end_key)
+
+    # Постраничный вывод по рангу и id или только по id
+    if sort == "relevance":
+        if after:
+            query += """
+                AND (bm25(finance_transactions_search) > ?
+                    OR (bm25(finance_transactions_search) = ? AND finance_transactions_search.rowid > ?))
+            """
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY bm25(finance_transactions_search), finance_transactions_search.rowid"
+    else:
+        if after:
+            query += " AND finance_transactions_search.rowid < ?"
+            params.append(after[1])
+        query += " ORDER BY finance_transactions_search.rowid DESC"
+    query += " LIMIT ?"
+    params.append(limit + 1)
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        unsearched_years = sorted(
+            year for year in closed_years(conn)
+            if (start_key or 0) // 10000 <= year <= (end_key or 99999999) // 10000
+        )
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor([last[9] if sort == "relevance" else None, last[0]])
+
+    result = [
+        {
+            "id": row[0],
+            "date": row[1],
+            "organization": row[2],
+            "operation": row[3],
+            "method": row[4],
+            "amount": from_kopecks(row[5]),
+            "counterparty": row[6],
+            "purpose": row[7],
+            "external_id": row[8],
+            "rank": row[9],
+            "snippet": row[10]
+        }
+        for row in rows
+    ]
+    return {"data": result, "next_cursor": next_cursor, "unsearched_years": unsearched_years}
+
 @app.get("/api/daily_report", response_model=DailyReportResponse)
 def get_daily_report():
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    conn = get_history_connection()
     cur = conn.cursor()
 
+    # Дни старше срока хранения есть только в итогах по дням
     cur.execute("""
-        SELECT date, organization,
-            SUM(CASE WHEN operation = 'Поступление' THEN amount ELSE 0 END) as total_income,
-            SUM(CASE WHEN operation = 'Списание' THEN amount ELSE 0 END) as total_expense
-        FROM finance_transactions
-        GROUP BY date, organization
-        ORDER BY date DESC
+        SELECT MIN(t.date), o.name,
+            SUM(CASE WHEN t.operation = 'Поступление' THEN t.amount ELSE 0 END) as total_income,
+            SUM(CASE WHEN t.operation = 'Списание' THEN t.amount ELSE 0 END) as total_expense
+        FROM (
+            SELECT day_key, date, organization_id, operation, amount FROM finance_transactions
+            UNION ALL
+            SELECT day_key, date, organization_id, operation, amount FROM finance_daily_totals
+        ) t
+        LEFT JOIN organizations o ON o.id = t.organization_id
+        GROUP BY t.day_key, t.organization_id
+        ORDER BY t.day_key DESC
     """)
     rows = cur.fetchall()
     conn.close()
@@ -150,32 +364,36 @@ def get_daily_report():
         {
             "date": row[0],
             "organization": row[1],
-            "total_income": round(row[2], 2),
-            "total_expense": round(row[3], 2)
+            "total_income": from_kopecks(row[2]),
+            "total_expense": from_kopecks(row[3])
         }
         for row in rows
     ]
     return {"data": result}
 
-@app.get("/api/monthly_balance", response_model=MonthlyBalanceResponse)
-def get_monthly_balance(
-    organization: Optional[str] = Query(None, min_length=1, max_length=100)
-):
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+def _monthly_balance_payload(organization):
+    version = get_data_version()
+    cached = response_cache.lookup("monthly_balance", organization, version)
+    if cached is not None:
+        return cached
+
+    conn = get_connection()
     cur = conn.cursor()
 
-    if organization:
+    if organization is not None:
         cur.execute("""
-            SELECT organization, date, balance
-            FROM monthly_balance
-            WHERE organization = ?
-            ORDER BY date
-        """, (organization.strip(),))
+            SELECT o.name, b.date, b.balance
+            FROM monthly_balance b
+            JOIN organizations o ON o.id = b.organization_id
+            WHERE o.name = ?
+            ORDER BY b.day_key
+        """, (organization,))
     else:
         cur.execute("""
-            SELECT organization, date, balance
-            FROM monthly_balance
-            ORDER BY organization, date
+            SELECT o.name, b.date, b.balance
+            FROM monthly_balance b
+            LEFT JOIN organizations o ON o.id = b.organization_id
+            ORDER BY o.name, b.day_key
         """)
 
     rows = cur.fetchall()
@@ -185,11 +403,18 @@ def get_monthly_balance(
         {
             "organization": row[0],
             "date": row[1],
-            "balance": round(row[2], 2)
+            "balance": from_kopecks(row[2])
         }
         for row in rows
     ]
-    return {"data": result}
+    return response_cache.store("monthly_balance", organization, version, MonthlyBalanceResponse(data=result))
+
+@app.get("/api/monthly_balance", response_model=MonthlyBalanceResponse)
+def get_monthly_balance(
+    request: Request,
+    organization: Optional[str] = Query(None, min_length=1, max_length=100)
+):
+    return _monthly_balance_payload(organization.strip() if organization else None).response(request)
 
 @app.get("/api/incoming_raw")
 def get_incoming_raw():
@@ -206,36 +431,231 @@ def get_incoming_raw():
 
 @app.post("/api/sync", response_model=SyncResponse)
 def sync_data():
+    started = time.perf_counter()
     try:
-        data = fetch_bank_transactions()
+        # Клиент банка (requests) загружается при первой синхронизации или прогревом
+        from accounts import sync_accounts
+        from api import fetch_bank_transactions
+        accounts = None
+        if settings.ACCOUNTS:
+            # Выписки по счетам параллельно; каждый счет записывается писателем
+            # очереди по готовности, сбой одного счета не останавливает остальные
+            with track_stage("fetch"):
+                accounts, raw_items, transactions, report = sync_accounts()
+            data = {"transactions": raw_items}
+            saved_count = sum(account["saved"] for account in accounts)
+            duplicate_count = sum(account["duplicates"] for account in accounts)
+        else:
+            with track_stage("fetch"):
+                data = fetch_bank_transactions()
+
+            with track_stage("validation"):
+                transactions, report = parse_transactions(data)
 
         # Сохраняем "сырые" данные
         with open("raw_transactions.json", "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
 
-        transactions = parse_transactions(data)
-
         # Сохраняем нормализованные данные
         with open("validated_transactions.json", "w", encoding="utf-8") as f:
             json.dump(transactions, f, ensure_ascii=False, indent=2)
 
-        saved_count = 0
-        for tx in transactions:
-            save_transaction(tx)
-            saved_count += 1
+        if accounts is None:
+            # Запись выполняет писатель очереди (возможно, в другом процессе);
+            # он же пересчитывает остатки и публикует изменения
+            with track_stage("db_write"):
+                result = writer.call("transactions", transactions, rows=len(transactions))
+            saved_count = result["saved"]
+            duplicate_count = result["duplicates"]
+            report = ingest.merge_rejections(report, result)
 
-        update_monthly_balance()
+        raw_count = report["total"]
+        elapsed = time.perf_counter() - started
+        record_sync_result(saved_count, duplicate_count, report["rejected"], elapsed)
+        logging.info(
+            "Синхронизация завершена за %.1f с: получено %d, валидных %d, сохранено %d, дубликатов %d",
+            elapsed, raw_count, len(transactions), saved_count, duplicate_count
+        )
 
+        failed = [account for account in accounts or [] if account["status"] != "success"]
+        if accounts and len(failed) == len(accounts):
+            return {
+                "status": "error",
+                "error": "; ".join(f"{account['account']}: {account['error']}" for account in failed),
+                "accounts": accounts
+            }
         return {
             "status": "success",
-            "raw_count": len(data.get("transactions", [])),
+            "raw_count": raw_count,
             "validated_count": len(transactions),
             "saved_count": saved_count,
-            "organizations": list({tx["organization"] for tx in transactions})
+            "rejected_count": report["rejected"],
+            "rejected_reasons": report["reasons"],
+            "organizations": list({tx["organization"] for tx in transactions}),
+            "accounts": accounts
         }
 
     except Exception as e:
+        logging.error("Ошибка синхронизации: %s", e)
         return {
             "status": "error",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+@app.get("/accounts", response_model=BankAccountsResponse)
+def list_bank_accounts():
+    # Счета с выписками по ACCOUNTS: курсор и итог последней загрузки каждого счета
+    return {"accounts": get_bank_accounts()}
+
+# Ошибок проверки в ответе webhook, остальные только считаются
+WEBHOOK_ERRORS_SHOWN = 20
+
+@app.post("/webhook/transactions", response_model=WebhookResponse, status_code=202)
+async def receive_transactions(request: Request):
+    # Прием платежей от банка: один платеж, список или {"transactions": [...]}.
+    # Тело подписывается HMAC-SHA256 ключом WEBHOOK_SECRET (заголовок X-Signature: sha256=<hex>).
+    # Платежи записываются пачками в фоне; при заполненной очереди — 429
+    if not settings.WEBHOOK_SECRET:
+        return JSONResponse(status_code=503, content={"error": "Прием платежей не настроен"})
+
+    body = await request.body()
+    expected = hmac.new(settings.WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    signature = request.headers.get("x-signature", "").removeprefix("sha256=")
+    if not hmac.compare_digest(signature, expected):
+        return JSONResponse(status_code=401, content={"error": "Неверная подпись"})
+
+    try:
+        payload = json.loads(body)
+    except json.JSONDecodeError:
+        return JSONResponse(status_code=400, content={"error": "Тело запроса не JSON"})
+    if isinstance(payload, dict):
+        items = payload["transactions"] if isinstance(payload.get("transactions"), list) else [payload]
+    elif isinstance(payload, list):
+        items = payload
+    else:
+        return JSONResponse(status_code=400, content={"error": "Ожидается платеж или список платежей"})
+
+    validator = TransactionValidator(errors_kept=WEBHOOK_ERRORS_SHOWN)
+    accepted = validator.validate(items)
+    report = validator.report()
+    if report["rejected"]:
+        INGEST_REJECTED.labels(reason="invalid").inc(report["rejected"])
+
+    if accepted and await asyncio.to_thread(
+        writer.submit, "transactions", accepted, len(accepted), settings.INGEST_QUEUE_SIZE
+    ) is None:
+        INGEST_REJECTED.labels(reason="queue_full").inc(len(accepted))
+        return JSONResponse(
+            status_code=429,
+            content={"error": "Очередь записи заполнена, повторите позже"},
+            headers={"Retry-After": "1"}
+        )
+
+    return JSONResponse(
+        status_code=202 if accepted else 422,
+        content={
+            "status": "accepted" if accepted else "rejected",
+            "accepted": len(accepted),
+            "rejected": report["rejected"],
+            "reasons": report["reasons"],
+            "errors": report["errors"]
+        }
+    )
+
+@app.get("/health", response_model=HealthCheckResponse)
+def health_check():
+    # Процесс жив; готовность принимать трафик — /ready
+    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+
+@app.get("/ready", response_model=ReadinessResponse)
+def readiness_check():
+    # 503, пока идет прогрев после старта: балансировщик не направляет сюда запросы
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.status())
+
+@app.get("/ingest/status", response_model=WriteQueueStatusResponse)
+def get_ingest_status():
+    # Очередь записи: сколько ждет записи и с какой задержкой пишет писатель
+    return writer.status()
+
+@app.get("/partitions", response_model=YearPartitionsResponse)
+def list_year_partitions():
+    # Закрытые годы, вынесенные в отдельные файлы
+    return {"partitions": get_partitions()}
+
+@app.post("/partitions/close", response_model=PartitionsChangeResponse)
+def close_year_partitions():
+    # Закрытие лет, закончившихся больше PARTITION_CLOSE_AFTER_DAYS дней назад:
+    # платежи переносятся в файл года, который оптимизируется и становится только для чтения.
+    # Выполняется писателем очереди записи
+    try:
+        years = writer.call("close_partitions", None)
+    except WriteJobError as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    return {"status": "success", "years": years}
+
+@app.post("/partitions/{year}/reopen", response_model=PartitionsChangeResponse)
+def reopen_year_partition(year: int):
+    # Возврат закрытого года в основную базу для исправлений задним числом;
+    # платежи закрытого года не сохраняются
+    try:
+        result = writer.call("reopen_partition", year)
+    except WriteJobError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return {"status": "success", "years": [result]}
+
+@app.get("/maintenance/size", response_model=DatabaseSizeResponse)
+def get_database_size():
+    # Размер файлов базы, свободное место внутри файла, таблицы и индексы, сроки хранения
+    return size_report()
+
+@app.post("/maintenance/run", response_model=MaintenanceResponse)
+def run_database_maintenance():
+    # Внеочередное обслуживание: сроки хранения со сверткой в итоги по дням,
+    # incremental_vacuum и статистика планировщика. Выполняется писателем очереди записи;
+    # по расписанию — раз в MAINTENANCE_INTERVAL_HOURS часов
+    try:
+        report = writer.call("maintenance", None)
+    except WriteJobError as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    return {"status": "success", **report}
+
+@app.post("/export", response_model=ExportResponse)
+def export_data():
+    # Выгрузка в Parquet по месяцам: перезаписываются только измененные разделы
+    return {"status": "success", "tables": export_snapshots()}
+
+@app.get("/export/{table}", response_model=ExportManifestResponse)
+def get_export_manifest(table: str):
+    if table not in EXPORT_TABLES:
+        return JSONResponse(status_code=404, content={"error": "Таблица не выгружается"})
+    return list_partitions(table)
+
+@app.get("/export/{table}/{partition}")
+def download_export_partition(table: str, partition: str):
+    # Файл раздела отдается как есть, без перекодирования
+    path = partition_file(table, partition)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "Раздел не найден"})
+    return FileResponse(path, media_type=PARQUET_MEDIA_TYPE, filename=f"{table}-{partition}.parquet")
+
+@app.get("/changes")
+async def get_changes(request: Request, last_event_id: Optional[int] = Query(None)):
+    # Лента изменений (Server-Sent Events); номер последнего события — из Last-Event-ID
+    return changes_response(request, last_event_id)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+
+@app.get("/debug/queries", response_model=QueryStatsResponse)
+def query_stats(limit: int = Query(50, gt=0, le=1000)):
+    return {
+        "slow_query_ms": settings.SLOW_QUERY_MS,
+        "data": get_query_stats(limit)
+    }
+
+@app.delete("/debug/queries")
+def clear_query_stats():
+    reset_query_stats()
+    return {"status": "success"}
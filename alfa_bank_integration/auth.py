@@ -1,7 +1,36 @@
+import time
 import requests
 from config import settings
+from metrics import BANK_REQUEST_LATENCY, TOKEN_CACHE_REQUESTS
+from common.http_policy import OutboundPolicy
+
+# Общая политика для всех запросов к API банка: таймауты, повторы,
+# выключатель и адаптивный лимит параллельности
+bank_policy = OutboundPolicy(
+    "alfa_bank",
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.HTTP_READ_TIMEOUT,
+    max_retries=settings.HTTP_MAX_RETRIES,
+    backoff_base=settings.HTTP_BACKOFF_BASE,
+    backoff_max=settings.HTTP_BACKOFF_MAX,
+    circuit_failures=settings.HTTP_CIRCUIT_FAILURES,
+    circuit_reset=settings.HTTP_CIRCUIT_RESET,
+    max_concurrency=settings.HTTP_MAX_CONCURRENCY,
+    latency_target=settings.HTTP_LATENCY_TARGET
+)
+
+# Кэш токена доступа: токен и момент, до которого он считается действительным
+_token_cache = {"token": None, "expires_at": 0.0}
+
+# Запас по времени, чтобы не использовать токен на грани истечения
+TOKEN_EXPIRY_MARGIN = 60
 
 def get_access_token():
+    if _token_cache["token"] and time.monotonic() < _token_cache["expires_at"]:
+        TOKEN_CACHE_REQUESTS.labels(result="hit").inc()
+        return _token_cache["token"]
+    TOKEN_CACHE_REQUESTS.labels(result="miss").inc()
+
     data = {
         "grant_type": "client_credentials",
         "client_id": settings.CLIENT_ID,
@@ -10,11 +39,25 @@ def get_access_token():
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
-    response = requests.post(
-        settings.TOKEN_URL,
-        data=data,
-        headers=headers,
-        cert=(settings.CERT_PATH, settings.KEY_PATH)
-    )
-    response.raise_for_status()
-    return response.json()["access_token"]
\ No newline at end of file
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = bank_policy.request(
+            "POST",
+            settings.TOKEN_URL,
+            data=data,
+            headers=headers,
+            cert=(settings.CERT_PATH, settings.KEY_PATH)
+        )
+        status = str(response.status_code)
+    except requests.exceptions.RequestException as e:
+        if e.response is not None:
+            status = str(e.response.status_code)
+        raise
+    finally:
+        BANK_REQUEST_LATENCY.labels(endpoint="token", status=status).observe(time.perf_counter() - started)
+
+    payload = response.json()
+    _token_cache["token"] = payload["access_token"]
+    _token_cache["expires_at"] = time.monotonic() + max(int(payload.get("expires_in", 0)) - TOKEN_EXPIRY_MARGIN, 0)
+    return _token_cache["token"]
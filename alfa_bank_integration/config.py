@@ -1,5 +1,3 @@
-import os
-from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +10,64 @@ class Settings(BaseSettings):
     API_BASE_URL: str | None = None
     DATABASE_PATH: str | None = None
     SCOPE: str | None = None
+    # Политика запросов к API банка
+    HTTP_CONNECT_TIMEOUT: float = 5.0  # Таймаут соединения, с
+    HTTP_READ_TIMEOUT: float = 60.0  # Таймаут чтения ответа, с
+    HTTP_MAX_RETRIES: int = 4  # Повторов при временных ошибках
+    HTTP_BACKOFF_BASE: float = 0.5  # Базовая задержка перед повтором, с
+    HTTP_BACKOFF_MAX: float = 30.0  # Максимальная задержка перед повтором, с
+    HTTP_CIRCUIT_FAILURES: int = 5  # Ошибок подряд до размыкания выключателя
+    HTTP_CIRCUIT_RESET: float = 30.0  # Время до пробного запроса после размыкания, с
+    HTTP_MAX_CONCURRENCY: int = 4  # Верхняя граница адаптивного лимита параллельных запросов
+    HTTP_LATENCY_TARGET: float = 5.0  # Латентность, выше которой лимит снижается, с
+    HTTP_RATE_LIMIT: float = 10.0  # Максимум запросов выписок в секунду на процесс (0 — без ограничения)
+    # Выписки по счетам: у каждого счета свой курсор, счета загружаются параллельно
+    ACCOUNTS: dict[str, str] = {}  # Номер счета -> ИНН организации (справочник organizations); пусто — одна общая выписка
+    ACCOUNT_FETCH_CONCURRENCY: int = 4  # Счетов, загружаемых одновременно
+    ACCOUNT_MAX_PAGES: int = 1000  # Страниц выписки одного счета за синхронизацию
+    # Прогрев после старта: модули и кэши ответов; до его окончания /ready отвечает 503
+    WARMUP_ENABLED: bool = True
+    # Логирование
+    LOG_FILE: str = "app.log"
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000  # Размер очереди записей для фонового потока
+    LOG_DEBUG_SAMPLE_EVERY: int = 100  # В лог попадает каждая N-я DEBUG-запись одного шаблона
+    # Профилирование запросов SQLite
+    QUERY_PROFILING: bool = True
+    SLOW_QUERY_MS: float = 100.0  # Порог медленного запроса, мс
+    # Выгрузка снимков в Parquet
+    EXPORT_DIR: str = "exports"
+    EXPORT_COMPRESSION: str = "zstd"
+    # Лента изменений (Server-Sent Events)
+    CHANGE_FEED_HISTORY: int = 1000  # Событий в истории для продолжения подписки
+    CHANGE_FEED_BUFFER: int = 256  # Очередь одного подписчика; при переполнении — reset
+    CHANGE_FEED_HEARTBEAT: float = 15.0  # Интервал пустых сообщений, с
+    CHANGE_FEED_RETRY_MS: int = 5000  # Пауза переподключения клиента, мс
+    # Прием платежей через webhook
+    WEBHOOK_SECRET: str | None = None  # Ключ подписи HMAC-SHA256; без него прием выключен
+    INGEST_QUEUE_SIZE: int = 10000  # Платежей в очереди записи; при заполнении — ответ 429
+    # Очередь записи: в несколько процессов пишет только один (блокировка файла очереди)
+    WRITE_QUEUE_PATH: str | None = None  # База-очередь; по умолчанию <ALFA_DATABASE_PATH>.queue
+    WRITER_ENABLED: bool = True  # Процесс может стать писателем; false — только чтение и постановка заданий
+    WRITE_BATCH_ROWS: int = 500  # Строк в одной групповой записи
+    WRITE_FLUSH_MS: int = 200  # Ожидание накопления неполной пачки, мс
+    WRITE_WAIT_TIMEOUT: float = 300.0  # Ожидание результата задания запросом API, с
+    WRITE_RESULT_TTL: float = 3600.0  # Хранение выполненных заданий, с
+    WRITE_MAX_ATTEMPTS: int = 5  # Попыток записи задания, которое база не принимает, до отметки об ошибке
+    WRITE_RETRY_MAX_SECONDS: float = 30.0  # Наибольшая задержка между попытками, с
+    # Закрытые годы хранятся в отдельных файлах <база>.<год> только для чтения
+    PARTITION_CLOSE_AFTER_DAYS: int = 90  # Год закрывается через столько дней после окончания
+    # Обслуживание базы: сроки хранения, освобождение места, статистика планировщика
+    RETENTION_DAYS: dict[str, int] = {}  # Таблица (RETENTION_TABLES в db.py) -> дней хранения строк; пусто — все
+    RETENTION_ARCHIVE: bool = True  # Перед удалением строки выгружаются в Parquet (EXPORT_DIR)
+    MAINTENANCE_INTERVAL_HOURS: float = 24.0  # Период обслуживания писателем очереди; 0 — только по запросу
+    MAINTENANCE_VACUUM_PAGES: int = 0  # Страниц, освобождаемых за одно обслуживание; 0 — все свободные
+    # Сжатие ответов: br (при установленном brotli) или gzip по Accept-Encoding
+    COMPRESSION_MIN_SIZE: int = 1024  # Ответы меньше этого размера не сжимаются, байт
+    COMPRESSION_STREAM_SIZE: int = 262144  # Ответ больше этого размера сжимается и отдается частями, байт
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    RESPONSE_CACHE_MAX_BYTES: int = 67108864  # Кэш готовых ответов со сжатыми вариантами на процесс, байт
     class Config:
         env_file = ".env"
         env_prefix = "ALFA_"
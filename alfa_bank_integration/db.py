@@ -1,11 +1,134 @@
 import sqlite3
 import os
+import re
+import time
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from config import settings
+from common.change_feed import feed
+from metrics import DB_COMMIT_LATENCY
+from common.query_profiler import connect
+from common.partitions import (
+    REGISTRY_SQL, attach_partitions, closed_years, closable_years, close_year, reopen_year, describe_partitions
+)
 
-def init_db():
-    conn = sqlite3.connect(settings.DATABASE_PATH)
-    cur = conn.cursor()
+def get_connection():
+    # Основная база: открытые годы, в нее же идет вся запись
+    return connect(settings.DATABASE_PATH)
+
+def get_history_connection(first_day_key=None, last_day_key=None):
+    # Чтение платежей с закрытыми годами, пересекающимися с периодом (YYYYMMDD, None — без границы);
+    # запросы за последние месяцы закрытые годы не подключают
+    conn = connect(settings.DATABASE_PATH, uri=True)
+    attach_partitions(conn, settings.DATABASE_PATH, "finance_transactions", first_day_key, last_day_key)
+    return conn
+
+# Организации, известные до появления справочника (ИНН -> наименование)
+INITIAL_ORGANIZATIONS = {
+    "1234567890": "ООО",
+    "9876543210": "ИП1",
+    "1122334455": "ИП2",
+    "5566778899": "ИП3"
+}
+UNKNOWN_ORGANIZATION = "Неизвестно"
+
+# Таблицы для выгрузки в Parquet по месяцам (columnar_export.py)
+EXPORT_TABLES = {
+    "finance_transactions": {
+        # Сигнатура раздела по индексу по месяцу
+        "partitions": """
+            SELECT month_key, COUNT(*), MAX(id), TOTAL(id)
+            FROM finance_transactions
+            GROUP BY month_key
+        """,
+        "rows": """
+            SELECT t.id, t.date, t.created_at, o.name, o.inn, t.operation, t.method,
+                t.amount, c.name, t.purpose, CAST(t.external_id AS TEXT)
+            FROM finance_transactions t
+            LEFT JOIN organizations o ON o.id = t.organization_id
+            LEFT JOIN counterparties c ON c.id = t.counterparty_id
+            WHERE t.month_key = ?
+            ORDER BY t.day_key, t.id
+        """,
+        "columns": [
+            ("id", "int64"), ("date", "date"), ("created_at", "timestamp"),
+            ("organization", "string"), ("inn", "string"), ("operation", "string"), ("method", "string"),
+            ("amount_kopecks", "int64"), ("counterparty", "string"), ("purpose", "string"),
+            ("external_id", "string"),
+        ],
+    },
+    "monthly_balance": {
+        # Балансы пересчитываются на месте, поэтому в сигнатуру входят и суммы
+        "partitions": """
+            SELECT day_key / 100, COUNT(*), MAX(id), TOTAL(balance), TOTAL(balance * id)
+            FROM monthly_balance
+            GROUP BY day_key / 100
+        """,
+        "rows": """
+            SELECT b.id, b.date, o.name, b.balance
+            FROM monthly_balance b
+            LEFT JOIN organizations o ON o.id = b.organization_id
+            WHERE b.day_key / 100 = ?
+            ORDER BY b.day_key, b.id
+        """,
+        "columns": [
+            ("id", "int64"), ("date", "date"), ("organization", "string"), ("balance_kopecks", "int64"),
+        ],
+    },
+}
+
+# Сроки хранения строк (maintenance.py, RETENTION_DAYS): платежи старше срока сворачиваются
+# в итоги по дням запросом rollup (параметр — первый хранимый день, {source} — схема основной
+# базы или файла закрытого года) и удаляются; файлы истекших закрытых лет удаляются целиком.
+# Остатки по дням (monthly_balance) хранятся всегда: от них считаются новые остатки
+RETENTION_TABLES = {
+    "finance_transactions": {
+        "partitioned": True,
+        "rollup": """
+            INSERT INTO main.finance_daily_totals (
+                day_key, month_key, date, organization_id, operation, method, transactions, amount
+            )
+            SELECT day_key, month_key, MIN(date), organization_id, operation, method, COUNT(*), SUM(amount)
+            FROM {source}.finance_transactions
+            WHERE day_key < ?
+            GROUP BY day_key, organization_id, operation, method
+        """,
+        "delete": ["DELETE FROM main.finance_transactions WHERE day_key < ?"],
+    },
+}
+
+# Ключ meta с первым хранимым днем таблицы: более ранние строки свернуты в итоги
+RETAINED_FROM_KEY = "retained_from:{}"
+
+# Кэш справочников наименование -> id, заполняется при загрузке
+_dimension_cache = {"organizations": {}, "counterparties": {}}
+# Кэш ИНН -> наименование организации
+_inn_cache = None
+
+def date_keys(value):
+    # Дата YYYY-MM-DD, ключ дня YYYYMMDD и ключ месяца YYYYMM
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], "%Y-%m-%d")
+    return (
+        f"{value.year:04d}-{value.month:02d}-{value.day:02d}",
+        value.year * 10000 + value.month * 100 + value.day,
+        value.year * 100 + value.month
+    )
+
+def to_kopecks(value):
+    # Сумма в рублях -> целые копейки; через строку, чтобы не переносить погрешность float
+    try:
+        amount = Decimal(str(value).strip().replace(",", "."))
+        return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Неверная сумма: {value}")
+
+def from_kopecks(value):
+    # Копейки -> рубли, только для ответов API
+    return None if value is None else value / 100
 
+def _migrate_base_schema(cur):
     # Таблица финансовых транзакций
     cur.execute("""
         CREATE TABLE IF NOT EXISTS finance_transactions (
@@ -32,88 +155,630 @@ def init_db():
         )
     """)
 
-    conn.commit()
-    conn.close()
+def _migrate_date_keys(cur):
+    # Целочисленные ключи дня (YYYYMMDD) и месяца (YYYYMM) для фильтров и группировок
+    cur.execute("ALTER TABLE finance_transactions ADD COLUMN day_key INTEGER")
+    cur.execute("ALTER TABLE finance_transactions ADD COLUMN month_key INTEGER")
+    cur.execute("""
+        UPDATE finance_transactions
+        SET day_key = CAST(replace(substr(date, 1, 10), '-', '') AS INTEGER),
+            month_key = CAST(replace(substr(date, 1, 7), '-', '') AS INTEGER)
+    """)
+    cur.execute("CREATE INDEX idx_finance_transactions_day ON finance_transactions(day_key)")
+    cur.execute("CREATE INDEX idx_finance_transactions_month ON finance_transactions(month_key)")
+    cur.execute("""
+        CREATE INDEX idx_finance_transactions_org_day
+        ON finance_transactions(organization, day_key)
+    """)
+
+    cur.execute("ALTER TABLE monthly_balance ADD COLUMN day_key INTEGER")
+    cur.execute("""
+        UPDATE monthly_balance
+        SET day_key = CAST(replace(substr(date, 1, 10), '-', '') AS INTEGER)
+    """)
+    cur.execute("CREATE INDEX idx_monthly_balance_org_day ON monthly_balance(organization, day_key)")
 
-def save_transaction(tx):
-    conn = sqlite3.connect(settings.DATABASE_PATH)
-    cur = conn.cursor()
+def _migrate_money_to_kopecks(cur):
+    # Суммы и балансы в целых копейках; тип столбца в SQLite не меняется, таблицы пересоздаются
+    cur.execute("""
+        CREATE TABLE finance_transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization TEXT,
+            operation TEXT,
+            method TEXT,
+            amount INTEGER,  -- в копейках
+            date TEXT,
+            counterparty TEXT,
+            purpose TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            external_id INTEGER UNIQUE,
+            day_key INTEGER,
+            month_key INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO finance_transactions_new (
+            id, organization, operation, method, amount, date, counterparty, purpose,
+            created_at, external_id, day_key, month_key
+        )
+        SELECT
+            id, organization, operation, method, CAST(ROUND(amount * 100) AS INTEGER),
+            date, counterparty, purpose, created_at, external_id, day_key, month_key
+        FROM finance_transactions
+    """)
+    cur.execute("DROP TABLE finance_transactions")
+    cur.execute("ALTER TABLE finance_transactions_new RENAME TO finance_transactions")
+    cur.execute("CREATE INDEX idx_finance_transactions_day ON finance_transactions(day_key)")
+    cur.execute("CREATE INDEX idx_finance_transactions_month ON finance_transactions(month_key)")
+    cur.execute("""
+        CREATE INDEX idx_finance_transactions_org_day
+        ON finance_transactions(organization, day_key)
+    """)
+
+    cur.execute("""
+        CREATE TABLE monthly_balance_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization TEXT,
+            date TEXT,
+            balance INTEGER,  -- в копейках
+            day_key INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO monthly_balance_new (id, organization, date, balance, day_key)
+        SELECT id, organization, date, CAST(ROUND(balance * 100) AS INTEGER), day_key
+        FROM monthly_balance
+    """)
+    cur.execute("DROP TABLE monthly_balance")
+    cur.execute("ALTER TABLE monthly_balance_new RENAME TO monthly_balance")
+    cur.execute("CREATE INDEX idx_monthly_balance_org_day ON monthly_balance(organization, day_key)")
+
+def _migrate_dimensions(cur):
+    # Справочники организаций (с ИНН) и контрагентов; в транзакциях и балансах только id
+    cur.execute("""
+        CREATE TABLE organizations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            inn TEXT UNIQUE
+        )
+    """)
+    cur.executemany(
+        "INSERT INTO organizations (name, inn) VALUES (?, ?)",
+        [(name, inn) for inn, name in INITIAL_ORGANIZATIONS.items()] + [(UNKNOWN_ORGANIZATION, None)]
+    )
+    cur.execute("""
+        INSERT OR IGNORE INTO organizations (name)
+        SELECT DISTINCT organization FROM finance_transactions WHERE organization IS NOT NULL
+        UNION
+        SELECT DISTINCT organization FROM monthly_balance WHERE organization IS NOT NULL
+    """)
+    cur.execute("""
+        CREATE TABLE counterparties (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    cur.execute("""
+        INSERT INTO counterparties (name)
+        SELECT DISTINCT counterparty FROM finance_transactions WHERE counterparty IS NOT NULL
+    """)
+
+    cur.execute("""
+        CREATE TABLE finance_transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization_id INTEGER REFERENCES organizations(id),
+            operation TEXT,
+            method TEXT,
+            amount INTEGER,  -- в копейках
+            date TEXT,
+            counterparty_id INTEGER REFERENCES counterparties(id),
+            purpose TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            external_id INTEGER UNIQUE,
+            day_key INTEGER,
+            month_key INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO finance_transactions_new (
+            id, organization_id, operation, method, amount, date, counterparty_id, purpose,
+            created_at, external_id, day_key, month_key
+        )
+        SELECT
+            t.id, o.id, t.operation, t.method, t.amount, t.date, c.id, t.purpose,
+            t.created_at, t.external_id, t.day_key, t.month_key
+        FROM finance_transactions t
+        LEFT JOIN organizations o ON o.name = t.organization
+        LEFT JOIN counterparties c ON c.name = t.counterparty
+    """)
+    cur.execute("DROP TABLE finance_transactions")
+    cur.execute("ALTER TABLE finance_transactions_new RENAME TO finance_transactions")
+    cur.execute("CREATE INDEX idx_finance_transactions_day ON finance_transactions(day_key)")
+    cur.execute("CREATE INDEX idx_finance_transactions_month ON finance_transactions(month_key)")
+    cur.execute("""
+        CREATE INDEX idx_finance_transactions_org_day
+        ON finance_transactions(organization_id, day_key)
+    """)
+
+    cur.execute("""
+        CREATE TABLE monthly_balance_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization_id INTEGER REFERENCES organizations(id),
+            date TEXT,
+            balance INTEGER,  -- в копейках
+            day_key INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO monthly_balance_new (id, organization_id, date, balance, day_key)
+        SELECT b.id, o.id, b.date, b.balance, b.day_key
+        FROM monthly_balance b
+        LEFT JOIN organizations o ON o.name = b.organization
+    """)
+    cur.execute("DROP TABLE monthly_balance")
+    cur.execute("ALTER TABLE monthly_balance_new RENAME TO monthly_balance")
+    cur.execute("CREATE INDEX idx_monthly_balance_org_day ON monthly_balance(organization_id, day_key)")
+
+def _migrate_data_generation(cur):
+    # Счетчик поколения данных: увеличивается после каждой загрузки выписки
+    cur.execute("""
+        CREATE TABLE meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    cur.execute("INSERT INTO meta (key, value) VALUES ('data_generation', 1)")
+
+def _search_text(column):
+    # «ё» индексируется как «е»: unicode61 не снимает с нее диакритику
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+def _migrate_search_index(cur):
+    # Полнотекстовый индекс по назначению платежа и контрагенту.
+    # Текст не дублируется: индекс читает его из представления, а триггеры
+    # поддерживают индекс при изменении платежей
+    cur.execute(f"""
+        CREATE VIEW finance_transactions_search_content AS
+        SELECT t.id, {_search_text("t.purpose")} AS purpose, {_search_text("c.name")} AS counterparty
+        FROM finance_transactions t
+        LEFT JOIN counterparties c ON c.id = t.counterparty_id
+    """)
+    # Префиксные индексы для запросов «слово*»
+    cur.execute("""
+        CREATE VIRTUAL TABLE finance_transactions_search USING fts5(
+            purpose, counterparty,
+            content='finance_transactions_search_content', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    """)
+    values = {
+        row: f"""{row}.id, {_search_text(f"{row}.purpose")},
+                {_search_text(f"(SELECT name FROM counterparties WHERE id = {row}.counterparty_id)")}"""
+        for row in ("new", "old")
+    }
+    cur.execute(f"""
+        CREATE TRIGGER finance_transactions_search_insert AFTER INSERT ON finance_transactions
+        BEGIN
+            INSERT INTO finance_transactions_search (rowid, purpose, counterparty)
+            VALUES ({values["new"]});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER finance_transactions_search_delete AFTER DELETE ON finance_transactions
+        BEGIN
+            INSERT INTO finance_transactions_search (finance_transactions_search, rowid, purpose, counterparty)
+            VALUES ('delete', {values["old"]});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER finance_transactions_search_update AFTER UPDATE OF purpose, counterparty_id ON finance_transactions
+        BEGIN
+            INSERT INTO finance_transactions_search (finance_transactions_search, rowid, purpose, counterparty)
+            VALUES ('delete', {values["old"]});
+            INSERT INTO finance_transactions_search (rowid, purpose, counterparty)
+            VALUES ({values["new"]});
+        END
+    """)
+    cur.execute("INSERT INTO finance_transactions_search (finance_transactions_search) VALUES ('rebuild')")
+
+def _migrate_partitions(cur):
+    # Реестр закрытых лет, вынесенных в отдельные файлы
+    cur.execute(REGISTRY_SQL)
+
+def _migrate_daily_totals(cur):
+    # Итоги по дням для платежей, удаленных по сроку хранения (суммы в копейках)
+    cur.execute("""
+        CREATE TABLE finance_daily_totals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            day_key INTEGER NOT NULL,
+            month_key INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            organization_id INTEGER REFERENCES organizations(id),
+            operation TEXT,
+            method TEXT,
+            transactions INTEGER NOT NULL,
+            amount INTEGER NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX idx_finance_daily_totals_day ON finance_daily_totals(day_key)")
+
+def _migrate_bank_accounts(cur):
+    # Счета с выписками по ACCOUNTS: курсор выписки и итог последней загрузки
+    cur.execute("""
+        CREATE TABLE bank_accounts (
+            account TEXT PRIMARY KEY,
+            organization_id INTEGER REFERENCES organizations(id),
+            cursor TEXT,
+            status TEXT,
+            error TEXT,
+            fetched_rows INTEGER NOT NULL DEFAULT 0,
+            synced_at TEXT
+        )
+    """)
+
+# Миграции схемы по порядку; номер примененной миграции хранится в PRAGMA user_version
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_date_keys,
+    _migrate_money_to_kopecks,
+    _migrate_dimensions,
+    _migrate_data_generation,
+    _migrate_search_index,
+    _migrate_partitions,
+    _migrate_daily_totals,
+    _migrate_bank_accounts,
+]
+
+# Окончания, отбрасываемые у слов поискового запроса: «оплаты» ищется как «оплат*»
+_SEARCH_ENDING = re.compile(r"[аеёиоуыэюяйь]+$")
+
+def search_match_expression(text):
+    # Выражение FTS5 из текста запроса: все слова обязательны, каждое — префикс
+    terms = []
+    for word in re.findall(r"\w+", text.lower().replace("ё", "е")):
+        stem = _SEARCH_ENDING.sub("", word)
+        terms.append(f'"{stem if len(stem) >= 3 else word}"*')
+    return " ".join(terms)
+
+def _dimension_id(cur, table, name):
+    # id значения справочника по наименованию; новое значение добавляется в справочник
+    if name is None:
+        return None
+    cache = _dimension_cache[table]
+    dimension_id = cache.get(name)
+    if dimension_id is None:
+        cur.execute(f"INSERT INTO {table} (name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,))
+        cur.execute(f"SELECT id FROM {table} WHERE name = ?", (name,))
+        dimension_id = cur.fetchone()[0]
+        cache[name] = dimension_id
+    return dimension_id
+
+def _clear_caches():
+    global _inn_cache
+    for cache in _dimension_cache.values():
+        cache.clear()
+    _inn_cache = None
+
+def get_inn_organizations(refresh=False):
+    # Соответствие ИНН -> организация из справочника; новые организации
+    # добавляются строкой в organizations и подхватываются при refresh
+    global _inn_cache
+    if _inn_cache is None or refresh:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT inn, name FROM organizations WHERE inn IS NOT NULL")
+            _inn_cache = dict(cur.fetchall())
+        finally:
+            conn.close()
+    return _inn_cache
+
+def get_bank_accounts():
+    # Состояние выписок по счетам: курсор, итог и время последней загрузки
+    conn = get_connection()
     try:
+        cur = conn.cursor()
         cur.execute("""
-            INSERT INTO finance_transactions (
-                organization, operation, method, amount, date, counterparty, purpose, external_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            tx["organization"],
-            tx["operation"],
-            tx["method"],
-            tx["amount"],
-            tx["date"],
-            tx.get("counterparty"),
-            tx.get("purpose"),
-            tx["external_id"]
-        ))
+            SELECT a.account, o.name, a.cursor, a.status, a.error, a.fetched_rows, a.synced_at
+            FROM bank_accounts a
+            LEFT JOIN organizations o ON o.id = a.organization_id
+            ORDER BY a.account
+        """)
+        return [
+            {
+                "account": account,
+                "organization": organization,
+                "cursor": cursor,
+                "status": status,
+                "error": error,
+                "fetched_rows": fetched_rows,
+                "synced_at": synced_at
+            }
+            for account, organization, cursor, status, error, fetched_rows, synced_at in cur.fetchall()
+        ]
+    finally:
+        conn.close()
+
+def save_account_states(states):
+    # Итог загрузки счетов; курсор сдвигается, только если передан новый
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        for state in states:
+            cur.execute("""
+                INSERT INTO bank_accounts (account, organization_id, cursor, status, error, fetched_rows, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(account) DO UPDATE SET
+                    organization_id = excluded.organization_id,
+                    cursor = COALESCE(excluded.cursor, bank_accounts.cursor),
+                    status = excluded.status,
+                    error = excluded.error,
+                    fetched_rows = excluded.fetched_rows,
+                    synced_at = excluded.synced_at
+            """, (
+                state["account"],
+                _dimension_id(cur, "organizations", state["organization"]),
+                state["cursor"],
+                state["status"],
+                state["error"],
+                state["fetched_rows"]
+            ))
         conn.commit()
-    except sqlite3.IntegrityError:
-        pass  # Дубликат — не сохраняем
+    except Exception:
+        conn.rollback()
+        _clear_caches()
+        raise
     finally:
         conn.close()
 
-def update_monthly_balance():
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+def get_data_generation(conn):
     cur = conn.cursor()
+    cur.execute("SELECT value FROM meta WHERE key = 'data_generation'")
+    return cur.fetchone()[0]
 
-    # Получаем все уникальные даты и организации из транзакций
-    cur.execute("SELECT DISTINCT date FROM finance_transactions ORDER BY date")
-    dates = [row[0] for row in cur.fetchall()]
+def get_data_version():
+    # Версия данных для кэша ответов: поколение данных и закрытые годы
+    # (закрытие года убирает платежи из основной базы, не меняя поколения)
+    conn = get_connection()
+    try:
+        return get_data_generation(conn), tuple(sorted(closed_years(conn)))
+    finally:
+        conn.close()
+
+def get_retained_from(conn, table):
+    # Первый хранимый день таблицы (YYYYMMDD), 0 — строки не удалялись
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (RETAINED_FROM_KEY.format(table),)).fetchone()
+    return row[0] if row else 0
+
+def _bump_data_generation(cur):
+    # Новое поколение данных в текущей транзакции (сбрасывает кэши ответов и аналитики)
+    cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_generation'")
+    cur.execute("SELECT value FROM meta WHERE key = 'data_generation'")
+    return cur.fetchone()[0]
+
+# База, схема которой проверена в этом процессе (init_db)
+_schema_ready_path = None
+
+def init_db():
+    # Для базы с актуальной схемой — только чтение PRAGMA user_version,
+    # без блокировки записи; повторный вызов в процессе ничего не делает
+    global _schema_ready_path
+    if _schema_ready_path == settings.DATABASE_PATH:
+        return
+    _clear_caches()
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        if cur.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS):
+            feed.set_generation(get_data_generation(conn))
+            _schema_ready_path = settings.DATABASE_PATH
+            return
+        # Новая база создается с постраничным освобождением места (incremental_vacuum);
+        # существующая переводится на него при первом обслуживании (maintenance.py)
+        cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # Версия перечитывается под блокировкой записи: процессы, стартующие
+        # одновременно, не применяют одну миграцию дважды
+        while True:
+            cur.execute("BEGIN IMMEDIATE")
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                break
+            migration = MIGRATIONS[version]
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+            logging.info("Применена миграция схемы %d: %s", version + 1, migration.__name__)
+        feed.set_generation(get_data_generation(conn))
+        _schema_ready_path = settings.DATABASE_PATH
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# Причины, по которым платеж не записан (в ответах синхронизации рядом с ошибками проверки)
+SKIP_CLOSED_YEAR = "Платеж относится к закрытому году"
+SKIP_RETENTION = "Платеж старше срока хранения"
 
-    cur.execute("SELECT DISTINCT organization FROM finance_transactions")
+def save_transactions(transactions):
+    # Групповая запись: платежи пачки, пересчет остатков с первого дня новых платежей
+    # и новое поколение данных — одной транзакцией с одной фиксацией, поэтому сбой
+    # не оставляет записанные платежи без остатков. Подписчики ленты изменений
+    # получают поколение после фиксации.
+    # Возвращает [(id, tx)] сохраненных платежей и [(tx, причина)] не записанных:
+    # закрытый год или день старше срока хранения; дубликаты пропускаются молча
+    conn = get_connection()
+    cur = conn.cursor()
+    saved = []
+    skipped = []
+    try:
+        closed = closed_years(conn)
+        retained_from = get_retained_from(conn, "finance_transactions")
+        archived = _archived_external_ids(
+            [tx for tx in transactions if date_keys(tx["date"])[1] // 10000 in closed]
+        )
+        for tx in transactions:
+            day, day_key, month_key = date_keys(tx["date"])
+            if str(tx["external_id"]) in archived:
+                # Уже лежит в файле закрытого года — обычный дубликат
+                continue
+            if day_key // 10000 in closed:
+                # Закрытый год не меняется; для исправлений год открывается заново
+                logging.warning("Платеж %s относится к закрытому году и не сохранен", tx["external_id"])
+                skipped.append((tx, SKIP_CLOSED_YEAR))
+                continue
+            if day_key < retained_from:
+                # День уже свернут в итоги, от них посчитаны остатки
+                logging.warning("Платеж %s старше срока хранения и не сохранен", tx["external_id"])
+                skipped.append((tx, SKIP_RETENTION))
+                continue
+            cur.execute("""
+                INSERT INTO finance_transactions (
+                    organization_id, operation, method, amount, date, day_key, month_key,
+                    counterparty_id, purpose, external_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(external_id) DO NOTHING
+            """, (
+                _dimension_id(cur, "organizations", tx["organization"]),
+                tx["operation"],
+                tx["method"],
+                tx["amount"],
+                day,
+                day_key,
+                month_key,
+                _dimension_id(cur, "counterparties", tx.get("counterparty")),
+                tx.get("purpose"),
+                tx["external_id"]
+            ))
+            if cur.rowcount:
+                saved.append((cur.lastrowid, tx))
+        generation = None
+        if saved:
+            _recompute_monthly_balance(cur, min(date_keys(tx["date"])[1] for _, tx in saved))
+            generation = _bump_data_generation(cur)
+        started = time.perf_counter()
+        conn.commit()
+        DB_COMMIT_LATENCY.labels(operation="save_transactions").observe(time.perf_counter() - started)
+    except Exception:
+        conn.rollback()
+        _clear_caches()
+        raise
+    finally:
+        conn.close()
+    if generation is not None:
+        feed.publish(
+            generation,
+            [transaction_id for transaction_id, _ in saved],
+            [date_keys(tx["date"])[0] for _, tx in saved],
+            [tx["organization"] for _, tx in saved]
+        )
+    return saved, skipped
+
+def _archived_external_ids(transactions):
+    # external_id (строкой, как в платежах) уже записанных в файлы закрытых лет
+    if not transactions:
+        return set()
+    day_keys = [date_keys(tx["date"])[1] for tx in transactions]
+    external_ids = list({tx["external_id"] for tx in transactions})
+    conn = get_history_connection(min(day_keys), max(day_keys))
+    try:
+        archived = set()
+        for start in range(0, len(external_ids), 500):
+            chunk = external_ids[start:start + 500]
+            archived.update(str(row[0]) for row in conn.execute(
+                f"SELECT external_id FROM finance_transactions WHERE external_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ))
+        return archived
+    finally:
+        conn.close()
+
+def _recompute_monthly_balance(cur, from_day_key=None):
+    # Пересчет остатков по дням в текущей транзакции; фиксирует вызывающий
+    # Получаем все уникальные дни и организации из транзакций
+    cur.execute("""
+        SELECT day_key, MIN(date) FROM finance_transactions
+        WHERE day_key >= ?
+        GROUP BY day_key ORDER BY day_key
+    """, (from_day_key or 0,))
+    days = cur.fetchall()
+    if not days:
+        return
+
+    cur.execute("SELECT DISTINCT organization_id FROM finance_transactions")
     organizations = [row[0] for row in cur.fetchall()]
 
     for org in organizations:
-        last_balance = 0.0
+        last_balance = 0
 
         # Получаем последнюю запись из monthly_balance перед первой датой
         cur.execute("""
             SELECT balance FROM monthly_balance
-            WHERE organization = ? AND date < ?
-            ORDER BY date DESC LIMIT 1
-        """, (org, dates[0]))
+            WHERE organization_id = ? AND day_key < ?
+            ORDER BY day_key DESC LIMIT 1
+        """, (org, days[0][0]))
         row = cur.fetchone()
         if row:
             last_balance = row[0]
 
-        for day in dates:
+        for day_key, day in days:
             # Суммируем поступления и списания за день
             cur.execute("""
                 SELECT
                     SUM(CASE WHEN operation = 'Поступление' THEN amount ELSE 0 END),
                     SUM(CASE WHEN operation = 'Списание' THEN amount ELSE 0 END)
                 FROM finance_transactions
-                WHERE organization = ? AND date = ?
-            """, (org, day))
+                WHERE organization_id = ? AND day_key = ?
+            """, (org, day_key))
             income, expense = cur.fetchone()
-            income = income or 0.0
-            expense = expense or 0.0
+            income = income or 0
+            expense = expense or 0
 
             daily_balance = last_balance + income - expense
             last_balance = daily_balance
 
             # Обновляем или вставляем баланс на день
             cur.execute("""
-                SELECT 1 FROM monthly_balance WHERE organization = ? AND date = ?
-            """, (org, day))
+                SELECT 1 FROM monthly_balance WHERE organization_id = ? AND day_key = ?
+            """, (org, day_key))
             exists = cur.fetchone()
 
             if exists:
                 cur.execute("""
-                    UPDATE monthly_balance SET balance = ? WHERE organization = ? AND date = ?
-                """, (daily_balance, org, day))
+                    UPDATE monthly_balance SET balance = ? WHERE organization_id = ? AND day_key = ?
+                """, (daily_balance, org, day_key))
             else:
                 cur.execute("""
-                    INSERT INTO monthly_balance (organization, date, balance)
-                    VALUES (?, ?, ?)
-                """, (org, day, daily_balance))
+                    INSERT INTO monthly_balance (organization_id, date, day_key, balance)
+                    VALUES (?, ?, ?, ?)
+                """, (org, day, day_key, daily_balance))
 
-    conn.commit()
-    conn.close()
\ No newline at end of file
+def close_partitions(payloads):
+    # Обработчик очереди записи: годы, закончившиеся больше PARTITION_CLOSE_AFTER_DAYS дней назад,
+    # переносятся в отдельные файлы только для чтения; остатки по дням остаются в основной базе
+    conn = get_connection()
+    try:
+        closed = [
+            close_year(conn, settings.DATABASE_PATH, "finance_transactions", year)
+            for year in closable_years(conn, "finance_transactions", settings.PARTITION_CLOSE_AFTER_DAYS)
+        ]
+    finally:
+        conn.close()
+    return [closed] + [[] for _ in payloads[1:]]
+
+def reopen_partitions(years):
+    # Обработчик очереди записи: возврат закрытых лет в основную базу
+    conn = get_connection()
+    try:
+        return [reopen_year(conn, settings.DATABASE_PATH, "finance_transactions", year) for year in years]
+    finally:
+        conn.close()
+
+def get_partitions():
+    conn = get_connection()
+    try:
+        return describe_partitions(conn, settings.DATABASE_PATH)
+    finally:
+        conn.close()
@@ -0,0 +1,59 @@
+import logging
+from db import save_account_states, save_transactions, close_partitions, reopen_partitions
+from common.write_queue import writer
+
+
+def write_transactions(batches):
+    # Обработчик очереди записи: пачки платежей из webhook и синхронизации
+    # записываются одной транзакцией вместе с пересчетом остатков и новым поколением данных.
+    # Повтор после сбоя безопасен: до фиксации не записано ничего, дубликаты по external_id пропускаются
+    # Не записанные по закрытому году или сроку хранения возвращаются отдельно от дубликатов
+    transactions = [tx for batch in batches for tx in batch]
+    saved, skipped = save_transactions(transactions)
+    logging.debug(
+        "Записана пачка: %d платежей, новых %d, отклонено %d",
+        len(transactions), len(saved), len(skipped)
+    )
+
+    saved_ids = {id(tx) for _, tx in saved}
+    skipped_reasons = {id(tx): reason for tx, reason in skipped}
+    results = []
+    for batch in batches:
+        count = sum(1 for tx in batch if id(tx) in saved_ids)
+        reasons = {}
+        for tx in batch:
+            reason = skipped_reasons.get(id(tx))
+            if reason:
+                reasons[reason] = reasons.get(reason, 0) + 1
+        rejected = sum(reasons.values())
+        results.append({
+            "saved": count,
+            "duplicates": len(batch) - count - rejected,
+            "rejected": rejected,
+            "rejected_reasons": reasons
+        })
+    return results
+
+
+def merge_rejections(report, written):
+    # Сводка отказов проверки вместе с платежами, которые писатель не записал:
+    # и те и другие не сохранены, в отличие от дубликатов
+    reasons = dict(report["reasons"])
+    for reason, count in written["rejected_reasons"].items():
+        reasons[reason] = reasons.get(reason, 0) + count
+    return dict(report, rejected=report["rejected"] + written["rejected"], reasons=reasons)
+
+
+def write_statements(statements):
+    # Обработчик очереди записи: выписки счетов, загруженные параллельно, пишутся
+    # вместе с платежами других заданий; курсор счета сохраняется после его платежей.
+    # Сбой между записями безопасен: выписка с прежнего курсора даст только дубликаты
+    results = write_transactions([statement["transactions"] for statement in statements])
+    save_account_states(statements)
+    return results
+
+
+writer.register("transactions", write_transactions)
+writer.register("statements", write_statements)
+writer.register("close_partitions", close_partitions)
+writer.register("reopen_partition", reopen_partitions)
@@ -1,27 +1,22 @@
 import logging
 import json
-from datetime import datetime
-from db import init_db, save_transaction, update_monthly_balance
-from api import fetch_bank_transactions
-
-# Настройка логирования
-logging.basicConfig(
-    filename='app.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from collections import Counter
+from datetime import date, datetime
+from db import (
+    init_db,
+    to_kopecks,
+    get_inn_organizations,
+    UNKNOWN_ORGANIZATION
 )
-
-# Сопоставление ИНН с организациями
-INN_ORG_MAP = {
-    "1234567890": "ООО",
-    "9876543210": "ИП1",
-    "1122334455": "ИП2",
-    "5566778899": "ИП3"
-}
+from config import settings
+from common.logging_config import setup_logging
+from common.write_queue import writer
+from metrics import track_stage
 
 def detect_organization(item):
+    # Сопоставление ИНН с организациями ведется в справочнике organizations
     inn = item.get("inn")
-    return INN_ORG_MAP.get(inn, "Неизвестно")
+    return get_inn_organizations().get(inn, UNKNOWN_ORGANIZATION)
 
 def normalize_method(raw_value):
     val = str(raw_value).strip().lower()
@@ -33,69 +28,188 @@ def normalize_method(raw_value):
         return "Карта"
     return "Счет"
 
-def validate_transaction(item):
-    try:
-        tx_id = str(item["id"])
-        amount = float(item["amount"])
-        if amount == 0:
-            return False, "Сумма = 0"
-
-        date = datetime.strptime(item["date"], "%Y-%m-%d").date()
-
-        tx = {
-            "external_id": tx_id,
-            "organization": detect_organization(item),
-            "operation": "Поступление" if amount > 0 else "Списание",
-            "method": normalize_method(item.get("payment_type", "Счет")),
-            "amount": abs(amount),
-            "date": str(date),
-            "counterparty": item.get("counterparty"),
-            "purpose": item.get("purpose")
+# Подробных ошибок в отчете проверки; причины считаются все
+VALIDATION_ERRORS_KEPT = 100
+
+class TransactionValidator:
+    # Проверка и нормализация платежей пачками: справочник ИНН читается один раз,
+    # даты и способы оплаты разбираются один раз на значение, плохие строки
+    # отсеиваются проверками, без исключений. Пачки одной выписки можно
+    # проверять по частям одним экземпляром — отчет копится по всем частям.
+    # organization — организация выписки счета: ИНН платежей тогда не смотрится
+    def __init__(self, organizations=None, errors_kept=VALIDATION_ERRORS_KEPT, organization=None):
+        self.organizations = get_inn_organizations() if organizations is None else organizations
+        self.organization = organization
+        self.errors_kept = errors_kept
+        self.total = 0
+        self.reasons = Counter()
+        self.errors = []
+        # Значение из выписки -> нормализованная дата (None — неверная) и способ оплаты
+        self._dates = {}
+        self._methods = {}
+
+    def _reject(self, index, item, reason):
+        self.reasons[reason] += 1
+        if len(self.errors) < self.errors_kept:
+            tx_id = item.get("id") if isinstance(item, dict) else None
+            self.errors.append({"index": index, "id": None if tx_id is None else str(tx_id), "error": reason})
+
+    def _parse_date(self, value):
+        # Быстрый путь для YYYY-MM-DD; прочие записи разбираются как раньше, strptime
+        try:
+            if len(value) == 10 and value[4] == "-" and value[7] == "-":
+                return date.fromisoformat(value).isoformat()
+            return str(datetime.strptime(value, "%Y-%m-%d").date())
+        except ValueError:
+            return None
+
+    def _method(self, raw_value):
+        if type(raw_value) is not str:
+            return normalize_method(raw_value)
+        method = self._methods.get(raw_value)
+        if method is None:
+            method = self._methods[raw_value] = normalize_method(raw_value)
+        return method
+
+    def validate(self, items):
+        # Валидные платежи пачки; отклоненные попадают в отчет (report)
+        organizations = self.organizations
+        organization = self.organization
+        dates = self._dates
+        parsed = []
+        index = self.total - 1
+        for index, item in enumerate(items, self.total):
+            if not isinstance(item, dict):
+                self._reject(index, item, "Платеж не объект")
+                continue
+            tx_id = item.get("id")
+            if tx_id is None:
+                self._reject(index, item, "Нет id")
+                continue
+
+            # Сумма в копейках, переводится один раз при загрузке
+            value = item.get("amount")
+            if type(value) is int:
+                amount = value * 100
+            elif isinstance(value, (str, float)):
+                try:
+                    amount = to_kopecks(value)
+                except ValueError:
+                    self._reject(index, item, "Неверная сумма")
+                    continue
+            else:
+                self._reject(index, item, "Нет суммы" if value is None else "Неверная сумма")
+                continue
+            if amount == 0:
+                self._reject(index, item, "Сумма = 0")
+                continue
+
+            value = item.get("date")
+            if type(value) is not str:
+                self._reject(index, item, "Нет даты" if value is None else "Неверная дата")
+                continue
+            day = dates.get(value, False)
+            if day is False:
+                day = dates[value] = self._parse_date(value)
+            if day is None:
+                self._reject(index, item, "Неверная дата")
+                continue
+
+            if organization is None:
+                inn = item.get("inn")
+                if inn is not None and not isinstance(inn, (str, int)):
+                    self._reject(index, item, "Неверный ИНН")
+                    continue
+
+            parsed.append({
+                "external_id": str(tx_id),
+                "organization": organization or organizations.get(inn, UNKNOWN_ORGANIZATION),
+                "operation": "Поступление" if amount > 0 else "Списание",
+                "method": self._method(item.get("payment_type", "Счет")),
+                "amount": abs(amount),
+                "date": day,
+                "counterparty": item.get("counterparty"),
+                "purpose": item.get("purpose")
+            })
+        self.total = index + 1
+        return parsed
+
+    def report(self):
+        # Итог проверки всех пачек: сколько принято, причины отказов с количеством
+        rejected = sum(self.reasons.values())
+        return {
+            "total": self.total,
+            "valid": self.total - rejected,
+            "rejected": rejected,
+            "reasons": dict(self.reasons.most_common()),
+            "errors": self.errors
         }
-        return True, tx
 
-    except (KeyError, ValueError, TypeError) as e:
-        return False, f"Ошибка валидации: {e}"
+def validate_transaction(item):
+    # Проверка одного платежа; для выписок и пачек — TransactionValidator
+    validator = TransactionValidator()
+    parsed = validator.validate([item])
+    if parsed:
+        return True, parsed[0]
+    return False, validator.errors[0]["error"]
 
 def parse_transactions(raw_data):
-    parsed = []
-    for item in raw_data.get("transactions", []):
-        valid, result = validate_transaction(item)
-        if valid:
-            parsed.append(result)
-        else:
-            logging.warning(f"Пропущена транзакция: {result}")
-    return parsed
+    # Организации, добавленные в справочник, подхватываются при каждой синхронизации
+    validator = TransactionValidator(get_inn_organizations(refresh=True))
+    parsed = validator.validate(raw_data.get("transactions", []))
+    report = validator.report()
+    if report["rejected"]:
+        # Одна сводная строка на синхронизацию вместо строки на каждую транзакцию
+        logging.warning(
+            "Пропущено %d транзакций: %s",
+            report["rejected"],
+            "; ".join(f"{reason} — {count}" for reason, count in report["reasons"].items())
+        )
+        logging.debug("Первые пропущенные транзакции: %s", report["errors"])
+    return parsed, report
 
 def main():
     logging.info("Запуск скрипта интеграции Альфа-Банка")
     try:
         init_db()
-        data = fetch_bank_transactions()
+        from api import fetch_bank_transactions
+        with track_stage("fetch"):
+            data = fetch_bank_transactions()
 
         # Сохраняем сырые данные в файл для отладки
         with open("raw_transactions.json", "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
 
-        transactions = parse_transactions(data)
+        with track_stage("validation"):
+            transactions, _ = parse_transactions(data)
 
         # Сохраняем валидационные/нормализованные данные для фронта
         with open("validated_transactions.json", "w", encoding="utf-8") as f:
             json.dump(transactions, f, ensure_ascii=False, indent=2)
 
-        logging.info(f"Получено {len(transactions)} валидных транзакций")
-
-        for tx in transactions:
-            save_transaction(tx)
-            logging.info(f"Сохранена транзакция: {tx['external_id']}")
-
-        logging.info("Работа завершена успешно")
-
-        update_monthly_balance()
-        logging.info("Обновлены записи в monthly_balance")
+        logging.info("Получено %d валидных транзакций", len(transactions))
+
+        # Запись — через очередь записи, как в сервисе: одной транзакцией с пересчетом
+        # остатков и новым поколением данных. Если сервис запущен, пишет его писатель,
+        # иначе писателем становится этот процесс
+        import ingest  # noqa: F401 — регистрация обработчика записи платежей
+        writer.start()
+        try:
+            with track_stage("db_write"):
+                result = writer.call("transactions", transactions, rows=len(transactions))
+        finally:
+            writer.stop()
+
+        logging.info(
+            "Работа завершена успешно: сохранено %d, дубликатов %d, не записано %d",
+            result["saved"], result["duplicates"], result["rejected"]
+        )
+        for reason, count in result["rejected_reasons"].items():
+            logging.warning("Не записано %d платежей: %s", count, reason)
 
     except Exception as e:
-        logging.error(f"Ошибка выполнения скрипта: {e}")
+        logging.error("Ошибка выполнения скрипта: %s", e)
 
 if __name__ == "__main__":
+    setup_logging(settings.LOG_FILE)
     main()
\ No newline at end of file
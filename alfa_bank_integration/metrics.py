@@ -0,0 +1,201 @@
+import time
+from contextlib import contextmanager
+from fastapi import Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Латентность входящих HTTP-запросов по маршрутам
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Длительность обработки HTTP-запроса",
+    ["method", "route", "status"]
+)
+
+# Латентность запросов к API банка по конечным точкам (token, transactions)
+BANK_REQUEST_LATENCY = Histogram(
+    "bank_request_duration_seconds",
+    "Длительность запроса к API Альфа-Банка",
+    ["endpoint", "status"]
+)
+
+# Длительность этапов синхронизации
+SYNC_STAGE_LATENCY = Histogram(
+    "sync_stage_duration_seconds",
+    "Длительность этапа синхронизации",
+    ["stage"]
+)
+
+# Обращения к кэшу токена доступа: result = hit / miss
+TOKEN_CACHE_REQUESTS = Counter(
+    "token_cache_requests_total",
+    "Обращения к кэшу токена доступа",
+    ["result"]
+)
+
+# Строки синхронизации: result = saved / duplicate / rejected
+SYNC_ROWS = Counter(
+    "sync_rows_total",
+    "Количество обработанных банковских транзакций",
+    ["result"]
+)
+
+SYNC_ROWS_PER_SECOND = Gauge(
+    "sync_rows_per_second",
+    "Скорость обработки строк в последней синхронизации"
+)
+
+SYNC_DUPLICATE_RATIO = Gauge(
+    "sync_duplicate_ratio",
+    "Доля дубликатов в последней синхронизации"
+)
+
+DB_COMMIT_LATENCY = Histogram(
+    "db_commit_duration_seconds",
+    "Длительность фиксации транзакции SQLite",
+    ["operation"]
+)
+
+# Исходящие запросы: повторы, состояние выключателя, лимит параллельности
+OUTBOUND_RETRIES = Counter(
+    "outbound_retries_total",
+    "Количество повторов исходящих запросов",
+    ["policy"]
+)
+
+OUTBOUND_CIRCUIT_OPEN = Gauge(
+    "outbound_circuit_open",
+    "Выключатель исходящих запросов разомкнут (1) или замкнут (0)",
+    ["policy"]
+)
+
+OUTBOUND_CONCURRENCY_LIMIT = Gauge(
+    "outbound_concurrency_limit",
+    "Текущий адаптивный лимит одновременных исходящих запросов",
+    ["policy"]
+)
+
+# Очередь записи (write_queue.py): задания ждут единственного процесса-писателя
+WRITE_QUEUE_DEPTH = Gauge(
+    "write_queue_depth",
+    "Строк в заданиях, ожидающих записи"
+)
+
+WRITE_QUEUE_LAG = Gauge(
+    "write_queue_lag_seconds",
+    "Возраст самого старого задания в очереди записи"
+)
+
+WRITE_BATCH_ROWS = Histogram(
+    "write_batch_rows",
+    "Количество строк в одной групповой записи",
+    buckets=(1, 5, 10, 50, 100, 500, 1000, 5000)
+)
+
+# Записи лога ниже WARNING, отброшенные при переполненной очереди логирования
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Записи лога, отброшенные при переполнении очереди"
+)
+
+# Выполненные задания: result = done / failed
+WRITE_JOBS = Counter(
+    "write_jobs_total",
+    "Задания очереди записи по результату",
+    ["kind", "result"]
+)
+
+# Сжатие ответов (compression.py): encoding = br / gzip, cached — из кэша ответов
+RESPONSE_COMPRESSION = Counter(
+    "response_compression_total",
+    "Сжатые ответы по способу сжатия",
+    ["encoding", "cached"]
+)
+
+RESPONSE_COMPRESSION_RATIO = Histogram(
+    "response_compression_ratio",
+    "Отношение исходного размера ответа к сжатому",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50)
+)
+
+# Обращения к кэшу ответов: result = hit / miss
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Обращения к кэшу готовых ответов",
+    ["route", "result"]
+)
+
+# Отклоненные платежи webhook: reason = invalid / queue_full
+INGEST_REJECTED = Counter(
+    "ingest_rejected_total",
+    "Платежи, не принятые или не записанные из webhook",
+    ["reason"]
+)
+
+# Выписки по счетам (ACCOUNTS): status = success / error
+ACCOUNT_SYNC_LATENCY = Histogram(
+    "bank_account_sync_duration_seconds",
+    "Загрузка и запись выписки одного счета",
+    ["account", "status"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """
+    Замер длительности этапа синхронизации
+
+    Args:
+        stage: Название этапа (fetch, validation, db_write, monthly_balance)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SYNC_STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - started)
+
+
+def record_sync_result(saved: int, duplicates: int, rejected: int, elapsed: float) -> None:
+    """
+    Обновление показателей по итогам синхронизации
+
+    Args:
+        saved: Количество сохраненных транзакций
+        duplicates: Количество пропущенных дубликатов
+        rejected: Количество транзакций, не прошедших валидацию
+        elapsed: Длительность синхронизации в секундах
+    """
+    processed = saved + duplicates + rejected
+    SYNC_ROWS.labels(result="saved").inc(saved)
+    SYNC_ROWS.labels(result="duplicate").inc(duplicates)
+    SYNC_ROWS.labels(result="rejected").inc(rejected)
+    SYNC_ROWS_PER_SECOND.set(processed / elapsed if elapsed > 0 else 0)
+    SYNC_DUPLICATE_RATIO.set(duplicates / processed if processed else 0)
+
+
+async def metrics_middleware(request: Request, call_next):
+    """Замер латентности запроса по шаблону маршрута"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Используем шаблон пути, чтобы не плодить метки по значениям параметров
+        route = request.scope.get("route")
+        HTTP_REQUEST_LATENCY.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        ).observe(time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    """Текущие метрики в текстовом формате Prometheus"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
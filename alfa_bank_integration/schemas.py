@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -101,15 +101,160 @@ class MonthlyBalance(BaseModel):
         except ValueError:
             raise ValueError('Date must be in YYYY-MM-DD format')
 
+class WebhookError(BaseModel):
+    index: Optional[int] = Field(None, description="Номер платежа в запросе")
+    id: Optional[str] = Field(None, description="ID платежа в банке")
+    error: str
+
+class WebhookResponse(BaseModel):
+    status: Literal["accepted", "rejected"]
+    accepted: int = Field(..., description="Платежей поставлено в очередь на запись", ge=0)
+    rejected: int = Field(..., description="Платежей не прошло проверку", ge=0)
+    reasons: Dict[str, int] = Field(default_factory=dict, description="Причины отказа с количеством")
+    errors: List[WebhookError] = Field(default_factory=list, description="Первые ошибки проверки")
+
+class WriteQueueStatusResponse(BaseModel):
+    writer: bool = Field(..., description="Этот процесс — писатель очереди")
+    pid: int
+    pending_jobs: int = Field(..., description="Заданий в ожидании записи", ge=0)
+    pending_rows: int = Field(..., description="Платежей в ожидании записи", ge=0)
+    lag_seconds: float = Field(..., description="Возраст самого старого задания в очереди, с")
+    average_lag_seconds: Optional[float] = Field(None, description="Средняя задержка записи за 5 минут, с")
+    failed_jobs: int = Field(..., description="Заданий с ошибкой за 5 минут", ge=0)
+    last_applied_seconds_ago: Optional[float] = Field(None, description="Время с последней записи, с")
+
+class YearPartition(BaseModel):
+    year: int
+    file: str = Field(..., description="Файл года рядом с основной базой")
+    rows: int = Field(..., description="Количество платежей", ge=0)
+    size_bytes: Optional[int] = Field(None, description="Размер файла")
+    closed_at: Optional[str] = None
+
+class YearPartitionsResponse(BaseModel):
+    partitions: List[YearPartition]
+
+class ClosedYear(BaseModel):
+    year: int
+    rows: int = Field(..., description="Перенесено платежей", ge=0)
+
+class PartitionsChangeResponse(BaseModel):
+    status: Literal["success", "error"]
+    years: List[ClosedYear]
+
+class RetentionResult(BaseModel):
+    retained_from: int = Field(..., description="Первый хранимый день (YYYYMMDD)")
+    rolled_up: int = Field(..., description="Добавлено строк итогов по дням", ge=0)
+    deleted: int = Field(..., description="Удалено подробных строк", ge=0)
+    dropped_years: List[int] = Field(..., description="Удаленные файлы закрытых лет")
+    archived_partitions: Optional[int] = Field(None, description="Архивных разделов Parquet")
+
+class MaintenanceResponse(BaseModel):
+    status: Literal["success", "error"]
+    retention: Dict[str, RetentionResult]
+    converted: bool = Field(..., description="База переведена на auto_vacuum=INCREMENTAL полным VACUUM")
+    vacuumed_pages: int = Field(..., description="Освобождено страниц", ge=0)
+    freed_bytes: int = Field(..., description="Возвращено файлу байт", ge=0)
+    statistics: Literal["analyze", "optimize"] = Field(..., description="Обновление статистики планировщика")
+    duration_seconds: float
+
+class DatabaseFile(BaseModel):
+    file: str
+    bytes: int = Field(..., ge=0)
+
+class DatabaseObject(BaseModel):
+    name: str = Field(..., description="Таблица или индекс")
+    type: str
+    bytes: int = Field(..., ge=0)
+
+class TableRetention(BaseModel):
+    days: int = Field(..., description="Срок хранения строк, дни")
+    retained_from: int = Field(..., description="Первый хранимый день (YYYYMMDD), 0 — строки не удалялись")
+
+class DatabaseSizeResponse(BaseModel):
+    total_bytes: int = Field(..., description="Размер всех файлов базы", ge=0)
+    files: List[DatabaseFile] = Field(..., description="Основная база, журнал, очередь записи и файлы закрытых лет")
+    page_size: int
+    page_count: int
+    freelist_count: int = Field(..., description="Свободных страниц внутри файла", ge=0)
+    free_bytes: int = Field(..., ge=0)
+    auto_vacuum: str
+    objects: List[DatabaseObject] = Field(..., description="Размер таблиц и индексов основной базы")
+    retention: Dict[str, TableRetention]
+    maintained_at: Optional[str] = Field(None, description="Время последнего обслуживания")
+
+class HealthCheckResponse(BaseModel):
+    status: Literal["healthy", "unhealthy"]
+    timestamp: str
+
+class WarmUpStep(BaseModel):
+    name: str = Field(..., description="Шаг прогрева")
+    status: Literal["pending", "running", "done", "failed"]
+    duration_seconds: Optional[float] = Field(None, description="Длительность шага, с")
+    error: Optional[str] = None
+
+class ReadinessResponse(BaseModel):
+    status: Literal["ready", "warming_up"]
+    uptime_seconds: float = Field(..., description="Время с запуска прогрева, с")
+    warmup_seconds: Optional[float] = Field(None, description="Длительность прогрева, с")
+    steps: List[WarmUpStep] = Field(default_factory=list)
+
+class BankAccountState(BaseModel):
+    account: str = Field(..., description="Номер счета")
+    organization: Optional[str] = None
+    cursor: Optional[str] = Field(None, description="Курсор выписки для следующей синхронизации")
+    status: Optional[Literal["success", "error"]] = Field(None, description="Итог последней загрузки")
+    error: Optional[str] = None
+    fetched_rows: int = Field(..., description="Получено платежей при последней загрузке", ge=0)
+    synced_at: Optional[str] = Field(None, description="Время последней загрузки")
+
+class BankAccountsResponse(BaseModel):
+    accounts: List[BankAccountState]
+
+class AccountSyncResult(BaseModel):
+    account: str = Field(..., description="Номер счета")
+    organization: Optional[str] = None
+    status: Literal["success", "error"]
+    fetched: int = Field(..., description="Получено платежей", ge=0)
+    validated: int = Field(..., description="Прошло проверку", ge=0)
+    saved: int = Field(..., description="Сохранено новых", ge=0)
+    duplicates: int = Field(..., description="Пропущено дубликатов", ge=0)
+    rejected: int = Field(0, description="Не сохранено: не прошли проверку, закрытый год или срок хранения", ge=0)
+    rejected_reasons: Dict[str, int] = Field(default_factory=dict, description="Причины отказа с количеством")
+    error: Optional[str] = None
+
 class SyncResponse(BaseModel):
     status: Literal["success", "error"]
     raw_count: Optional[int] = Field(None, description="Количество сырых транзакций")
     validated_count: Optional[int] = Field(None, description="Количество валидированных транзакций")
     saved_count: Optional[int] = Field(None, description="Количество сохраненных транзакций")
+    rejected_count: Optional[int] = Field(None, description="Количество несохраненных транзакций: не прошли проверку, закрытый год или срок хранения")
+    rejected_reasons: Optional[Dict[str, int]] = Field(None, description="Причины отказа с количеством")
     organizations: Optional[List[str]] = Field(None, description="Список организаций")
+    accounts: Optional[List[AccountSyncResult]] = Field(None, description="Итоги по счетам (при ACCOUNTS)")
     error: Optional[str] = Field(None, description="Сообщение об ошибке")
 
 # Response models
+class TransactionSearchResult(BaseModel):
+    id: int
+    date: str
+    organization: Optional[str] = None
+    operation: Optional[str] = None
+    method: Optional[str] = None
+    amount: float
+    counterparty: Optional[str] = None
+    purpose: Optional[str] = None
+    external_id: Optional[int] = None
+    rank: float = Field(..., description="Ранг BM25: чем меньше, тем релевантнее")
+    snippet: Optional[str] = Field(None, description="Фрагмент назначения платежа с найденными словами в []")
+
+class TransactionSearchResponse(BaseModel):
+    data: List[TransactionSearchResult]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы")
+    unsearched_years: List[int] = Field(
+        default_factory=list,
+        description="Закрытые годы периода: их платежи вынесены из основной базы и не ищутся"
+    )
+
 class TransactionsResponse(BaseModel):
     data: List[BankTransaction]
 
@@ -120,4 +265,36 @@ class DailyReportResponse(BaseModel):
     data: List[DailyReport]
 
 class MonthlyBalanceResponse(BaseModel):
-    data: List[MonthlyBalance] 
\ No newline at end of file
+    data: List[MonthlyBalance]
+
+class QueryStat(BaseModel):
+    statement: str = Field(..., description="Текст запроса")
+    calls: int = Field(..., description="Количество выполнений", ge=0)
+    total_ms: float = Field(..., description="Суммарное время, мс")
+    avg_ms: float = Field(..., description="Среднее время, мс")
+    max_ms: float = Field(..., description="Максимальное время, мс")
+    rows: int = Field(..., description="Количество возвращенных/измененных строк", ge=0)
+
+class QueryStatsResponse(BaseModel):
+    slow_query_ms: float
+    data: List[QueryStat]
+
+class ExportTableResult(BaseModel):
+    written: int = Field(..., description="Записано разделов", ge=0)
+    unchanged: int = Field(..., description="Разделов без изменений", ge=0)
+    removed: int = Field(..., description="Удалено опустевших разделов", ge=0)
+
+class ExportResponse(BaseModel):
+    status: Literal["success", "error"]
+    tables: Dict[str, ExportTableResult]
+
+class ExportPartition(BaseModel):
+    partition: str = Field(..., description="Месяц в формате YYYY-MM")
+    rows: int = Field(..., description="Количество строк", ge=0)
+    bytes: int = Field(..., description="Размер файла", ge=0)
+    exported_at: str = Field(..., description="Время выгрузки")
+    archived: bool = Field(False, description="Строки раздела удалены из базы по сроку хранения")
+
+class ExportManifestResponse(BaseModel):
+    table: str
+    partitions: List[ExportPartition]
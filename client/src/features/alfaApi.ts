@@ -1,5 +1,11 @@
 import { createApi, fetchBaseQuery } from "@reduxjs/toolkit/query/react";
-import type { DailyReport, MonthlyBalance, Transaction, TransactionsSummary } from "./models";
+import type {
+  DailyReport,
+  MonthlyBalance,
+  Transaction,
+  TransactionSearch,
+  TransactionsSummary,
+} from "./models";
 
 export const alfaApi = createApi({
   reducerPath: "alfaApi",
@@ -14,6 +20,18 @@ export const alfaApi = createApi({
       TransactionsSummary,
       { organization: string | null; start_date: string; end_date: string; limit: number }
     >({ query: (params) => ({ url: "/transactions/summary", params }) }),
+    searchTransactions: build.query<
+      TransactionSearch,
+      {
+        q: string;
+        organization?: string;
+        start_date?: string;
+        end_date?: string;
+        sort?: "relevance" | "recent";
+        cursor?: string;
+        limit?: number;
+      }
+    >({ query: (params) => ({ url: "/transactions/search", params }) }),
     syncronizeAlfa: build.mutation({ query: () => ({ url: "/api/sync", method: "POST" }) }),
   }),
 });
@@ -23,5 +41,6 @@ export const {
   useGetMonthlyBalanceQuery,
   useGetTransactionsQuery,
   useGetTransactionsSummaryQuery,
+  useSearchTransactionsQuery,
   useSyncronizeAlfaMutation,
 } = alfaApi;
@@ -0,0 +1,26 @@
+import { useEffect, useRef } from "react";
+
+export interface ChangeEvent {
+  generation: number;
+  ids: number[];
+  dates: string[];
+  organizations: string[];
+}
+
+// Подписка на ленту изменений сервиса (Server-Sent Events).
+// onChange получает событие change или null для reset (данные нужно перечитать целиком).
+// EventSource сам переподключается и продолжает ленту с Last-Event-ID.
+export function useChangeFeed(baseUrl: string, onChange: (event: ChangeEvent | null) => void) {
+  const handler = useRef(onChange);
+
+  useEffect(() => {
+    handler.current = onChange;
+  }, [onChange]);
+
+  useEffect(() => {
+    const source = new EventSource(`${baseUrl}/changes`);
+    source.addEventListener("change", (message) => handler.current(JSON.parse(message.data)));
+    source.addEventListener("reset", () => handler.current(null));
+    return () => source.close();
+  }, [baseUrl]);
+}
@@ -54,6 +54,23 @@ export interface TransactionsSummary {
   }[];
 }
 
+export interface TransactionSearch {
+  data: {
+    id: number;
+    date: string;
+    organization: string | null;
+    operation: "Поступление" | "Списание";
+    method: string;
+    amount: number;
+    counterparty: string | null;
+    purpose: string | null;
+    external_id: number;
+    rank: number;
+    snippet: string | null;
+  }[];
+  next_cursor: string | null;
+}
+
 export interface DailyReport {
   data: {
     date: string;
@@ -70,3 +87,25 @@ export interface MonthlyBalance {
     balance: number;
   }[];
 }
+
+export interface DashboardColumn {
+  total: number;
+  details: { [method: string]: number };
+}
+
+export interface DailyDashboard {
+  start_date: string;
+  end_date: string;
+  start_balance: number;
+  end_balance: number;
+  days: {
+    date: string;
+    organizations: {
+      name: string | null;
+      money_in?: DashboardColumn;
+      money_out?: DashboardColumn;
+      goods_in?: DashboardColumn;
+      goods_out?: DashboardColumn;
+    }[];
+  }[];
+}
@@ -1,5 +1,5 @@
 import { createApi, fetchBaseQuery } from "@reduxjs/toolkit/query/react";
-import type { Products, ProductsSummary } from "./models";
+import type { DailyDashboard, Products, ProductsSummary } from "./models";
 
 export const oneCApi = createApi({
   reducerPath: "oneCApi",
@@ -20,11 +20,16 @@ export const oneCApi = createApi({
     getOrganizationsByDate: build.query<ProductsSummary, { date: string }>({
       query: ({ date }) => `/products/summary?date=${date}`,
     }),
+    // Сводный отчет: деньги по банку и товары по 1С за один запрос
+    getDailyDashboard: build.query<DailyDashboard, { start_date?: string; end_date?: string }>({
+      query: (params) => ({ url: "/dashboard/daily", params }),
+    }),
     syncronizeOneC: build.mutation({ query: () => ({ url: "/sync", method: "POST" }) }),
   }),
 });
 
 export const {
+  useGetDailyDashboardQuery,
   useGetOrganizationsByDateQuery,
   useGetProductsByOrganizationQuery,
   useSyncronizeOneCMutation,
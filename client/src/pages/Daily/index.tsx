@@ -1,36 +1,58 @@
-import { useEffect, useMemo } from "react";
-import { reportData } from "../../models/daily.mock";
+import { useCallback, useEffect, useMemo } from "react";
 import { DayBlock } from "./DayBlock";
 import { SummaryHeader } from "./SummaryHeader";
-import { useGetDailyReportQuery } from "../../features/alfaApi";
+import { useGetDailyDashboardQuery } from "../../features/oneCApi";
+import { useChangeFeed, type ChangeEvent } from "../../features/changeFeed";
+import type { DashboardColumn } from "../../features/models";
+import type { ColumnData, DayReport } from "../../models/daily";
+
+const emptyColumn = (column?: DashboardColumn): ColumnData => column ?? { total: 0, details: {} };
+
+// YYYY-MM-DD -> ДД.ММ.ГГ без перевода через часовой пояс
+const formatDate = (value: string): string => {
+  const [year, month, day] = value.split("-");
+  return `${day}.${month}.${year.slice(2)}`;
+};
 
 export function DailyPage() {
-  const { data } = useGetDailyReportQuery(null);
+  // Период по умолчанию — с начала текущего месяца, его выбирает сервер
+  const { data, refetch } = useGetDailyDashboardQuery({});
+
+  // Отчет перечитывается, только если изменились дни отчетного периода
+  const onChange = useCallback(
+    (event: ChangeEvent | null) => {
+      if (!data || !event || event.dates.some((day) => day >= data.start_date && day <= data.end_date)) {
+        refetch();
+      }
+    },
+    [data, refetch],
+  );
+  useChangeFeed(import.meta.env.VITE_API_ONEC, onChange);
+  useChangeFeed(import.meta.env.VITE_API_ALFA, onChange);
 
   useEffect(() => {
     document.title = "Ежедневный отчёт • " + import.meta.env.VITE_APP_NAME;
-    const today = new Date(Date.now());
-    today.setHours(0, 0, 0, 0);
-    console.log(today.getFullYear() + "-" + today.getMonth() + "-" + today.getDate());
   }, []);
 
-  useEffect(() => {
-    // тут как нибудь надо парсить дату
-    if (data) console.log(data.data);
-  }, [data]);
-
-  const currentBalance = useMemo(() => {
-    // Считаем сумму всех поступлений и расходов
-    const totalNetChange = reportData.dailyReports.reduce((totalAcc, day) => {
-      const dayNetChange = day.entities.reduce((dayAcc, entity) => {
-        return dayAcc + entity.moneyIn.total - entity.moneyOut.total;
-      }, 0);
-      return totalAcc + dayNetChange;
-    }, 0);
-
-    // Текущий баланс = начальный + все изменения
-    return reportData.startOfMonthBalance + totalNetChange;
-  }, []);
+  const dailyReports = useMemo<DayReport[]>(
+    () =>
+      (data?.days ?? [])
+        .map((day) => ({
+          date: formatDate(day.date),
+          isCollapsed: false,
+          entities: day.organizations.map((organization) => ({
+            name: organization.name ?? "Неизвестно",
+            type: organization.name?.startsWith("ИП") ? ("ИП" as const) : ("ООО" as const),
+            isCollapsed: true,
+            moneyIn: emptyColumn(organization.money_in),
+            moneyOut: emptyColumn(organization.money_out),
+            goodsIn: emptyColumn(organization.goods_in),
+            goodsOut: emptyColumn(organization.goods_out),
+          })),
+        }))
+        .reverse(),
+    [data],
+  );
 
   return (
     <div className="min-h-screen bg-gray-50 p-4 sm:p-8">
@@ -38,11 +60,11 @@ export function DailyPage() {
         <h1 className="mb-8 text-4xl font-extrabold text-gray-800">Ежедневный отчёт</h1>
 
         <SummaryHeader
-          startBalance={reportData.startOfMonthBalance}
-          currentBalance={currentBalance}
+          startBalance={data?.start_balance ?? 0}
+          currentBalance={data?.end_balance ?? 0}
         />
 
-        {reportData.dailyReports.map((day) => (
+        {dailyReports.map((day) => (
           <DayBlock key={day.date} dayData={day} />
         ))}
       </div>
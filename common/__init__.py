@@ -0,0 +1,6 @@
+# Общие модули сервисов 1С и Альфа-Банка: очередь записи, политика исходящих
+# запросов, профилирование SQLite, логирование, сжатие ответов, лента изменений,
+# разделы по годам, выгрузка в Parquet, обслуживание базы и прогрев.
+# Модули читают настройки и метрики сервиса, в котором запущены (config, metrics,
+# db лежат в каталоге сервиса), поэтому каталог сервиса должен быть текущим
+# или в sys.path, а каталог с пакетом common — в PYTHONPATH
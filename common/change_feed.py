@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Ограниченная очередь событий одного подписчика. При переполнении очередь
+    очищается, а подписчик получает событие reset и перечитывает данные целиком.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int):
+        self.loop = loop
+        self.size = size
+        self.events: Deque[Dict] = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, event: Dict) -> None:
+        # Вызывается под блокировкой ленты из любого потока
+        if self.overflowed:
+            return
+        if len(self.events) >= self.size:
+            self.events.clear()
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            # Цикл событий подписчика уже закрыт
+            pass
+
+
+class ChangeFeed:
+    """
+    Лента изменений данных: событие публикуется после каждой зафиксированной
+    загрузки и получает номер поколения данных. Последние события хранятся
+    для продолжения подписки по номеру (Last-Event-ID).
+    """
+
+    def __init__(self, history_size: int, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._history: Deque[Dict] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscription] = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def set_generation(self, generation: int) -> None:
+        """Текущее поколение данных из базы (при старте сервиса)"""
+        with self._lock:
+            self._generation = max(self._generation, generation)
+
+    def publish(
+        self,
+        generation: int,
+        ids: Iterable[int],
+        dates: Iterable[str],
+        organizations: Iterable[Optional[str]]
+    ) -> None:
+        """
+        Публикация изменения: новые id, затронутые даты и организации
+        """
+        event = {
+            "generation": generation,
+            "ids": sorted(ids),
+            "dates": sorted(set(dates)),
+            "organizations": sorted({name for name in organizations if name}),
+        }
+        with self._lock:
+            self._generation = max(self._generation, generation)
+            self._history.append(event)
+            for subscription in self._subscribers:
+                subscription.push(event)
+
+    def subscribe(self, last_event_id: Optional[int]) -> Subscription:
+        """
+        Подписка на ленту; события после last_event_id отдаются из истории,
+        если она их еще хранит, иначе подписчик начинает с reset
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            if last_event_id is not None and last_event_id < self._generation:
+                if self._history and self._history[0]["generation"] <= last_event_id + 1:
+                    for event in self._history:
+                        if event["generation"] > last_event_id:
+                            subscription.push(event)
+                else:
+                    subscription.overflowed = True
+                    subscription.ready.set()
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def drain(self, subscription: Subscription) -> Tuple[bool, List[Dict]]:
+        """Накопленные события подписчика и признак необходимости reset"""
+        with self._lock:
+            subscription.ready.clear()
+            overflowed, subscription.overflowed = subscription.overflowed, False
+            events = list(subscription.events)
+            subscription.events.clear()
+        return overflowed, events
+
+
+feed = ChangeFeed(settings.CHANGE_FEED_HISTORY, settings.CHANGE_FEED_BUFFER)
+
+
+def _format_event(event_type: str, generation: int, data: Dict) -> str:
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {generation}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+async def _event_stream(request: Request, last_event_id: Optional[int]) -> AsyncIterator[str]:
+    subscription = feed.subscribe(last_event_id)
+    try:
+        yield f"retry: {settings.CHANGE_FEED_RETRY_MS}\n\n"
+        while not await request.is_disconnected():
+            try:
+                await asyncio.wait_for(subscription.ready.wait(), timeout=settings.CHANGE_FEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                yield ": ping\n\n"
+                continue
+            overflowed, events = feed.drain(subscription)
+            if overflowed:
+                yield _format_event("reset", feed.generation, {"generation": feed.generation})
+            for event in events:
+                yield _format_event("change", event["generation"], event)
+    finally:
+        feed.unsubscribe(subscription)
+
+
+def changes_response(request: Request, last_event_id: Optional[int] = None) -> StreamingResponse:
+    """
+    Ответ Server-Sent Events с лентой изменений; номер последнего
+    полученного события берется из заголовка Last-Event-ID или параметра
+    """
+    header = request.headers.get("last-event-id")
+    if header is not None:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            logger.debug("Некорректный Last-Event-ID: %s", header)
+    return StreamingResponse(
+        _event_stream(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from config import settings
+from db import get_history_connection, EXPORT_TABLES
+
+logger = logging.getLogger(__name__)
+
+# pyarrow импортируется при первой выгрузке или прогревом после старта:
+# импорт заметно удлиняет запуск сервиса
+_arrow = None
+
+
+def load_arrow():
+    """
+    Модули pyarrow, pyarrow.parquet и типы столбцов в описании
+    выгружаемых таблиц (EXPORT_TABLES в db.py)
+    """
+    global _arrow
+    if _arrow is None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        _arrow = (pa, pq, {
+            "int64": pa.int64(),
+            "string": pa.string(),
+            "date": pa.date32(),
+            "timestamp": pa.timestamp("s"),
+        })
+    return _arrow
+
+MANIFEST_NAME = "_manifest.json"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# Выгрузки не должны идти параллельно: они пишут одни и те же файлы
+_lock = threading.Lock()
+
+
+def _table_dir(table: str) -> str:
+    return os.path.join(settings.EXPORT_DIR, table)
+
+
+def _partition_name(month_key: int) -> str:
+    return f"{month_key // 100:04d}-{month_key % 100:02d}"
+
+
+def _partition_path(table: str, partition: str) -> str:
+    return os.path.join(_table_dir(table), f"month={partition}", "data.parquet")
+
+
+def _read_manifest(table: str) -> Dict:
+    path = os.path.join(_table_dir(table), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"table": table, "partitions": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(table: str, manifest: Dict) -> None:
+    path = os.path.join(_table_dir(table), MANIFEST_NAME)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _write_partition(table: str, partition: str, columns: List, rows: List) -> int:
+    """Запись раздела в Parquet; файл заменяется атомарно"""
+    pa, pq, arrow_types = load_arrow()
+    values = list(zip(*rows)) if rows else [[] for _ in columns]
+    # Даты приходят из SQLite строками и приводятся к типам Arrow одним вызовом на столбец
+    data = pa.Table.from_arrays(
+        [pa.array(column).cast(arrow_types[type_name]) for (_, type_name), column in zip(columns, values)],
+        names=[name for name, _ in columns]
+    )
+
+    path = _partition_path(table, partition)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    pq.write_table(data, tmp, compression=settings.EXPORT_COMPRESSION)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def _export_table(cur, table: str, spec: Dict) -> Dict[str, int]:
+    """
+    Выгрузка разделов таблицы по месяцам, изменившихся с прошлой выгрузки.
+    Раздел считается измененным, если изменилась его сигнатура
+    (количество строк и агрегаты по id из индекса по месяцу).
+    """
+    manifest = _read_manifest(table)
+    known = manifest["partitions"]
+
+    cur.execute(spec["partitions"])
+    signatures = {_partition_name(row[0]): list(row[1:]) for row in cur.fetchall() if row[0] is not None}
+
+    written = 0
+    for partition, signature in sorted(signatures.items()):
+        if known.get(partition, {}).get("signature") == signature:
+            continue
+        month_key = int(partition.replace("-", ""))
+        cur.execute(spec["rows"], (month_key,))
+        rows = cur.fetchall()
+        size = _write_partition(table, partition, spec["columns"], rows)
+        known[partition] = {
+            "signature": signature,
+            "rows": len(rows),
+            "bytes": size,
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        written += 1
+
+    # Разделы, в которых не осталось строк; архивные остаются после удаления строк по сроку хранения
+    removed = 0
+    for partition in [p for p in known if p not in signatures and not known[p].get("archived")]:
+        path = _partition_path(table, partition)
+        if os.path.exists(path):
+            os.remove(path)
+        del known[partition]
+        removed += 1
+
+    _write_manifest(table, manifest)
+    return {
+        "written": written,
+        "unchanged": len(signatures) - written,
+        "removed": removed,
+    }
+
+
+def export_snapshots(tables: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Инкрементальная выгрузка таблиц в Parquet по разделам-месяцам
+
+    Args:
+        tables: Таблицы для выгрузки (по умолчанию все из EXPORT_TABLES)
+    """
+    result = {}
+    with _lock:
+        conn = get_history_connection()
+        try:
+            cur = conn.cursor()
+            for table in tables or list(EXPORT_TABLES):
+                started = time.perf_counter()
+                os.makedirs(_table_dir(table), exist_ok=True)
+                result[table] = _export_table(cur, table, EXPORT_TABLES[table])
+                logger.info(
+                    "Выгрузка %s: записано разделов %d, без изменений %d, удалено %d за %.2f с",
+                    table, result[table]["written"], result[table]["unchanged"],
+                    result[table]["removed"], time.perf_counter() - started
+                )
+        finally:
+            conn.close()
+    return result
+
+
+def archive_partitions(table: str, before_month_key: int) -> int:
+    """
+    Отметка выгруженных разделов до месяца before_month_key (YYYYMM) как архивных:
+    их строки удаляются из базы по сроку хранения, а файлы остаются
+
+    Returns:
+        Количество архивных разделов таблицы
+    """
+    with _lock:
+        manifest = _read_manifest(table)
+        archived = 0
+        for partition, info in manifest["partitions"].items():
+            if int(partition.replace("-", "")) < before_month_key:
+                info["archived"] = True
+            archived += bool(info.get("archived"))
+        _write_manifest(table, manifest)
+    return archived
+
+
+def list_partitions(table: str) -> Dict:
+    """Манифест выгрузки таблицы: разделы, их размер и время выгрузки"""
+    manifest = _read_manifest(table)
+    return {
+        "table": table,
+        "partitions": [
+            {"partition": name, **{k: v for k, v in info.items() if k != "signature"}}
+            for name, info in sorted(manifest["partitions"].items())
+        ],
+    }
+
+
+def partition_file(table: str, partition: str) -> Optional[str]:
+    """Путь к файлу раздела, если он выгружен"""
+    if table not in EXPORT_TABLES or partition not in _read_manifest(table)["partitions"]:
+        return None
+    path = _partition_path(table, partition)
+    return path if os.path.exists(path) else None
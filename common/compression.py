@@ -0,0 +1,266 @@
+import asyncio
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+from fastapi import Request, Response
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import settings
+from metrics import RESPONSE_COMPRESSION, RESPONSE_COMPRESSION_RATIO, RESPONSE_CACHE_REQUESTS
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета brotli ответы сжимаются только gzip
+    brotli = None
+
+# Сжимаемые типы содержимого; ленту изменений (text/event-stream) сжимать нельзя —
+# события копились бы в компрессоре, а Parquet уже сжат
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/csv", "text/html")
+
+# Часть тела, сжимаемая за один шаг при потоковом сжатии
+STREAM_CHUNK_SIZE = 65536
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Способ сжатия по заголовку Accept-Encoding: br, если клиент его
+    принимает и установлен brotli, иначе gzip; None — без сжатия
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class Compressor:
+    """Потоковый компрессор br / gzip"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31 — формат gzip (заголовок и контрольная сумма)
+            self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Сжатие тела целиком"""
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _record(encoding: str, cached: bool, size: int, compressed: int) -> None:
+    RESPONSE_COMPRESSION.labels(encoding=encoding, cached=str(cached).lower()).inc()
+    if compressed:
+        RESPONSE_COMPRESSION_RATIO.observe(size / compressed)
+
+
+class _CompressingSend:
+    """Обертка send одного ответа: решение о сжатии принимается по первой части тела"""
+
+    def __init__(self, encoding: str, send: Send):
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+        self.size = 0
+        self.compressed = 0
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Заголовки отправляются вместе с первой частью тела, когда известен ее размер
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start["headers"])
+            content_type = headers.get("content-type", "")
+            if (
+                "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+                or (not more_body and len(body) < settings.COMPRESSION_MIN_SIZE)
+            ):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            self.compressor = Compressor(self.encoding)
+            if not more_body and len(body) <= settings.COMPRESSION_STREAM_SIZE:
+                data = compress(body, self.encoding)
+                headers["Content-Length"] = str(len(data))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": data})
+                _record(self.encoding, False, len(body), len(data))
+                return
+            # Размер сжатого тела заранее неизвестен: ответ передается частями
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self.send(self.start)
+
+        # Сжатие больших тел идет частями в потоке пула, не занимая цикл событий
+        self.size += len(body)
+        for offset in range(0, len(body), STREAM_CHUNK_SIZE):
+            data = await asyncio.to_thread(self.compressor.compress, body[offset:offset + STREAM_CHUNK_SIZE])
+            if data:
+                self.compressed += len(data)
+                await self.send({"type": "http.response.body", "body": data, "more_body": True})
+        if not more_body:
+            data = self.compressor.finish()
+            self.compressed += len(data)
+            await self.send({"type": "http.response.body", "body": data})
+            _record(self.encoding, False, self.size, self.compressed)
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов br / gzip по Accept-Encoding. Ответы меньше
+    COMPRESSION_MIN_SIZE отдаются как есть; больше COMPRESSION_STREAM_SIZE —
+    сжимаются частями и передаются без Content-Length, по мере сжатия.
+    Ответы с Content-Encoding (готовые сжатые из кэша ответов) не трогаются.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(encoding, send))
+
+
+class CachedPayload:
+    """
+    Готовый JSON-ответ: тело сериализуется один раз, сжатые варианты
+    создаются при первом запросе с этим способом сжатия и хранятся рядом
+    """
+
+    def __init__(self, cache: "ResponseCache", body: bytes):
+        self.cache = cache
+        self.body = body
+        self.variants: Dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self.variants.values())
+
+    def response(self, request: Request) -> Response:
+        """Ответ в способе сжатия, который принимает клиент"""
+        headers = {"Vary": "Accept-Encoding"}
+        encoding = negotiate(request.headers.get("accept-encoding", ""))
+        if encoding is None or len(self.body) < settings.COMPRESSION_MIN_SIZE:
+            return Response(self.body, media_type="application/json", headers=headers)
+
+        data = self.variants.get(encoding)
+        if data is None:
+            data = compress(self.body, encoding)
+            self.cache.add_variant(self, encoding, data)
+            _record(encoding, False, len(self.body), len(data))
+        else:
+            _record(encoding, True, len(self.body), len(data))
+        headers["Content-Encoding"] = encoding
+        return Response(data, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """
+    Кэш готовых ответов по маршруту и параметрам с версией данных: запись
+    с устаревшей версией не используется. Объем вместе со сжатыми вариантами
+    ограничен max_bytes, вытесняются давно не использованные ответы.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Hashable, CachedPayload]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, route: str, key: Hashable, version: Hashable) -> Optional[CachedPayload]:
+        """
+        Готовый ответ для версии данных version. Версию нужно прочитать до
+        построения ответа: тогда ответ, построенный во время записи, не
+        переживет следующую версию.
+        """
+        with self._lock:
+            entry = self._entries.get((route, key))
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end((route, key))
+                RESPONSE_CACHE_REQUESTS.labels(route=route, result="hit").inc()
+                return entry[1]
+        RESPONSE_CACHE_REQUESTS.labels(route=route, result="miss").inc()
+        return None
+
+    def store(self, route: str, key: Hashable, version: Hashable, model: BaseModel) -> CachedPayload:
+        """Сериализация ответа так же, как FastAPI сериализует response_model, и сохранение"""
+        body = json.dumps(
+            model.model_dump(mode="json", by_alias=True),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+        payload = CachedPayload(self, body)
+        with self._lock:
+            old = self._entries.pop((route, key), None)
+            if old is not None:
+                self._size -= old[1].size
+            self._entries[(route, key)] = (version, payload)
+            self._size += payload.size
+            self._evict()
+        return payload
+
+    def add_variant(self, payload: CachedPayload, encoding: str, data: bytes) -> None:
+        with self._lock:
+            if encoding in payload.variants:
+                return
+            payload.variants[encoding] = data
+            if any(entry[1] is payload for entry in self._entries.values()):
+                self._size += len(data)
+                self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            _, (_, payload) = self._entries.popitem(last=False)
+            self._size -= payload.size
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_BYTES)
@@ -0,0 +1,222 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import requests
+from .rate_limit import RateLimiter
+from metrics import OUTBOUND_RETRIES, OUTBOUND_CIRCUIT_OPEN, OUTBOUND_CONCURRENCY_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Сбой связи, таймаут или ответ о перегрузке: сервис недоступен, а не отверг запрос"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    return (
+        isinstance(error, requests.exceptions.RequestException)
+        and error.response is not None
+        and error.response.status_code in RETRYABLE_STATUSES
+    )
+
+
+class CircuitOpenError(Exception):
+    """Запрос не выполнен: внешний сервис признан недоступным"""
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель: после failure_threshold ошибок подряд
+    перестает пропускать запросы на reset_timeout секунд, затем пропускает
+    один пробный запрос (half-open) и по его результату закрывается или
+    снова размыкается.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe_in_flight:
+                raise CircuitOpenError(f"{self.name}: сервис временно недоступен")
+            # half-open: пропускаем один пробный запрос
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+        OUTBOUND_CIRCUIT_OPEN.labels(policy=self.name).set(0)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    logger.warning("%s: circuit opened after %d failures", self.name, self._failures)
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+        if self._opened_at is not None:
+            OUTBOUND_CIRCUIT_OPEN.labels(policy=self.name).set(1)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Ограничение числа одновременных запросов по схеме AIMD:
+    при быстрых успешных ответах лимит растет на 1 за каждые limit ответов,
+    при росте латентности выше latency_target или перегрузке сервиса
+    лимит умножается на backoff_ratio.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        latency_target: float,
+        min_limit: int = 1,
+        backoff_ratio: float = 0.7
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.limit = float(max(min_limit, min(max_limit, 2)))
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        OUTBOUND_CONCURRENCY_LIMIT.labels(policy=name).set(self.limit)
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float, overloaded: bool) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if overloaded or latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+        OUTBOUND_CONCURRENCY_LIMIT.labels(policy=self.name).set(self.limit)
+
+
+class OutboundPolicy:
+    """
+    Политика исходящих HTTP-запросов: явные таймауты соединения и чтения,
+    повторы с экспоненциальной задержкой и случайным разбросом,
+    автоматический выключатель и адаптивное ограничение параллельности.
+    Запросы блокирующие и выполняются в вызывающем потоке. Политики с общим
+    limiter делят лимит параллельности, но отказывают независимо
+    (например, выписки разных счетов одного банка).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect_timeout: float,
+        read_timeout: float,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        circuit_failures: int,
+        circuit_reset: float,
+        max_concurrency: int,
+        latency_target: float,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None
+    ):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(name, circuit_failures, circuit_reset)
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(name, max_concurrency, latency_target)
+        # Общая сессия переиспользует TCP/TLS-соединения между запросами
+        self.session = requests.Session()
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        # Retry-After от сервиса важнее собственной оценки
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(delay, 0.0), self.backoff_max)
+                except (TypeError, ValueError):
+                    pass
+        # Full jitter: случайная задержка от 0 до base * 2^attempt
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        rate_limiter: Optional[RateLimiter] = None,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Выполнение запроса по политике.
+        Возвращает успешный ответ или выбрасывает исключение requests / CircuitOpenError.
+        rate_limiter ограничивает частоту каждой попытки, включая повторы.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            self.limiter.acquire()
+            started = time.perf_counter()
+            response = None
+            error: Optional[Exception] = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                error = e
+            finally:
+                retryable = error is not None and is_retryable(error)
+                self.limiter.release(time.perf_counter() - started, overloaded=retryable)
+
+            if error is None:
+                self.breaker.record_success()
+                return response
+            if not retryable:
+                # Ошибка клиента (4xx) не говорит о недоступности сервиса
+                self.breaker.record_success()
+                raise error
+
+            self.breaker.record_failure()
+            if attempt >= self.max_retries or self.breaker.is_open:
+                raise error
+            delay = self._backoff(attempt, response)
+            attempt += 1
+            OUTBOUND_RETRIES.labels(policy=self.name).inc()
+            logger.warning(
+                "%s: retry %d/%d in %.2fs after %s",
+                self.name, attempt, self.max_retries, delay, error
+            )
+            time.sleep(delay)
@@ -0,0 +1,127 @@
+import atexit
+import itertools
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from config import settings
+from metrics import LOG_RECORDS_DROPPED
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Обработчик, помещающий записи в ограниченную очередь без ожидания.
+    При переполнении очереди записи ниже WARNING отбрасываются, а не блокируют
+    вызывающий поток; WARNING и выше пишутся в файл напрямую (fallback).
+    Отброшенные записи считаются в метрике, а когда очередь освобождается
+    наполовину, в лог пишется одна строка с их количеством.
+    """
+
+    def __init__(self, log_queue: queue.Queue, fallback: logging.Handler):
+        super().__init__(log_queue)
+        self.fallback = fallback
+        self.dropped = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._unreported and self.queue.qsize() <= self.queue.maxsize // 2:
+            self.report_dropped()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self.fallback.handle(record)
+                return
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def report_dropped(self, direct: bool = False) -> None:
+        """Строка о записях, отброшенных с прошлого сообщения; direct — сразу в файл"""
+        with self._lock:
+            count, self._unreported = self._unreported, 0
+        if not count:
+            return
+        notice = self.prepare(logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            "Очередь лога была переполнена: отброшено записей %d", (count,), None
+        ))
+        if direct:
+            self.fallback.handle(notice)
+            return
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            self.fallback.handle(notice)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Пропускает только каждую N-ю DEBUG-запись для каждого шаблона сообщения.
+    Записи уровня INFO и выше проходят всегда.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(every, 1)
+        self._counters: Dict[str, itertools.count] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        # Шаблон (record.msg) общий для всех строк, поэтому выборка идет по нему
+        counter = self._counters.setdefault(str(record.msg), itertools.count())
+        return next(counter) % self.every == 0
+
+
+def setup_logging(filename: str) -> None:
+    """
+    Настройка неблокирующего логирования: записи попадают в очередь,
+    а в файл их пишет фоновый поток QueueListener
+
+    Args:
+        filename: Имя файла лога
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+
+    file_handler = logging.FileHandler(filename, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    queue_handler = DroppingQueueHandler(log_queue, file_handler)
+    queue_handler.addFilter(DebugSamplingFilter(settings.LOG_DEBUG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _queue_handler = queue_handler
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """
+    Остановка фонового потока с дозаписью оставшихся записей
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    if _queue_handler is not None:
+        _queue_handler.report_dropped(direct=True)
@@ -0,0 +1,238 @@
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from config import settings
+from .change_feed import feed
+from .columnar_export import export_snapshots, archive_partitions
+from db import RETENTION_TABLES, RETAINED_FROM_KEY, EXPORT_TABLES, get_connection, get_retained_from
+from .partitions import drop_year, describe_partitions
+from .query_profiler import connect
+from .write_queue import writer
+
+logger = logging.getLogger(__name__)
+
+# Значения PRAGMA auto_vacuum
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def retention_cutoff(days: int, today: Optional[date] = None) -> int:
+    """
+    Первый хранимый день (YYYYMMDD) при сроке хранения days: строки удаляются
+    целыми месяцами, поэтому итоги и архив в Parquet совпадают по границам
+    """
+    horizon = (today or date.today()) - timedelta(days=days)
+    return horizon.year * 10000 + horizon.month * 100 + 1
+
+
+def _ensure_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """
+    Перевод базы на auto_vacuum=INCREMENTAL. Для базы, созданной без него,
+    нужен один полный VACUUM: он переписывает файл, поэтому выполняется
+    писателем очереди при первом обслуживании, а не при старте сервиса
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    started = time.perf_counter()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info("База переведена на auto_vacuum=INCREMENTAL за %.2f с", time.perf_counter() - started)
+    return True
+
+
+def _apply_retention(conn: sqlite3.Connection, table: str, spec: Dict, days: int) -> Dict:
+    """
+    Удаление строк таблицы старше срока хранения: строки сворачиваются в итоги
+    по дням, при RETENTION_ARCHIVE сначала выгружаются в Parquet; файлы закрытых
+    лет, целиком вышедших за срок, удаляются после свертки
+    """
+    cutoff = retention_cutoff(days)
+    result = {"retained_from": cutoff, "rolled_up": 0, "deleted": 0, "dropped_years": [], "archived_partitions": None}
+
+    if settings.RETENTION_ARCHIVE and table in EXPORT_TABLES:
+        # Выгрузка до удаления; разделы истекших месяцев потом не перезаписываются и не удаляются
+        export_snapshots([table])
+        result["archived_partitions"] = archive_partitions(table, cutoff // 100)
+
+    rollup = spec.get("rollup")
+    if spec.get("partitioned"):
+        expired = conn.execute(
+            "SELECT year FROM main.partitions WHERE last_day_key < ? ORDER BY year", (cutoff,)
+        ).fetchall()
+        for (year,) in expired:
+            statements = [(rollup.format(source="archive"), (cutoff,))] if rollup else []
+            deleted, rolled_up = drop_year(conn, settings.DATABASE_PATH, year, statements)
+            result["deleted"] += deleted
+            result["rolled_up"] += rolled_up
+            result["dropped_years"].append(year)
+
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN")
+        if rollup:
+            cur.execute(rollup.format(source="main"), (cutoff,))
+            result["rolled_up"] += cur.rowcount
+        for sql in spec["delete"]:
+            cur.execute(sql, (cutoff,))
+            result["deleted"] += cur.rowcount
+        if rollup:
+            # Более ранние дни есть только в итогах: запись за них отклоняется
+            cur.execute("""
+                INSERT INTO meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+            """, (RETAINED_FROM_KEY.format(table), cutoff))
+            if result["deleted"]:
+                # Подробные строки заменены итогами: кэши аналитики сбрасываются
+                cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_generation'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.info(
+        "Срок хранения %s (%d дн.): свернуто в итоги %d, удалено строк %d, удалено лет %s",
+        table, days, result["rolled_up"], result["deleted"], result["dropped_years"]
+    )
+    return result
+
+
+def _incremental_vacuum(conn: sqlite3.Connection, max_pages: int) -> int:
+    """Возврат свободных страниц файлу; возвращает количество освобожденных страниц"""
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    pages = min(free, max_pages) if max_pages else free
+    if pages:
+        # Прагма освобождает по странице на шаг выполнения, а execute делает один шаг:
+        # executescript выполняет ее до конца
+        conn.executescript(f"PRAGMA incremental_vacuum({pages});")
+    return free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _optimize(conn: sqlite3.Connection) -> str:
+    """
+    Статистика планировщика: первый раз полный ANALYZE, затем PRAGMA optimize,
+    которая пересчитывает статистику только заметно изменившихся таблиц
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+        conn.execute("ANALYZE")
+        return "analyze"
+    conn.execute("PRAGMA optimize")
+    return "optimize"
+
+
+def run_maintenance(payloads: List) -> List[Dict]:
+    """
+    Обработчик очереди записи: обслуживание основной базы — сроки хранения
+    из RETENTION_DAYS, освобождение места (incremental_vacuum) и обновление
+    статистики планировщика. Запускается по расписанию и по запросу API;
+    несколько заданий одной пачки выполняются одним обслуживанием.
+    """
+    started = time.perf_counter()
+    report = {"retention": {}, "converted": False, "vacuumed_pages": 0, "freed_bytes": 0, "statistics": None}
+    conn = connect(settings.DATABASE_PATH, uri=True)
+    try:
+        report["converted"] = _ensure_incremental_vacuum(conn)
+
+        changed = False
+        for table, days in settings.RETENTION_DAYS.items():
+            spec = RETENTION_TABLES.get(table)
+            if spec is None:
+                logger.warning("Срок хранения задан для таблицы %s, которой нет в RETENTION_TABLES", table)
+                continue
+            if days <= 0:
+                continue
+            report["retention"][table] = _apply_retention(conn, table, spec, days)
+            changed = changed or bool(spec.get("rollup") and report["retention"][table]["deleted"])
+
+        conn.execute("""
+            INSERT INTO meta (key, value) VALUES ('maintained_at', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (int(time.time()),))
+        conn.commit()
+        if changed:
+            # Подписчики ленты перечитывают данные: строки за истекшие дни стали итогами
+            generation = conn.execute("SELECT value FROM meta WHERE key = 'data_generation'").fetchone()[0]
+            feed.publish(generation, [], [], [])
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        report["vacuumed_pages"] = _incremental_vacuum(conn, settings.MAINTENANCE_VACUUM_PAGES)
+        report["freed_bytes"] = report["vacuumed_pages"] * page_size
+        report["statistics"] = _optimize(conn)
+    finally:
+        conn.close()
+
+    report["duration_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(
+        "Обслуживание базы: освобождено %d байт, статистика %s, %.2f с",
+        report["freed_bytes"], report["statistics"], report["duration_seconds"]
+    )
+    return [report for _ in payloads]
+
+
+def _file_size(path: str) -> Optional[int]:
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+def size_report() -> Dict:
+    """
+    Размер файлов базы, свободные страницы, размер таблиц и индексов
+    (виртуальная таблица dbstat читает все страницы базы) и сроки хранения
+    """
+    conn = get_connection()
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        try:
+            objects = [
+                {"name": name, "type": kind, "bytes": size}
+                for name, kind, size in conn.execute("""
+                    SELECT s.name, COALESCE(m.type, 'table'), SUM(s.pgsize)
+                    FROM dbstat s
+                    LEFT JOIN sqlite_master m ON m.name = s.name
+                    GROUP BY s.name
+                    ORDER BY SUM(s.pgsize) DESC
+                """)
+            ]
+        except sqlite3.OperationalError:
+            # SQLite собран без dbstat
+            objects = []
+        row = conn.execute("SELECT value FROM meta WHERE key = 'maintained_at'").fetchone()
+        maintained_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(row[0])) if row else None
+        retention = {
+            table: {"days": days, "retained_from": get_retained_from(conn, table)}
+            for table, days in settings.RETENTION_DAYS.items() if table in RETENTION_TABLES
+        }
+        partitions = describe_partitions(conn, settings.DATABASE_PATH)
+    finally:
+        conn.close()
+
+    files = [
+        {"file": os.path.basename(path), "bytes": _file_size(path)}
+        for path in (
+            settings.DATABASE_PATH,
+            f"{settings.DATABASE_PATH}-wal",
+            writer.path,
+            f"{writer.path}-wal",
+        )
+        if _file_size(path) is not None
+    ]
+    files += [{"file": p["file"], "bytes": p["size_bytes"]} for p in partitions if p["size_bytes"] is not None]
+    return {
+        "total_bytes": sum(f["bytes"] for f in files),
+        "files": files,
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist_count,
+        "free_bytes": freelist_count * page_size,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+        "objects": objects,
+        "retention": retention,
+        "maintained_at": maintained_at,
+    }
+
+
+writer.register("maintenance", run_maintenance)
+writer.schedule("maintenance", settings.MAINTENANCE_INTERVAL_HOURS * 3600)
@@ -0,0 +1,256 @@
+import logging
+import os
+import re
+import sqlite3
+import stat
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Определения таблицы и индексов переносятся в файл года под схемой archive
+_CREATE = re.compile(r'^(CREATE\s+(?:UNIQUE\s+)?(?:TABLE|INDEX)\s+(?:IF\s+NOT\s+EXISTS\s+)?)', re.IGNORECASE)
+
+# Реестр закрытых лет; создается миграцией схемы каждого сервиса
+REGISTRY_SQL = """
+    CREATE TABLE partitions (
+        year INTEGER PRIMARY KEY,
+        file TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        first_day_key INTEGER NOT NULL,
+        last_day_key INTEGER NOT NULL,
+        closed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def partition_file(database_path: str, year: int) -> str:
+    """Файл закрытого года рядом с основной базой"""
+    return f"{database_path}.{year}"
+
+
+def _resolve(database_path: str, file: str) -> str:
+    # В реестре хранится имя файла: база может быть смонтирована по другому пути
+    return os.path.join(os.path.dirname(os.path.abspath(database_path)), file)
+
+
+def closed_years(conn: sqlite3.Connection) -> Set[int]:
+    """Годы, вынесенные в отдельные файлы"""
+    return {row[0] for row in conn.execute("SELECT year FROM main.partitions")}
+
+
+def closable_years(conn: sqlite3.Connection, table: str, grace_days: int, today: Optional[date] = None) -> List[int]:
+    """
+    Годы основной таблицы, которые можно закрыть: год закрывается через
+    grace_days после своего окончания, когда поправки задним числом уже внесены
+    """
+    today = today or date.today()
+    last_closed = today.year - 1 if today - timedelta(days=grace_days) >= date(today.year, 1, 1) else today.year - 2
+    row = conn.execute(f"SELECT MIN(day_key) FROM main.{table}").fetchone()
+    if row[0] is None:
+        return []
+    return [
+        year for year in range(row[0] // 10000, last_closed + 1)
+        if conn.execute(
+            f"SELECT 1 FROM main.{table} WHERE day_key BETWEEN ? AND ? LIMIT 1",
+            (year * 10000 + 101, year * 10000 + 1231)
+        ).fetchone()
+    ]
+
+
+def attach_partitions(
+    conn: sqlite3.Connection,
+    database_path: str,
+    table: str,
+    first_day_key: Optional[int] = None,
+    last_day_key: Optional[int] = None
+) -> int:
+    """
+    Подключение закрытых лет, пересекающихся с периодом: временное
+    представление с именем таблицы перекрывает основную таблицу для
+    запросов без имени схемы и объединяет ее с файлами этих лет.
+    Годы вне периода не подключаются вовсе. Соединение должно быть
+    открыто с uri=True: файлы лет подключаются неизменяемыми.
+
+    Returns:
+        Количество подключенных лет
+    """
+    rows = conn.execute("""
+        SELECT year, file FROM main.partitions
+        WHERE last_day_key >= ? AND first_day_key <= ?
+        ORDER BY year
+    """, (first_day_key or 0, last_day_key or 99999999)).fetchall()
+    if not rows:
+        return 0
+
+    columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+    for year, file in rows:
+        schema = f"p{year}"
+        path = _resolve(database_path, file)
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{path}?mode=ro&immutable=1",))
+        # Столбцы, добавленные после закрытия года, в файле года пустые
+        present = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+        selects.append(
+            f"SELECT {', '.join(c if c in present else f'NULL AS {c}' for c in columns)} FROM {schema}.{table}"
+        )
+    conn.execute(f"CREATE TEMP VIEW {table} AS {' UNION ALL '.join(selects)}")
+    return len(rows)
+
+
+def _make_writable(path: str, writable: bool) -> None:
+    mode = os.stat(path).st_mode
+    if writable:
+        os.chmod(path, mode | stat.S_IWUSR)
+    else:
+        os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _optimize(path: str) -> None:
+    """Однократная оптимизация закрытого года: статистика, сжатие, только чтение"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    _make_writable(path, False)
+
+
+def close_year(conn: sqlite3.Connection, database_path: str, table: str, year: int) -> Dict:
+    """
+    Перенос строк года из основной таблицы в отдельный файл одной
+    транзакцией, затем оптимизация файла и перевод его в режим только чтения.
+    Триггеры основной таблицы срабатывают на удаление как обычно.
+    """
+    first_day_key, last_day_key = year * 10000 + 101, year * 10000 + 1231
+    path = partition_file(database_path, year)
+    if os.path.exists(path):
+        raise RuntimeError(f"Файл года {year} уже существует: {path}")
+
+    definitions = conn.execute("""
+        SELECT sql FROM main.sqlite_master
+        WHERE tbl_name = ? AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type DESC
+    """, (table,)).fetchall()
+
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        for (sql,) in definitions:
+            cur.execute(_CREATE.sub(r"\1archive.", sql, count=1))
+        cur.execute(f"""
+            INSERT INTO archive.{table} SELECT * FROM main.{table}
+            WHERE day_key BETWEEN ? AND ?
+        """, (first_day_key, last_day_key))
+        moved = cur.rowcount
+        cur.execute(f"DELETE FROM main.{table} WHERE day_key BETWEEN ? AND ?", (first_day_key, last_day_key))
+        if cur.rowcount != moved:
+            raise RuntimeError(f"Перенесено {moved} строк года {year}, удалено {cur.rowcount}")
+        cur.execute(
+            "INSERT INTO main.partitions (year, file, rows, first_day_key, last_day_key) VALUES (?, ?, ?, ?, ?)",
+            (year, os.path.basename(path), moved, first_day_key, last_day_key)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.execute("DETACH DATABASE archive")
+        os.remove(path)
+        raise
+    conn.execute("DETACH DATABASE archive")
+
+    _optimize(path)
+    logger.info("Год %d закрыт: %d строк %s перенесено в %s", year, moved, table, path)
+    return {"year": year, "rows": moved}
+
+
+def reopen_year(conn: sqlite3.Connection, database_path: str, table: str, year: int) -> Dict:
+    """
+    Возврат строк закрытого года в основную таблицу (для исправлений
+    задним числом); файл года удаляется
+    """
+    row = conn.execute("SELECT file FROM main.partitions WHERE year = ?", (year,)).fetchone()
+    if row is None:
+        raise ValueError(f"Год {year} не закрыт")
+    path = _resolve(database_path, row[0])
+    _make_writable(path, True)
+
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        # Столбцы, добавленные после закрытия года, остаются пустыми
+        columns = ", ".join(row[1] for row in cur.execute(f"PRAGMA archive.table_info({table})").fetchall())
+        cur.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM archive.{table}")
+        moved = cur.rowcount
+        cur.execute("DELETE FROM main.partitions WHERE year = ?", (year,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.execute("DETACH DATABASE archive")
+        _make_writable(path, False)
+        raise
+    conn.execute("DETACH DATABASE archive")
+    os.remove(path)
+    logger.info("Год %d открыт: %d строк %s возвращено в основную базу", year, moved, table)
+    return {"year": year, "rows": moved}
+
+
+def drop_year(
+    conn: sqlite3.Connection,
+    database_path: str,
+    year: int,
+    statements: List[Tuple[str, tuple]]
+) -> Tuple[int, int]:
+    """
+    Удаление закрытого года, срок хранения которого истек: statements (свертка
+    строк в итоги) выполняются над файлом года, подключенным как archive, в одной
+    транзакции с удалением года из реестра; затем файл удаляется. Соединение
+    должно быть открыто с uri=True.
+
+    Returns:
+        Количество строк удаленного года и строк, измененных statements
+    """
+    row = conn.execute("SELECT file, rows FROM main.partitions WHERE year = ?", (year,)).fetchone()
+    if row is None:
+        raise ValueError(f"Год {year} не закрыт")
+    path = _resolve(database_path, row[0])
+
+    conn.execute("ATTACH DATABASE ? AS archive", (f"file:{path}?mode=ro&immutable=1",))
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        changed = 0
+        for sql, params in statements:
+            cur.execute(sql, params)
+            changed += cur.rowcount
+        cur.execute("DELETE FROM main.partitions WHERE year = ?", (year,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    _make_writable(path, True)
+    os.remove(path)
+    logger.info("Год %d удален по сроку хранения: %d строк, файл %s", year, row[1], path)
+    return row[1], changed
+
+
+def describe_partitions(conn: sqlite3.Connection, database_path: str) -> List[Dict]:
+    """Закрытые годы с размером файлов"""
+    result = []
+    for year, file, rows, closed_at in conn.execute(
+        "SELECT year, file, rows, closed_at FROM main.partitions ORDER BY year"
+    ):
+        path = _resolve(database_path, file)
+        result.append({
+            "year": year,
+            "file": file,
+            "rows": rows,
+            "size_bytes": os.path.getsize(path) if os.path.exists(path) else None,
+            "closed_at": closed_at,
+        })
+    return result
@@ -0,0 +1,237 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# Строковые и числовые литералы в тексте запроса, подставленные SQLite вместо параметров
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# Агрегированная статистика по запросам: текст запроса -> показатели
+_stats: Dict[str, Dict] = {}
+_stats_lock = threading.Lock()
+
+# Признак того, что запрос выполняется через профилируемый курсор/commit
+# и не должен повторно учитываться в trace callback
+_local = threading.local()
+
+
+def _normalize(sql: str) -> str:
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def _entry(statement: str) -> Dict:
+    entry = _stats.get(statement)
+    if entry is None:
+        entry = _stats[statement] = {
+            "calls": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "rows": 0,
+        }
+    return entry
+
+
+def _record_call(statement: str, elapsed: float, rows: int = 0) -> None:
+    elapsed_ms = elapsed * 1000
+    with _stats_lock:
+        entry = _entry(statement)
+        entry["calls"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["rows"] += rows
+
+
+def _record_fetch(statement: str, elapsed: float, execution_ms: float, rows: int) -> None:
+    # Время выборки строк относится к тому же выполнению запроса
+    with _stats_lock:
+        entry = _entry(statement)
+        entry["total_ms"] += elapsed * 1000
+        entry["max_ms"] = max(entry["max_ms"], execution_ms)
+        entry["rows"] += rows
+
+
+def _trace(sql: str) -> None:
+    """
+    Учет запросов, выполненных в обход курсора (BEGIN, executescript и т.п.).
+    SQLite передает текст с подставленными значениями параметров: литералы
+    заменяются на ?, чтобы статистика не росла на каждое значение и не
+    раскрывала данные
+    """
+    if getattr(_local, "active", False):
+        return
+    _record_call(_LITERALS.sub("?", _normalize(sql)), 0.0)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время выполнения и количество строк"""
+
+    _statement: Optional[str] = None
+    _parameters = ()
+    _elapsed = 0.0
+    _reported = False
+
+    def execute(self, sql, parameters=()):
+        self._statement = _normalize(sql)
+        self._parameters = parameters
+        self._reported = False
+        _local.active = True
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            _local.active = False
+            # Для SELECT rowcount = -1, строки учитываются при выборке
+            _record_call(self._statement, self._elapsed, max(self.rowcount, 0))
+        self._check_slow()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._statement = _normalize(sql)
+        self._parameters = None
+        self._reported = False
+        _local.active = True
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            _local.active = False
+            _record_call(self._statement, self._elapsed, max(self.rowcount, 0))
+        self._check_slow()
+        return self
+
+    def _fetched(self, started: float, rows: int) -> None:
+        if self._statement is None:
+            return
+        elapsed = time.perf_counter() - started
+        self._elapsed += elapsed
+        _record_fetch(self._statement, elapsed, self._elapsed * 1000, rows)
+        self._check_slow()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+    def _check_slow(self) -> None:
+        elapsed_ms = self._elapsed * 1000
+        if self._reported or elapsed_ms < settings.SLOW_QUERY_MS:
+            return
+        self._reported = True
+        logger.warning(
+            "Медленный запрос (%.1f мс): %s\nПлан запроса:\n%s",
+            elapsed_ms, self._statement, self._explain()
+        )
+
+    def _explain(self) -> str:
+        if self._parameters is None:
+            return "  (недоступен для executemany)"
+        _local.active = True
+        try:
+            # Базовый курсор, чтобы сам EXPLAIN не попадал в статистику
+            plan = sqlite3.Cursor(self.connection).execute(
+                f"EXPLAIN QUERY PLAN {self._statement}", self._parameters
+            ).fetchall()
+        except sqlite3.Error as e:
+            return f"  (не удалось получить план: {e})"
+        finally:
+            _local.active = False
+        return "\n".join(f"  {row[3]}" for row in plan) or "  (пусто)"
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Соединение, выдающее профилируемые курсоры и замеряющее COMMIT"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # Базовые execute/executemany соединения выполняют запрос не через cursor():
+    # без переопределения они не замерялись бы
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        _local.active = True
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            _local.active = False
+            _record_call("COMMIT", time.perf_counter() - started)
+
+
+def connect(database: str, **kwargs) -> sqlite3.Connection:
+    """
+    Открытие соединения SQLite с профилированием запросов
+
+    Args:
+        database: Путь к файлу базы данных
+        **kwargs: Дополнительные параметры sqlite3.connect
+    """
+    if not settings.QUERY_PROFILING:
+        return sqlite3.connect(database, **kwargs)
+    conn = sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+    conn.set_trace_callback(_trace)
+    return conn
+
+
+def get_query_stats(limit: Optional[int] = None) -> List[Dict]:
+    """
+    Статистика по запросам, отсортированная по суммарному времени
+
+    Args:
+        limit: Максимальное количество запросов в ответе
+    """
+    with _stats_lock:
+        items = [
+            {
+                "statement": statement,
+                "calls": entry["calls"],
+                "total_ms": round(entry["total_ms"], 3),
+                "avg_ms": round(entry["total_ms"] / entry["calls"], 3) if entry["calls"] else 0.0,
+                "max_ms": round(entry["max_ms"], 3),
+                "rows": entry["rows"],
+            }
+            for statement, entry in _stats.items()
+        ]
+    items.sort(key=lambda item: item["total_ms"], reverse=True)
+    return items[:limit] if limit else items
+
+
+def reset_query_stats() -> None:
+    """Сброс накопленной статистики"""
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Глобальное ограничение частоты запросов (запросов в секунду).
+
+    Каждый вызов acquire() резервирует ближайший свободный слот и ждет его
+    наступления, поэтому ограничение соблюдается для всех задач и потоков
+    процесса, независимо от того, в каком цикле событий они выполняются.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Резервирование слота, возвращает время ожидания в секундах"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + 1.0 / self.rate
+        return slot - now
+
+    async def acquire(self) -> None:
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait(self) -> None:
+        """Ожидание слота в вызывающем потоке (для блокирующих клиентов)"""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Прогрев после старта: тяжелые модули и кэши загружаются в фоновом
+    потоке, пока сервис уже отвечает на /health. Готовность (/ready)
+    наступает после всех шагов; ошибка шага не задерживает готовность —
+    данные этого шага загрузятся при первом запросе, как без прогрева.
+    """
+
+    def __init__(self):
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._steps: List[Dict] = []
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def start(self, steps: List[Tuple[str, Callable[[], Any]]], enabled: bool = True) -> None:
+        """
+        Запуск шагов прогрева по порядку в фоновом потоке
+
+        Args:
+            steps: Пары (название, функция без аргументов)
+            enabled: False — сервис готов сразу, без прогрева
+        """
+        self.started_at = time.time()
+        self._steps = [{"name": name, "status": "pending", "duration_seconds": None, "error": None} for name, _ in steps]
+        if not enabled or not steps:
+            self.finished_at = self.started_at
+            self._done.set()
+            return
+        threading.Thread(
+            target=self._run, args=([step for _, step in steps],), name="warmup", daemon=True
+        ).start()
+
+    def _run(self, functions: List[Callable[[], Any]]) -> None:
+        for state, function in zip(self._steps, functions):
+            state["status"] = "running"
+            started = time.perf_counter()
+            try:
+                function()
+                state["status"] = "done"
+            except Exception as e:
+                state["status"] = "failed"
+                state["error"] = str(e)
+                logger.warning("Прогрев: шаг %s не выполнен: %s", state["name"], e)
+            state["duration_seconds"] = round(time.perf_counter() - started, 3)
+        self.finished_at = time.time()
+        self._done.set()
+        logger.info("Прогрев завершен за %.2f с", self.finished_at - self.started_at)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание окончания прогрева; True — сервис готов"""
+        return self._done.wait(timeout)
+
+    def status(self) -> Dict:
+        """Готовность и ход прогрева по шагам"""
+        finished_at = self.finished_at if self.ready else None
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "uptime_seconds": round(time.time() - self.started_at, 3) if self.started_at else 0.0,
+            "warmup_seconds": round(finished_at - self.started_at, 3) if finished_at else None,
+            "steps": [dict(step) for step in self._steps],
+        }
+
+
+warmup = WarmUp()
@@ -0,0 +1,397 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from config import settings
+from metrics import WRITE_QUEUE_DEPTH, WRITE_QUEUE_LAG, WRITE_BATCH_ROWS, WRITE_JOBS
+
+try:
+    import fcntl
+except ImportError:
+    # Без блокировок файлов (Windows) сервис работает одним процессом, он и пишет
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Обработчик вида заданий: нагрузки заданий пачки -> результаты в том же порядке;
+# все задания пачки записываются в основную базу одной транзакцией
+Handler = Callable[[List[Any]], List[Any]]
+
+# Окно, за которое считается средняя задержка записи, с
+LAG_WINDOW_SECONDS = 300
+
+# Проверка сроков периодических заданий, с
+SCHEDULE_CHECK_SECONDS = 60
+
+# Столбцы, добавленные в write_jobs после первой версии очереди
+_ADDED_COLUMNS = {"attempts": "INTEGER NOT NULL DEFAULT 0"}
+
+
+class WriteJobError(Exception):
+    """Писатель не смог выполнить задание"""
+
+
+class WriteTimeoutError(Exception):
+    """Задание не выполнено писателем за отведенное время"""
+
+
+class WriteQueue:
+    """
+    Очередь записи для работы сервиса в несколько процессов. Процессы API
+    только читают основную базу, а изменения ставят заданиями в отдельную
+    базу-очередь. Единственный писатель — процесс, захвативший блокировку
+    файла очереди, — применяет задания пачками: подряд идущие задания одного
+    вида объединяются до batch_rows строк и фиксируются одной транзакцией.
+    Задание отмечается выполненным после фиксации в основной базе, поэтому
+    обработчики должны быть идемпотентны: после сбоя пачка применяется повторно.
+    Пачка, которую база не принимает (sqlite3.OperationalError), повторяется
+    с растущей задержкой до retry_max секунд; задание, не выполненное за
+    max_attempts попыток, отмечается ошибкой, и очередь идет дальше.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        batch_rows: int,
+        flush_ms: int,
+        result_ttl: float,
+        max_attempts: int,
+        retry_max: float
+    ):
+        self._path = path
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_ms / 1000
+        self.result_ttl = result_ttl
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_max = retry_max
+        self._retry_delay = 0.0
+        self._handlers: Dict[str, Handler] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock_file = None
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._last_schedule_check = 0.0
+        self._schedules: Dict[str, float] = {}
+
+    @property
+    def path(self) -> str:
+        # По умолчанию очередь лежит рядом с основной базой
+        return self._path or f"{settings.DATABASE_PATH}.queue"
+
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_file is not None
+
+    def register(self, kind: str, handler: Handler) -> None:
+        """Обработчик заданий вида kind"""
+        self._handlers[kind] = handler
+
+    def schedule(self, kind: str, interval: float) -> None:
+        """
+        Периодическое задание вида kind без данных: писатель ставит его,
+        когда с постановки предыдущего прошло interval секунд (0 — не ставить)
+        """
+        if interval > 0:
+            self._schedules[kind] = interval
+        else:
+            self._schedules.pop(kind, None)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # Принятое задание не теряется при сбое питания
+        conn.execute("PRAGMA synchronous = FULL")
+        if not self._schema_ready:
+            with self._schema_lock:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS write_jobs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        kind TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        rows INTEGER NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        result TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        enqueued_at REAL NOT NULL,
+                        finished_at REAL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_write_jobs_status ON write_jobs(status, id)")
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(write_jobs)")}
+                for column, definition in _ADDED_COLUMNS.items():
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE write_jobs ADD COLUMN {column} {definition}")
+                self._schema_ready = True
+        return conn
+
+    def submit(self, kind: str, payload: Any, rows: int = 1, max_pending_rows: Optional[int] = None) -> Optional[int]:
+        """
+        Постановка задания в очередь
+
+        Args:
+            kind: Вид задания (зарегистрированный обработчик)
+            payload: Данные задания, сериализуемые в JSON
+            rows: Количество строк задания для объединения в пачки
+            max_pending_rows: Предел строк в очереди; при превышении задание не ставится
+
+        Returns:
+            ID задания или None, если очередь заполнена
+        """
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if max_pending_rows is not None:
+                pending = conn.execute("SELECT TOTAL(rows) FROM write_jobs WHERE status = 'pending'").fetchone()[0]
+                if pending + rows > max_pending_rows:
+                    conn.execute("ROLLBACK")
+                    return None
+            cur = conn.execute(
+                "INSERT INTO write_jobs (kind, payload, rows, enqueued_at) VALUES (?, ?, ?, ?)",
+                (kind, data, rows, time.time())
+            )
+            conn.execute("COMMIT")
+            return cur.lastrowid
+        finally:
+            conn.close()
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> Any:
+        """
+        Ожидание выполнения задания писателем (он может работать в другом процессе)
+
+        Raises:
+            WriteJobError: Задание завершилось ошибкой
+            WriteTimeoutError: Задание не выполнено за timeout секунд
+        """
+        deadline = time.monotonic() + (settings.WRITE_WAIT_TIMEOUT if timeout is None else timeout)
+        delay = 0.01
+        conn = self._connect()
+        try:
+            while True:
+                row = conn.execute("SELECT status, result FROM write_jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    raise WriteJobError(f"Задание {job_id} не найдено")
+                status, result = row
+                if status == "done":
+                    return json.loads(result)
+                if status == "failed":
+                    raise WriteJobError(json.loads(result))
+                if time.monotonic() >= deadline:
+                    raise WriteTimeoutError(f"Задание {job_id} еще не записано, оно остается в очереди")
+                time.sleep(delay)
+                delay = min(delay * 2, self.flush_interval or 0.2)
+        finally:
+            conn.close()
+
+    def call(self, kind: str, payload: Any, rows: int = 1, timeout: Optional[float] = None) -> Any:
+        """Постановка задания и ожидание его результата"""
+        return self.wait(self.submit(kind, payload, rows), timeout)
+
+    def status(self) -> Dict:
+        """
+        Состояние очереди: задания в ожидании, возраст самого старого из них
+        (задержка записи) и средняя задержка выполненных заданий за 5 минут
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            pending_jobs, pending_rows, oldest = conn.execute("""
+                SELECT COUNT(*), TOTAL(rows), MIN(enqueued_at)
+                FROM write_jobs WHERE status = 'pending'
+            """).fetchone()
+            last_finished, average_lag, failed = conn.execute("""
+                SELECT MAX(finished_at), AVG(finished_at - enqueued_at), TOTAL(status = 'failed')
+                FROM write_jobs
+                WHERE status != 'pending' AND finished_at >= ?
+            """, (now - LAG_WINDOW_SECONDS,)).fetchone()
+        finally:
+            conn.close()
+        return {
+            "writer": self.is_writer,
+            "pid": os.getpid(),
+            "pending_jobs": pending_jobs,
+            "pending_rows": int(pending_rows),
+            "lag_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "average_lag_seconds": round(average_lag, 3) if average_lag is not None else None,
+            "failed_jobs": int(failed or 0),
+            "last_applied_seconds_ago": round(now - last_finished, 3) if last_finished else None,
+        }
+
+    def start(self) -> None:
+        """Запуск потока, который становится писателем, как только освободится блокировка"""
+        if not settings.WRITER_ENABLED or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка писателя; невыполненные задания остаются в очереди"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._lock_file = lock_file
+        logger.info("Процесс %d — писатель очереди %s", os.getpid(), self.path)
+        return True
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            if not self._acquire():
+                # Писатель — другой процесс; блокировка перехватывается после его остановки
+                self._stopping.wait(1.0)
+                continue
+            try:
+                rows = self._apply_next()
+                self._retry_delay = 0.0
+            except sqlite3.OperationalError as e:
+                # База занята или недоступна: задания остаются в очереди до следующей попытки
+                delay = self._next_retry_delay()
+                logger.warning("Очередь записи: %s, повтор через %.1f с", e, delay)
+                rows = 0
+                self._stopping.wait(delay)
+            except Exception as e:
+                logger.error("Ошибка писателя очереди: %s", e)
+                rows = 0
+                self._stopping.wait(self._next_retry_delay())
+            # Неполная пачка — ждем накопления заданий для следующей групповой записи
+            if rows < self.batch_rows:
+                self._stopping.wait(self.flush_interval)
+
+    def _next_retry_delay(self) -> float:
+        """Задержка перед повтором после сбоя: удваивается с 1 с до retry_max"""
+        self._retry_delay = min(max(self._retry_delay * 2, 1.0), self.retry_max)
+        return self._retry_delay
+
+    def _apply_next(self) -> int:
+        """Выполнение следующей пачки заданий; возвращает количество строк в ней"""
+        conn = self._connect()
+        try:
+            now = time.time()
+            if now - self._last_schedule_check >= SCHEDULE_CHECK_SECONDS:
+                # Сроки проверяются и при непрерывном потоке заданий: периодическое
+                # задание встает в конец очереди
+                self._last_schedule_check = now
+                self._enqueue_scheduled(conn, now)
+            jobs = conn.execute("""
+                SELECT id, kind, payload, rows, enqueued_at FROM write_jobs
+                WHERE status = 'pending' ORDER BY id LIMIT ?
+            """, (self.batch_rows,)).fetchall()
+            if not jobs:
+                WRITE_QUEUE_DEPTH.set(0)
+                WRITE_QUEUE_LAG.set(0)
+                if now - self._last_cleanup > 60:
+                    self._last_cleanup = now
+                    # Последнее задание каждого вида хранится: по нему считаются периодические задания
+                    conn.execute("""
+                        DELETE FROM write_jobs
+                        WHERE status != 'pending' AND finished_at < ?
+                            AND id NOT IN (SELECT MAX(id) FROM write_jobs GROUP BY kind)
+                    """, (now - self.result_ttl,))
+                return 0
+            WRITE_QUEUE_LAG.set(now - jobs[0][4])
+            WRITE_QUEUE_DEPTH.set(conn.execute(
+                "SELECT TOTAL(rows) FROM write_jobs WHERE status = 'pending'"
+            ).fetchone()[0])
+
+            batch = jobs[:1]
+            rows = jobs[0][3]
+            for job in jobs[1:]:
+                if job[1] != batch[0][1] or rows + job[3] > self.batch_rows:
+                    break
+                batch.append(job)
+                rows += job[3]
+            self._apply(conn, batch)
+            return rows
+        finally:
+            conn.close()
+
+    def _enqueue_scheduled(self, conn: sqlite3.Connection, now: float) -> None:
+        """Постановка периодических заданий, срок которых подошел"""
+        for kind, interval in self._schedules.items():
+            last = conn.execute("SELECT MAX(enqueued_at) FROM write_jobs WHERE kind = ?", (kind,)).fetchone()[0]
+            if last is None or now - last >= interval:
+                job_id = self.submit(kind, None)
+                logger.info("Поставлено периодическое задание %s: %d", kind, job_id)
+
+    def _count_attempt(self, conn: sqlite3.Connection, batch: List) -> int:
+        """Учет неудачной попытки заданий пачки; возвращает наибольшее число попыток"""
+        ids = [job[0] for job in batch]
+        placeholders = ", ".join("?" * len(ids))
+        conn.execute(f"UPDATE write_jobs SET attempts = attempts + 1 WHERE id IN ({placeholders})", ids)
+        return conn.execute(f"SELECT MAX(attempts) FROM write_jobs WHERE id IN ({placeholders})", ids).fetchone()[0]
+
+    def _apply(self, conn: sqlite3.Connection, batch: List) -> None:
+        kind = batch[0][1]
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise WriteJobError(f"Нет обработчика заданий вида {kind}")
+            results = handler([json.loads(job[2]) for job in batch])
+            outcome = [("done", result) for result in results]
+        except sqlite3.OperationalError as e:
+            # Пачка повторяется писателем с задержкой, пока не исчерпаны попытки
+            if self._count_attempt(conn, batch) < self.max_attempts:
+                raise
+            if len(batch) > 1:
+                # Попытки исчерпаны: задания применяются по одному, ошибкой
+                # отмечается только то, которое база не принимает
+                for job in batch:
+                    self._apply(conn, [job])
+                return
+            logger.error(
+                "Задание %d (%s) не выполнено за %d попыток: %s",
+                batch[0][0], kind, self.max_attempts, e
+            )
+            outcome = [("failed", str(e))]
+        except Exception as e:
+            if len(batch) > 1:
+                # Ошибка одного задания не должна отменять остальные: пачка применяется по одному
+                for job in batch:
+                    self._apply(conn, [job])
+                return
+            logger.error("Задание %d (%s) не выполнено: %s", batch[0][0], kind, e)
+            outcome = [("failed", str(e))]
+
+        finished = time.time()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "UPDATE write_jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+            [
+                (status, json.dumps(result, ensure_ascii=False), finished, job[0])
+                for (status, result), job in zip(outcome, batch)
+            ]
+        )
+        conn.execute("COMMIT")
+        WRITE_BATCH_ROWS.observe(sum(job[3] for job in batch))
+        for status, _ in outcome:
+            WRITE_JOBS.labels(kind=kind, result=status).inc()
+
+
+writer = WriteQueue(
+    settings.WRITE_QUEUE_PATH,
+    settings.WRITE_BATCH_ROWS,
+    settings.WRITE_FLUSH_MS,
+    settings.WRITE_RESULT_TTL,
+    settings.WRITE_MAX_ATTEMPTS,
+    settings.WRITE_RETRY_MAX_SECONDS
+)